@@ -1,17 +1,30 @@
 package com.healthcare.appointment.client
 
+import com.healthcare.appointment.v1.AppointmentStatus
 import com.healthcare.appointment.v1.AppointmentType
+import com.healthcare.ml.v1.AppointmentStatusEvent
 import com.healthcare.ml.v1.MLServiceGrpc
 import com.healthcare.ml.v1.NoShowPrediction
 import com.healthcare.ml.v1.PredictNoShowRequest
+import com.healthcare.ml.v1.RecordAppointmentEventsRequest
+import com.healthcare.ml.v1.RecordAppointmentEventsResponse
 import io.grpc.ManagedChannelBuilder
+import io.grpc.Status
+import io.grpc.stub.StreamObserver
+import jakarta.annotation.PreDestroy
+import java.util.concurrent.Executors
+import java.util.concurrent.TimeUnit
+import org.slf4j.LoggerFactory
 import org.springframework.beans.factory.annotation.Value
 import org.springframework.stereotype.Service
 
 @Service
 class MLService(
         @Value("\${ml.service.url}") private val mlServiceUrl: String,
-        @Value("\${ml.service.port}") private val mlServicePort: Int
+        @Value("\${ml.service.port}") private val mlServicePort: Int,
+        @Value("\${ml.service.deadline-ms:500}") private val predictionDeadlineMs: Long,
+        @Value("\${ml.service.event-attempts:6}") private val eventAttempts: Int,
+        @Value("\${ml.service.event-retry-ms:500}") private val eventRetryMs: Long
 ) {
 
     private val channel =
@@ -19,6 +32,16 @@ class MLService(
 
     private val stub = MLServiceGrpc.newBlockingStub(channel)
 
+    private val asyncStub = MLServiceGrpc.newStub(channel)
+
+    private val logger = LoggerFactory.getLogger(MLService::class.java)
+
+    // resends status events the ML service failed to apply
+    private val retryScheduler =
+            Executors.newSingleThreadScheduledExecutor { runnable ->
+                Thread(runnable, "ml-event-retry").apply { isDaemon = true }
+            }
+
     fun predictNoShow(
             patientId: String,
             providerId: String,
@@ -35,8 +58,92 @@ class MLService(
                         .setProviderId(providerId)
                         .setType(appointmentType)
                         .putAllAdditionalData(features)
+                        // risk_factors are forwarded to the appointment's callers
+                        .setExplain(true)
+                        .build()
+
+        // the prediction service drops calls whose deadline has passed
+        // instead of scoring them for a caller that has given up
+        return stub.withDeadlineAfter(predictionDeadlineMs, TimeUnit.MILLISECONDS)
+                .predictNoShow(request)
+    }
+
+    /**
+     * Sends a status change to the ML feature store without waiting for it, so a slow or
+     * unavailable ML service never fails the status update itself. Failed sends are retried with
+     * exponential backoff; the store ignores a status it has already applied, so resending is
+     * safe.
+     */
+    fun recordAppointmentStatus(
+            patientId: String,
+            appointmentId: String,
+            status: AppointmentStatus,
+            startTime: String
+    ) {
+        val request =
+                RecordAppointmentEventsRequest.newBuilder()
+                        .addEvents(
+                                AppointmentStatusEvent.newBuilder()
+                                        .setPatientId(patientId)
+                                        .setAppointmentId(appointmentId)
+                                        .setStatus(status)
+                                        .setStartTime(startTime)
+                        )
                         .build()
 
-        return stub.predictNoShow(request)
+        sendAppointmentEvents(request, appointmentId, 1)
+    }
+
+    private fun sendAppointmentEvents(
+            request: RecordAppointmentEventsRequest,
+            appointmentId: String,
+            attempt: Int
+    ) {
+        asyncStub
+                .withDeadlineAfter(EVENT_DEADLINE_MS, TimeUnit.MILLISECONDS)
+                .recordAppointmentEvents(
+                        request,
+                        object : StreamObserver<RecordAppointmentEventsResponse> {
+                            override fun onNext(response: RecordAppointmentEventsResponse) {}
+
+                            override fun onError(t: Throwable) {
+                                val code = Status.fromThrowable(t).code
+                                if (code in NOT_RETRYABLE || attempt >= eventAttempts) {
+                                    logger.error(
+                                            "Dropping status change for appointment $appointmentId " +
+                                                    "after $attempt attempt(s)",
+                                            t
+                                    )
+                                    return
+                                }
+                                val delayMs = eventRetryMs shl (attempt - 1).coerceAtMost(6)
+                                logger.warn(
+                                        "Failed to record status change for appointment $appointmentId " +
+                                                "($code); retrying in $delayMs ms"
+                                )
+                                retryScheduler.schedule(
+                                        Runnable { sendAppointmentEvents(request, appointmentId, attempt + 1) },
+                                        delayMs,
+                                        TimeUnit.MILLISECONDS
+                                )
+                            }
+
+                            override fun onCompleted() {}
+                        }
+                )
+    }
+
+    @PreDestroy
+    fun shutdown() {
+        retryScheduler.shutdown()
+        channel.shutdown()
+    }
+
+    companion object {
+        private const val EVENT_DEADLINE_MS = 5000L
+
+        // the request itself is wrong, or the store is not configured; resending cannot help
+        private val NOT_RETRYABLE =
+                setOf(Status.Code.INVALID_ARGUMENT, Status.Code.FAILED_PRECONDITION, Status.Code.UNIMPLEMENTED)
     }
 }
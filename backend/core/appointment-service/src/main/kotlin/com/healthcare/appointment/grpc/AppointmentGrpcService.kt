@@ -11,6 +11,7 @@ import com.healthcare.appointment.v1.Appointment as ProtoAppointment
 import com.healthcare.appointment.v1.AppointmentServiceGrpc
 import com.healthcare.common.v1.PaginationResponse
 import io.grpc.Status
+import io.grpc.StatusRuntimeException
 import io.grpc.stub.StreamObserver
 import java.time.LocalDateTime
 import java.time.format.DateTimeFormatter
@@ -256,6 +257,14 @@ class AppointmentGrpcService(
                 return
             }
 
+            // keep the ML feature store's no-show history in step
+            MLService.recordAppointmentStatus(
+                    patientId = updatedAppointment.patientId,
+                    appointmentId = updatedAppointment.id.toString(),
+                    status = request.status,
+                    startTime = updatedAppointment.startTime.toString()
+            )
+
             responseObserver.onNext(updatedAppointment.toProto())
             responseObserver.onCompleted()
         } catch (e: Exception) {
@@ -311,6 +320,13 @@ class AppointmentGrpcService(
             // 5) Return it
             responseObserver.onNext(grpcResp)
             responseObserver.onCompleted()
+        } catch (e: StatusRuntimeException) {
+            // keep shedding signals (RESOURCE_EXHAUSTED, DEADLINE_EXCEEDED) visible to callers
+            responseObserver.onError(
+                    Status.fromCode(e.status.code)
+                            .withDescription("Error predicting no-show: ${e.status.description}")
+                            .asRuntimeException()
+            )
         } catch (e: Exception) {
             // Unexpected: wrap as INTERNAL
             responseObserver.onError(
@@ -0,0 +1,196 @@
+"""
+File-backed append-only event log.
+
+A local stand-in for a message broker: producers append newline-delimited
+JSON records to size-capped segment files and consumers read them back in
+batches by log offset. Each segment file is named after the offset of its
+first byte, so offsets are contiguous across segments and an offset maps to
+exactly one segment and position.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+LOGGER = logging.getLogger("event_log")
+
+SEGMENT_SUFFIX = ".log"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_READ_BYTES = 4 * 1024 * 1024
+
+
+class EventLog:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        fsync: bool = False
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        # flock() excludes other processes; the thread lock excludes
+        # other threads sharing this process' lock file descriptor.
+        self._thread_lock = threading.Lock()
+        self._lock_path = os.path.join(directory, ".lock")
+
+    def _segment_path(self, base_offset: int) -> str:
+        return os.path.join(self.directory, f"{base_offset:020d}{SEGMENT_SUFFIX}")
+
+    def segments(self) -> List[int]:
+        """Return the base offsets of all segments, oldest first"""
+        bases = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            try:
+                bases.append(int(name[:-len(SEGMENT_SUFFIX)]))
+            except ValueError:
+                continue
+        return sorted(bases)
+
+    def end_offset(self) -> int:
+        """Offset one past the last byte written"""
+        bases = self.segments()
+        if not bases:
+            return 0
+        return bases[-1] + os.path.getsize(self._segment_path(bases[-1]))
+
+    def append(self, event: Dict[str, Any]) -> int:
+        """Append a single event and return its offset"""
+        return self.append_many([event])[0]
+
+    def append_many(self, events: List[Dict[str, Any]]) -> List[int]:
+        """
+        Append events in one write and return the offset of each.
+        Records are never split across segments.
+        """
+        lines = [
+            json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n"
+            for event in events
+        ]
+        payload = b"".join(lines)
+
+        with self._thread_lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                bases = self.segments()
+                base = bases[-1] if bases else 0
+                path = self._segment_path(base)
+                size = os.path.getsize(path) if bases else 0
+
+                if size and size + len(payload) > self.segment_bytes:
+                    base, size = base + size, 0
+                    path = self._segment_path(base)
+
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    # A writer that died mid-record leaves a partial line;
+                    # terminate it so the next record starts cleanly.
+                    if size and os.pread(fd, 1, size - 1) != b"\n":
+                        os.write(fd, b"\n")
+                        size += 1
+                    os.write(fd, payload)
+                    if self.fsync:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        offsets = []
+        position = base + size
+        for line in lines:
+            offsets.append(position)
+            position += len(line)
+        return offsets
+
+    def read(
+        self,
+        offset: int,
+        max_records: int,
+        max_bytes: int = DEFAULT_READ_BYTES
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read up to `max_records` complete records starting at `offset`.
+        Returns the records and the offset to resume from. A trailing record
+        that is still being written is left for the next read.
+        """
+        records: List[Dict[str, Any]] = []
+        bases = self.segments()
+        if not bases:
+            return records, offset
+
+        # Offsets below the oldest retained segment were truncated away
+        offset = max(offset, bases[0])
+
+        while len(records) < max_records:
+            index = _segment_index(bases, offset)
+            base = bases[index]
+            path = self._segment_path(base)
+            with open(path, "rb") as segment:
+                segment.seek(offset - base)
+                chunk = segment.read(max_bytes)
+
+            consumed = 0
+            for line in chunk.split(b"\n")[:-1]:
+                line_offset = offset + consumed
+                consumed += len(line) + 1
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        LOGGER.warning(f"Skipping corrupt record at offset {line_offset}")
+                if len(records) >= max_records:
+                    break
+            offset += consumed
+
+            segment_end = base + os.path.getsize(path)
+            if offset < segment_end:
+                if consumed:
+                    continue
+                if len(chunk) >= max_bytes:
+                    raise ValueError(f"Record at offset {offset} exceeds {max_bytes} bytes")
+                if index + 1 >= len(bases):
+                    break
+                # Sealed segment ending in a torn write; nothing more will
+                # ever complete it, so move on to the next segment.
+                LOGGER.warning(f"Skipping partial record at offset {offset}")
+            if index + 1 >= len(bases):
+                break
+            # Segment fully consumed; continue in the next one
+            offset = bases[index + 1]
+
+        return records, offset
+
+    def truncate_before(self, offset: int) -> int:
+        """
+        Delete segments that lie entirely before `offset`. The active
+        segment is always kept. Returns the number of segments removed.
+        """
+        bases = self.segments()
+        removed = 0
+        for base, next_base in zip(bases, bases[1:]):
+            if next_base > offset:
+                break
+            try:
+                os.remove(self._segment_path(base))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _segment_index(bases: List[int], offset: int) -> int:
+    """Index of the segment containing `offset`"""
+    index = 0
+    for i, base in enumerate(bases):
+        if base <= offset:
+            index = i
+        else:
+            break
+    return index
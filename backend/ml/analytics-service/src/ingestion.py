@@ -0,0 +1,100 @@
+import datetime
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from event_log import EventLog
+from models.analytics_model import AnalyticsModel
+
+LOGGER = logging.getLogger("analytics_service.ingestion")
+
+REQUIRED_FIELDS = ("appointment_id", "prediction_time", "no_show_probability", "risk_level")
+
+
+class PredictionEventConsumer:
+    """
+    Drains prediction events from the event log into the `predictions`
+    table. Each batch is written together with its end offset in a single
+    transaction, so a crash at any point replays exactly the events whose
+    batch was not committed.
+    """
+
+    def __init__(
+        self,
+        event_log: EventLog,
+        analytics_model: AnalyticsModel,
+        consumer_name: str = "analytics-predictions",
+        batch_size: int = 5000,
+        poll_interval: float = 0.5,
+        retry_backoff: float = 5.0
+    ):
+        self.event_log = event_log
+        self.analytics_model = analytics_model
+        self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_backoff = retry_backoff
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll_once(self) -> int:
+        """Ingest at most one batch; returns the number of events read"""
+        offset = self.analytics_model.get_ingest_offset(self.consumer_name)
+        records, next_offset = self.event_log.read(offset, self.batch_size)
+        if next_offset == offset:
+            return 0
+
+        events = self._valid_events(records)
+        committed = self.analytics_model.record_prediction_batch(
+            events,
+            consumer=self.consumer_name,
+            from_offset=offset,
+            to_offset=next_offset
+        )
+        if not committed:
+            LOGGER.info(f"Offset {offset} already committed by another consumer")
+            return 0
+
+        self.event_log.truncate_before(next_offset)
+        return len(records)
+
+    def _valid_events(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop malformed events so one bad record can't stall the log"""
+        events = []
+        for record in records:
+            try:
+                if not isinstance(record, dict) or not all(field in record for field in REQUIRED_FIELDS):
+                    raise ValueError("missing fields")
+                datetime.datetime.fromisoformat(record["prediction_time"])
+                float(record["no_show_probability"])
+            except (TypeError, ValueError) as e:
+                LOGGER.warning(f"Dropping malformed prediction event {record}: {e}")
+                continue
+            events.append(record)
+        return events
+
+    def run(self):
+        """Consume until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                read = self.poll_once()
+            except Exception as e:
+                # Nothing was committed; the batch is re-read after backoff
+                LOGGER.error(f"Prediction ingestion failed: {e}", exc_info=True)
+                self._stop.wait(self.retry_backoff)
+                continue
+            if read < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Start consuming on a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="prediction-ingestion", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Signal the consumer to stop and wait for the current batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -1,9 +1,14 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+import datetime
 import mlflow
 import logging
+import os
 from models.analytics_model import AnalyticsModel
+from event_log import EventLog
+from ingestion import PredictionEventConsumer
 
 app = FastAPI(title="Healthcare Analytics Service")
 LOGGER = logging.getLogger("analytics_service")
@@ -11,6 +16,30 @@ LOGGER = logging.getLogger("analytics_service")
 # Initialize models
 analytics_model = AnalyticsModel()
 
+# Log-based ingestion: prediction events appended by the Prediction Service
+# to a shared event log are drained into the predictions table in batches.
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR")
+prediction_consumer = None
+if EVENT_LOG_DIR:
+    prediction_consumer = PredictionEventConsumer(
+        EventLog(EVENT_LOG_DIR),
+        analytics_model,
+        batch_size=int(os.getenv("INGEST_BATCH_SIZE", "5000")),
+        poll_interval=float(os.getenv("INGEST_POLL_INTERVAL", "0.5"))
+    )
+
+@app.on_event("startup")
+def start_ingestion():
+    if prediction_consumer is not None:
+        prediction_consumer.start()
+
+@app.on_event("shutdown")
+async def stop_ingestion():
+    if prediction_consumer is not None:
+        await run_in_threadpool(prediction_consumer.stop)
+    await analytics_model.close_async()
+    analytics_model.close()
+
 class PredictionRequest(BaseModel):
     patient_id: str
     features: Dict[str, Any]
@@ -82,18 +111,94 @@ async def ingest_prediction(event: IngestPredictionRequest):
     """
     try:
         LOGGER.info("Received prediction event", extra=event.dict())
-        # Here you would call into your analytics_model to store it.
-        analytics_model.record_prediction(
-            appointment_id=event.appointment_id,
-            prediction_time=event.prediction_time,
-            no_show_probability=event.no_show_probability,
-            risk_level=event.risk_level
-        )
+        # Borrow a pooled connection for this request only; without the
+        # async engine the blocking insert runs off the event loop.
+        if analytics_model.database.is_async:
+            await analytics_model.record_prediction_async(**event.dict())
+        else:
+            await run_in_threadpool(analytics_model.record_prediction, **event.dict())
         return {"status": "accepted"}
     except Exception as e:
         LOGGER.error(f"Failed to ingest prediction: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not ingest prediction")
-    
+
+def _naive_utc(value: datetime.datetime) -> datetime.datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+@app.get("/analytics/backtest")
+async def backtest(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    chunk_size: int = 10000
+):
+    """
+    AUC, calibration and per-risk-level confusion of the predictions served
+    between `start` and `end` (default: the last 30 days), against outcomes.
+    """
+    end = _naive_utc(end) if end else datetime.datetime.utcnow()
+    start = _naive_utc(start) if start else end - datetime.timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        return await run_in_threadpool(analytics_model.backtest, start, end, chunk_size)
+    except Exception as e:
+        LOGGER.error(f"Backtest failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DriftSketchesRequest(BaseModel):
+    replica: str
+    model: str
+    # [{start, end, rows, sketch}] as exported by the Prediction Service
+    windows: List[Dict[str, Any]]
+
+@app.post("/analytics/drift/sketches", status_code=202)
+async def ingest_drift_sketches(request: DriftSketchesRequest):
+    """Store a prediction replica's windowed input/score sketches"""
+    try:
+        stored = await run_in_threadpool(
+            analytics_model.record_drift_windows, request.replica, request.model, request.windows
+        )
+        return {"stored": stored}
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid sketch payload: {e}")
+    except Exception as e:
+        LOGGER.error(f"Failed to store drift sketches: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not store drift sketches")
+
+@app.get("/analytics/drift")
+async def drift_report(
+    model: str = "no_show_prediction",
+    version: str = "latest",
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    bins: int = 10
+):
+    """
+    PSI and KS drift of served inputs and scores between `start` and `end`
+    (default: the last 24 hours), merged across replicas, against the
+    training baseline saved with the model version.
+    """
+    end = _naive_utc(end) if end else datetime.datetime.utcnow()
+    start = _naive_utc(start) if start else end - datetime.timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        return await run_in_threadpool(analytics_model.drift_report, model, start, end, version, bins)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        LOGGER.error(f"Drift report failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/db/pool")
+async def db_pool_metrics():
+    """Connection pool usage for capacity tuning"""
+    return analytics_model.pool_metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
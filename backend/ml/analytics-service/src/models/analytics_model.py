@@ -1,26 +1,37 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import os
 import numpy as np
 import tensorflow as tf
-from .base_model import BaseModel
-import os
+from .artifact_cache import registered_artifact
+from .base_model import BaseModel, EVALUATION_CHUNK_SIZE
+from .drift import DriftSketch, compare
+from .evaluation import StreamingEvaluator
 import datetime
 
 from sqlalchemy import (
-    create_engine, MetaData, Table, Column,
-    String, Float, DateTime
+    MetaData, Table, Column,
+    String, Float, DateTime, BigInteger, Text,
+    select, update, delete, func, and_
 )
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import IntegrityError
+from .database import Database
+
+LOGGER = logging.getLogger("analytics_model")
+
+# Run artifact the model service saves with each registered version
+DRIFT_BASELINE_ARTIFACT = "drift/baseline.json"
 
 class AnalyticsModel(BaseModel):
     def __init__(self):
         super().__init__("analytics_model")
 
         # ————— persistence setup —————
-        DATABASE_URL = os.getenv(
-            "FEATURE_DB_URL",
-            "jdbc:postgresql://db:5432/healthcare"
-        )
-        self.engine = create_engine(DATABASE_URL, echo=False, future=True)
+        # pooled connections are borrowed per request / per batch;
+        # DB_ASYNC=true adds an asyncio engine for the FastAPI handlers
+        self.database = Database.from_env()
+        self.engine = self.database.engine
         self.metadata = MetaData()
 
         # define (or reflect) the table
@@ -33,11 +44,43 @@ class AnalyticsModel(BaseModel):
             Column("risk_level", String, nullable=False),
             extend_existing=True
         )
+        # committed event-log offset per consumer, written in the same
+        # transaction as the rows it covers
+        self.ingest_offsets_table = Table(
+            "ingest_offsets",
+            self.metadata,
+            Column("consumer", String, primary_key=True),
+            Column("log_offset", BigInteger, nullable=False),
+            extend_existing=True
+        )
+        # windowed input/score sketches pushed by each prediction replica;
+        # a replica re-sends a window as it fills, replacing the earlier copy
+        self.drift_sketches_table = Table(
+            "drift_sketches",
+            self.metadata,
+            Column("replica", String, primary_key=True),
+            Column("model", String, primary_key=True),
+            Column("window_start", DateTime, primary_key=True),
+            Column("window_end", DateTime, nullable=False),
+            Column("rows", BigInteger, nullable=False),
+            Column("sketch", Text, nullable=False),
+            extend_existing=True
+        )
         # create if not exists
         self.metadata.create_all(self.engine)
+        # training baselines by (model, pinned version); versions are immutable
+        self._drift_baselines: Dict[Tuple[str, str], DriftSketch] = {}
 
-        SessionLocal = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
-        self.db = SessionLocal()
+        # outcomes, owned and created by the prediction service's feature
+        # store; kept out of self.metadata so create_all never touches it
+        self.statuses_table = Table(
+            "appointment_statuses",
+            MetaData(),
+            Column("appointment_id", String, primary_key=True),
+            Column("patient_id", String, nullable=False),
+            Column("status", String, nullable=False),
+            Column("start_time", DateTime, nullable=True),
+        )
         # ——————————————
 
         self.feature_columns = [
@@ -142,22 +185,265 @@ class AnalyticsModel(BaseModel):
         Persist a single prediction event into the `predictions` table.
         Expects prediction_time as ISO8601 string.
         """
-        # parse timestamp
-        ts = datetime.fromisoformat(prediction_time)
+        ins = self.predictions_table.insert().values(
+            **self._prediction_row(appointment_id, prediction_time, no_show_probability, risk_level)
+        )
+        # rollback happens automatically on exception
+        with self.database.begin() as conn:
+            conn.execute(ins)
 
+    async def record_prediction_async(
+        self,
+        appointment_id: str,
+        prediction_time: str,
+        no_show_probability: float,
+        risk_level: str
+    ):
+        """Async variant of record_prediction using the asyncio pool"""
         ins = self.predictions_table.insert().values(
-            appointment_id=appointment_id,
-            prediction_time=ts,
-            no_show_probability=no_show_probability,
-            risk_level=risk_level
+            **self._prediction_row(appointment_id, prediction_time, no_show_probability, risk_level)
         )
+        async with self.database.begin_async() as conn:
+            await conn.execute(ins)
+
+    def _prediction_row(
+        self,
+        appointment_id: str,
+        prediction_time: str,
+        no_show_probability: float,
+        risk_level: str
+    ) -> Dict[str, Any]:
+        return {
+            "appointment_id": appointment_id,
+            "prediction_time": _parse_timestamp(prediction_time),
+            "no_show_probability": float(no_show_probability),
+            "risk_level": risk_level,
+        }
+
+    def get_ingest_offset(self, consumer: str) -> int:
+        """Return the committed event-log offset for `consumer`, starting at 0"""
+        with self.database.begin() as conn:
+            offset = conn.execute(
+                select(self.ingest_offsets_table.c.log_offset)
+                .where(self.ingest_offsets_table.c.consumer == consumer)
+            ).scalar()
+        if offset is not None:
+            return offset
+
         try:
-            with self.db.begin():
-                self.db.execute(ins)
-        except Exception:
-            # rollback happens automatically on exception
-            raise
+            with self.database.begin() as conn:
+                conn.execute(
+                    self.ingest_offsets_table.insert().values(consumer=consumer, log_offset=0)
+                )
+        except IntegrityError:
+            # another consumer registered first
+            return self.get_ingest_offset(consumer)
+        return 0
+
+    def record_prediction_batch(
+        self,
+        events: List[Dict[str, Any]],
+        consumer: str,
+        from_offset: int,
+        to_offset: int
+    ) -> bool:
+        """
+        Insert a batch of prediction events and advance the consumer's
+        offset from `from_offset` to `to_offset` in one transaction.
+        Returns False, writing nothing, if another consumer already moved
+        the offset; the batch is then someone else's to commit.
+        """
+        rows = [
+            self._prediction_row(
+                event["appointment_id"],
+                event["prediction_time"],
+                event["no_show_probability"],
+                event["risk_level"]
+            )
+            for event in events
+        ]
+        with self.database.connect() as conn:
+            with conn.begin() as txn:
+                result = conn.execute(
+                    update(self.ingest_offsets_table)
+                    .where(self.ingest_offsets_table.c.consumer == consumer)
+                    .where(self.ingest_offsets_table.c.log_offset == from_offset)
+                    .values(log_offset=to_offset)
+                )
+                if result.rowcount != 1:
+                    txn.rollback()
+                    return False
+                if rows:
+                    conn.execute(self.predictions_table.insert(), rows)
+        return True
+
+    def backtest(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        chunk_size: int = EVALUATION_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Score the served predictions made in [start, end) against the
+        appointments' recorded outcomes (NO_SHOW vs COMPLETED). Only the
+        latest prediction per appointment counts; rows are streamed from
+        the server in chunks into a StreamingEvaluator. `predicted` counts
+        the appointments predicted in the range, `unresolved` those
+        without a NO_SHOW / COMPLETED outcome (yet).
+        """
+        predictions, statuses = self.predictions_table, self.statuses_table
+        latest = (
+            select(
+                predictions.c.appointment_id,
+                func.max(predictions.c.prediction_time).label("prediction_time")
+            )
+            .where(predictions.c.prediction_time >= start)
+            .where(predictions.c.prediction_time < end)
+            .group_by(predictions.c.appointment_id)
+            .subquery()
+        )
+        query = (
+            select(predictions.c.no_show_probability, statuses.c.status)
+            .select_from(
+                predictions
+                .join(latest, and_(
+                    predictions.c.appointment_id == latest.c.appointment_id,
+                    predictions.c.prediction_time == latest.c.prediction_time
+                ))
+                .join(statuses, statuses.c.appointment_id == predictions.c.appointment_id)
+            )
+            .where(statuses.c.status.in_(["NO_SHOW", "COMPLETED"]))
+        )
+
+        evaluator = StreamingEvaluator()
+        with self.database.connect() as conn:
+            predicted = conn.execute(select(func.count()).select_from(latest)).scalar_one()
+            result = conn.execution_options(stream_results=True).execute(query)
+            for rows in result.partitions(chunk_size):
+                scores = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+                labels = np.fromiter((row[1] == "NO_SHOW" for row in rows), dtype=np.int64, count=len(rows))
+                evaluator.update(scores, labels)
+        metrics = evaluator.result()
+        if predicted and not metrics["count"]:
+            # predictions whose appointment_id matches no recorded appointment
+            LOGGER.warning(
+                f"Backtest {start.isoformat()} - {end.isoformat()}: none of {predicted} predicted "
+                f"appointments has an outcome in {statuses.name}"
+            )
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "predicted": predicted,
+            "unresolved": predicted - metrics["count"],
+            **metrics,
+        }
+
+    def record_drift_windows(self, replica: str, model: str, windows: List[Dict[str, Any]]) -> int:
+        """Store (or replace) a replica's window sketches in one transaction"""
+        rows = [
+            {
+                "replica": replica,
+                "model": model,
+                "window_start": _parse_timestamp(window["start"]),
+                "window_end": _parse_timestamp(window["end"]),
+                "rows": int(window["rows"]),
+                "sketch": json.dumps(window["sketch"]),
+            }
+            for window in windows
+        ]
+        if not rows:
+            return 0
+        table = self.drift_sketches_table
+        with self.database.begin() as conn:
+            conn.execute(
+                delete(table)
+                .where(table.c.replica == replica)
+                .where(table.c.model == model)
+                .where(table.c.window_start.in_([row["window_start"] for row in rows]))
+            )
+            conn.execute(table.insert(), rows)
+        return len(rows)
+
+    def merged_drift_sketch(
+        self,
+        model: str,
+        start: datetime.datetime,
+        end: datetime.datetime
+    ) -> Tuple[Optional[DriftSketch], Dict[str, Any]]:
+        """All replicas' windows overlapping [start, end) merged into one sketch"""
+        table = self.drift_sketches_table
+        merged: Optional[DriftSketch] = None
+        replicas, windows = set(), set()
+        with self.database.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(
+                select(table.c.replica, table.c.window_start, table.c.sketch)
+                .where(table.c.model == model)
+                .where(table.c.window_end > start)
+                .where(table.c.window_start < end)
+            )
+            for replica, window_start, sketch in result:
+                sketch = DriftSketch.from_dict(json.loads(sketch))
+                merged = sketch if merged is None else merged.merge(sketch)
+                replicas.add(replica)
+                windows.add(window_start)
+        return merged, {"replicas": len(replicas), "windows": len(windows)}
+
+    def load_drift_baseline(self, model: str, version: str = "latest") -> DriftSketch:
+        """
+        Training-time sketch saved with a registered model version, or the
+        file at DRIFT_BASELINE_PATH when set.
+        """
+        path = os.getenv("DRIFT_BASELINE_PATH")
+        if path:
+            with open(path) as f:
+                return DriftSketch.from_dict(json.load(f))
+
+        # pinned versions are parsed once; 'latest' re-resolves on every call
+        # and reads through the artifact cache
+        baseline = self._drift_baselines.get((model, version))
+        if baseline is None:
+            try:
+                with registered_artifact(
+                    self.mlflow_client, self.artifact_cache, model, version, DRIFT_BASELINE_ARTIFACT
+                ) as path:
+                    with open(path) as f:
+                        baseline = DriftSketch.from_dict(json.load(f))
+            except LookupError:
+                raise
+            except Exception as e:
+                raise LookupError(f"Version {version} of '{model}' has no drift baseline: {e}")
+            if version != "latest":
+                self._drift_baselines[(model, version)] = baseline
+        return baseline
+
+    def drift_report(
+        self,
+        model: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        version: str = "latest",
+        bins: int = 10
+    ) -> Dict[str, Any]:
+        """PSI/KS drift of the served inputs and scores in [start, end) against training"""
+        current, coverage = self.merged_drift_sketch(model, start, end)
+        if current is None:
+            raise LookupError(f"No drift sketches for '{model}' between {start} and {end}")
+        report = compare(self.load_drift_baseline(model, version), current, bins)
+        return {"model": model, "version": version, "start": start.isoformat(), "end": end.isoformat(), **coverage, **report}
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Connection pool usage: checked-out connections, waiters, wait time."""
+        return self.database.pool_metrics()
 
     def close(self):
-        """Close DB session when shutting down."""
-        self.db.close()
+        """Release pooled DB connections when shutting down."""
+        self.database.dispose()
+
+    async def close_async(self):
+        """Release pooled asyncio DB connections when shutting down."""
+        await self.database.dispose_async()
+
+
+def _parse_timestamp(value: str) -> datetime.datetime:
+    """Parse an ISO8601 timestamp as sent by the Prediction Service"""
+    return datetime.datetime.fromisoformat(value)
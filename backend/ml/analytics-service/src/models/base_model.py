@@ -1,14 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Sequence
+import os
 import mlflow
 import tensorflow as tf
 import numpy as np
+from .artifact_cache import ArtifactCache, registered_artifact
+from .evaluation import evaluate_stream, iter_chunks, iter_csv_chunks
+
+# Rows encoded and scored at a time by evaluate()
+EVALUATION_CHUNK_SIZE = int(os.getenv("EVALUATION_CHUNK_SIZE", "10000"))
 
 class BaseModel(ABC):
     def __init__(self, model_name: str):
         self.model_name = model_name
         self.model = None
         self.mlflow_client = mlflow.tracking.MlflowClient()
+        # downloaded artifacts, shared with other processes on this host
+        self.artifact_cache = ArtifactCache.from_env()
 
     @abstractmethod
     def preprocess_data(self, data: Dict[str, Any]) -> np.ndarray:
@@ -31,10 +39,32 @@ class BaseModel(ABC):
             mlflow.tensorflow.log_model(self.model, self.model_name)
 
     def load_model(self, version: str):
-        """Load model from MLflow"""
-        model_uri = f"models:/{self.model_name}/{version}"
-        self.model = mlflow.tensorflow.load_model(model_uri)
+        """Load model from MLflow, through the local artifact cache"""
+        with registered_artifact(self.mlflow_client, self.artifact_cache, self.model_name, version) as path:
+            self.model = mlflow.tensorflow.load_model(path)
 
-    def evaluate(self, test_data: Dict[str, Any]) -> Dict[str, float]:
-        """Evaluate model performance"""
-        pass
+    def score_batch(self, features: np.ndarray) -> np.ndarray:
+        """Positive-class probability for each row of an encoded (N, F) batch"""
+        return self.model.predict(features, verbose=0).reshape(-1)
+
+    def score_rows(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Encode and score a list of feature dicts"""
+        return self.score_batch(np.vstack([self.preprocess_data(d) for d in rows]).astype(np.float32))
+
+    def evaluate(self, test_data: Dict[str, Any], chunk_size: int = EVALUATION_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        Evaluate model performance on {features, labels}. Rows are encoded
+        and scored chunk by chunk into fixed-size histograms, so memory
+        stays bounded however large the test set is.
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        chunks = iter_chunks(test_data['features'], test_data['labels'], chunk_size)
+        return evaluate_stream(self.score_rows, chunks).result()
+
+    def evaluate_csv(self, path: str, label_column: str, chunk_size: int = EVALUATION_CHUNK_SIZE) -> Dict[str, Any]:
+        """Evaluate on an encoded CSV with one column per feature, read in chunks"""
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        chunks = iter_csv_chunks(path, self.feature_columns, label_column, chunk_size)
+        return evaluate_stream(self.score_batch, chunks).result()
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def normalize_url(url: str, user: Optional[str] = None, password: Optional[str] = None) -> str:
+    """
+    Turn the JDBC-style URL shared with the Spring services into a
+    SQLAlchemy URL, filling in credentials passed separately.
+    """
+    if url.startswith("jdbc:"):
+        url = url[len("jdbc:"):]
+    parsed = make_url(url)
+    if user and parsed.username is None:
+        parsed = parsed.set(username=user, password=password)
+    return parsed.render_as_string(hide_password=False)
+
+
+def async_url(url: str) -> str:
+    """Swap the driver of a sync SQLAlchemy URL for its asyncio counterpart"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}'")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+class PoolMetrics:
+    """Connection acquisition counters for one engine's pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiters = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start_wait(self):
+        with self._lock:
+            self.waiters += 1
+
+    def end_wait(self, waited: float, acquired: bool = True, timed_out: bool = False):
+        with self._lock:
+            self.waiters -= 1
+            if acquired:
+                self.acquired += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            elif timed_out:
+                self.timeouts += 1
+
+    def snapshot(self, pool: Any) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pool_size": pool.size() if hasattr(pool, "size") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "waiters": self.waiters,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": 1000.0 * self.total_wait / self.acquired if self.acquired else 0.0,
+                "max_wait_ms": 1000.0 * self.max_wait,
+            }
+
+
+class Database:
+    """
+    Pooled sync engine plus, in async mode, an asyncio engine over the same
+    database. Callers borrow a connection per request or per batch instead
+    of sharing a long-lived session.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        async_mode: bool = False,
+        pool_size: int = 10,
+        max_overflow: int = 10,
+        pool_timeout: float = 30.0,
+        pool_recycle: int = 1800
+    ):
+        self.url = url
+        pool_options = {}
+        # SQLite (local runs) uses SQLAlchemy's own per-file pooling
+        if make_url(url).get_backend_name() != "sqlite":
+            pool_options = {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_timeout": pool_timeout,
+                "pool_recycle": pool_recycle,
+                "pool_pre_ping": True,
+            }
+
+        self.engine: Engine = create_engine(url, echo=False, future=True, **pool_options)
+        self.metrics = PoolMetrics()
+
+        self.async_engine: Optional[AsyncEngine] = None
+        self.async_metrics = PoolMetrics()
+        if async_mode:
+            self.async_engine = create_async_engine(async_url(url), echo=False, **pool_options)
+
+    @classmethod
+    def from_env(cls) -> "Database":
+        url = normalize_url(
+            os.getenv("FEATURE_DB_URL", "jdbc:postgresql://db:5432/healthcare"),
+            os.getenv("FEATURE_DB_USER"),
+            os.getenv("FEATURE_DB_PASS")
+        )
+        return cls(
+            url,
+            async_mode=os.getenv("DB_ASYNC", "false").lower() == "true",
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800"))
+        )
+
+    @property
+    def is_async(self) -> bool:
+        return self.async_engine is not None
+
+    @contextmanager
+    def connect(self) -> Iterator[Connection]:
+        """Borrow a pooled connection, recording how long it took"""
+        self.metrics.start_wait()
+        started = time.perf_counter()
+        try:
+            conn = self.engine.connect()
+        except Exception as e:
+            self.metrics.end_wait(
+                time.perf_counter() - started,
+                acquired=False,
+                timed_out=isinstance(e, PoolTimeoutError)
+            )
+            raise
+        self.metrics.end_wait(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def begin(self) -> Iterator[Connection]:
+        """Borrow a pooled connection inside a transaction"""
+        with self.connect() as conn, conn.begin():
+            yield conn
+
+    @asynccontextmanager
+    async def connect_async(self) -> AsyncIterator[AsyncConnection]:
+        """Borrow a pooled asyncio connection, recording how long it took"""
+        if self.async_engine is None:
+            raise RuntimeError("Async mode is disabled; set DB_ASYNC=true")
+        self.async_metrics.start_wait()
+        started = time.perf_counter()
+        try:
+            conn = await self.async_engine.connect().start()
+        except Exception as e:
+            self.async_metrics.end_wait(
+                time.perf_counter() - started,
+                acquired=False,
+                timed_out=isinstance(e, PoolTimeoutError)
+            )
+            raise
+        self.async_metrics.end_wait(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    @asynccontextmanager
+    async def begin_async(self) -> AsyncIterator[AsyncConnection]:
+        """Borrow a pooled asyncio connection inside a transaction"""
+        async with self.connect_async() as conn, conn.begin():
+            yield conn
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        metrics = {"sync": self.metrics.snapshot(self.engine.pool)}
+        if self.async_engine is not None:
+            metrics["async"] = self.async_metrics.snapshot(self.async_engine.pool)
+        return metrics
+
+    def dispose(self):
+        self.engine.dispose()
+
+    async def dispose_async(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
@@ -0,0 +1,175 @@
+"""
+Streaming evaluation of binary no-show scores.
+
+StreamingEvaluator accumulates fixed-size histograms, so memory does not
+depend on the number of rows: AUC comes from per-bin positive/negative
+counts (ties within a bin count as half, so with the default 1000 bins the
+error is well under 1e-3), alongside log loss, Brier score, a calibration
+curve and confusion counts per risk level. Evaluators over disjoint chunks
+can be merged.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Same cut points as _get_risk_level / get_risk_level
+RISK_THRESHOLDS = (0.3, 0.6)
+RISK_LEVELS = ("Low", "Medium", "High")
+
+_EPSILON = 1e-7
+
+
+class StreamingEvaluator:
+    def __init__(self, bins: int = 1000, calibration_bins: int = 10):
+        self.bins = bins
+        self.calibration_bins = calibration_bins
+        self.count = 0
+        self.log_loss_sum = 0.0
+        self.brier_sum = 0.0
+        # [bin, label] counts over scores
+        self.histogram = np.zeros((bins, 2), dtype=np.int64)
+        self.calibration_count = np.zeros(calibration_bins, dtype=np.int64)
+        self.calibration_score_sum = np.zeros(calibration_bins)
+        self.calibration_label_sum = np.zeros(calibration_bins)
+        # [risk level, label] counts
+        self.confusion = np.zeros((len(RISK_LEVELS), 2), dtype=np.int64)
+
+    def update(self, scores: np.ndarray, labels: np.ndarray):
+        """Add a chunk of predicted probabilities and 0/1 outcomes"""
+        scores = np.clip(np.asarray(scores, dtype=np.float64).reshape(-1), 0.0, 1.0)
+        labels = np.asarray(labels).reshape(-1).astype(np.int64)
+        if scores.shape != labels.shape:
+            raise ValueError(f"Got {scores.size} scores for {labels.size} labels")
+        if scores.size == 0:
+            return
+
+        self.count += scores.size
+        clipped = np.clip(scores, _EPSILON, 1.0 - _EPSILON)
+        self.log_loss_sum -= float(np.sum(np.where(labels == 1, np.log(clipped), np.log1p(-clipped))))
+        self.brier_sum += float(np.sum((scores - labels) ** 2))
+
+        score_bins = np.minimum((scores * self.bins).astype(np.int64), self.bins - 1)
+        self.histogram += np.bincount(
+            score_bins * 2 + labels, minlength=self.bins * 2
+        ).reshape(self.bins, 2)
+
+        calibration = np.minimum((scores * self.calibration_bins).astype(np.int64), self.calibration_bins - 1)
+        self.calibration_count += np.bincount(calibration, minlength=self.calibration_bins)
+        self.calibration_score_sum += np.bincount(calibration, weights=scores, minlength=self.calibration_bins)
+        self.calibration_label_sum += np.bincount(calibration, weights=labels, minlength=self.calibration_bins)
+
+        risk = np.digitize(scores, RISK_THRESHOLDS)
+        self.confusion += np.bincount(
+            risk * 2 + labels, minlength=len(RISK_LEVELS) * 2
+        ).reshape(len(RISK_LEVELS), 2)
+
+    def merge(self, other: "StreamingEvaluator") -> "StreamingEvaluator":
+        if (other.bins, other.calibration_bins) != (self.bins, self.calibration_bins):
+            raise ValueError("Cannot merge evaluators with different binning")
+        self.count += other.count
+        self.log_loss_sum += other.log_loss_sum
+        self.brier_sum += other.brier_sum
+        self.histogram += other.histogram
+        self.calibration_count += other.calibration_count
+        self.calibration_score_sum += other.calibration_score_sum
+        self.calibration_label_sum += other.calibration_label_sum
+        self.confusion += other.confusion
+        return self
+
+    def auc(self) -> Optional[float]:
+        """ROC AUC from the score histogram; None unless both classes were seen"""
+        negatives, positives = self.histogram[::-1, 0], self.histogram[::-1, 1]
+        total_positive, total_negative = positives.sum(), negatives.sum()
+        if total_positive == 0 or total_negative == 0:
+            return None
+        # trapezoids between successive thresholds, highest scores first
+        tp = np.concatenate([[0], np.cumsum(positives)])
+        fp = np.concatenate([[0], np.cumsum(negatives)])
+        area = np.sum(np.diff(fp) * (tp[1:] + tp[:-1]) / 2.0)
+        return float(area / (total_positive * total_negative))
+
+    def result(self) -> Dict[str, Any]:
+        if self.count == 0:
+            return {"count": 0}
+        edges = np.linspace(0.0, 1.0, self.calibration_bins + 1)
+        calibration = [
+            {
+                "lower": round(float(edges[i]), 6),
+                "upper": round(float(edges[i + 1]), 6),
+                "count": int(self.calibration_count[i]),
+                "mean_predicted": float(self.calibration_score_sum[i] / self.calibration_count[i]),
+                "observed_rate": float(self.calibration_label_sum[i] / self.calibration_count[i]),
+            }
+            for i in range(self.calibration_bins)
+            if self.calibration_count[i]
+        ]
+        # expected calibration error: count-weighted |predicted - observed|
+        ece = sum(
+            bucket["count"] * abs(bucket["mean_predicted"] - bucket["observed_rate"])
+            for bucket in calibration
+        ) / self.count
+        return {
+            "count": self.count,
+            "positives": int(self.histogram[:, 1].sum()),
+            "auc": self.auc(),
+            "log_loss": self.log_loss_sum / self.count,
+            "brier": self.brier_sum / self.count,
+            "expected_calibration_error": ece,
+            "calibration": calibration,
+            "confusion": {
+                level: {"no_show": int(self.confusion[i, 1]), "attended": int(self.confusion[i, 0])}
+                for i, level in enumerate(RISK_LEVELS)
+            },
+        }
+
+
+def iter_chunks(features: Sequence[Any], labels: Sequence[Any], chunk_size: int) -> Iterator[Tuple[Sequence[Any], np.ndarray]]:
+    """Split an in-memory labelled dataset into (features, labels) chunks"""
+    for start in range(0, len(labels), chunk_size):
+        yield features[start:start + chunk_size], np.asarray(labels[start:start + chunk_size])
+
+
+def iter_csv_chunks(
+    path: str,
+    feature_columns: List[str],
+    label_column: str,
+    chunk_size: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Stream an encoded CSV as (float32 features, labels) chunks"""
+    import pandas as pd
+    for frame in pd.read_csv(path, usecols=feature_columns + [label_column], chunksize=chunk_size):
+        yield frame[feature_columns].to_numpy(dtype=np.float32), frame[label_column].to_numpy()
+
+
+def evaluate_stream(
+    score: Callable[[Any], np.ndarray],
+    chunks: Iterable[Tuple[Any, np.ndarray]],
+    evaluator: Optional[StreamingEvaluator] = None
+) -> StreamingEvaluator:
+    """Score every chunk with `score` and accumulate it"""
+    evaluator = evaluator or StreamingEvaluator()
+    for features, labels in chunks:
+        evaluator.update(score(features), labels)
+    return evaluator
+
+
+def evaluate_many(
+    scorers: Dict[str, Callable[[Any], np.ndarray]],
+    chunks: Iterable[Tuple[Any, np.ndarray]],
+    max_workers: int = 0
+) -> Dict[str, StreamingEvaluator]:
+    """
+    Evaluate several models in one pass over the data: each chunk is read
+    once and scored by every model in parallel threads.
+    """
+    evaluators = {name: StreamingEvaluator() for name in scorers}
+    with ThreadPoolExecutor(max_workers=max_workers or len(scorers) or 1) as pool:
+        for features, labels in chunks:
+            futures = [
+                pool.submit(lambda name=name: evaluators[name].update(scorers[name](features), labels))
+                for name in scorers
+            ]
+            for future in futures:
+                future.result()
+    return evaluators
@@ -0,0 +1,77 @@
+"""
+Lag between a prediction being served and its row landing in `predictions`.
+
+Rows carry no request id the load generator knows, so lag is matched by
+count: the probe polls the table's row count, and the k-th row to appear
+is charged to the k-th prediction to complete. With many rows in flight
+this pairs rows with requests slightly out of order, but the lag
+distribution is the same; its resolution is the polling interval.
+"""
+import bisect
+import threading
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import create_engine, text
+
+from traffic import percentiles
+
+
+class IngestLagProbe:
+    def __init__(self, database_url: str, interval: float = 0.05):
+        self.engine = create_engine(database_url, future=True)
+        self.interval = interval
+        self._completions: List[float] = []
+        self._lags: List[float] = []
+        self._lock = threading.Lock()
+        self._baseline = 0
+        self._matched = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM predictions")).scalar_one()
+
+    def start(self):
+        self._baseline = self._count()
+        self._thread = threading.Thread(target=self._run, name="ingest-lag", daemon=True)
+        self._thread.start()
+
+    def reported(self, completed_at: float):
+        """A prediction the service reports to analytics completed at this monotonic time"""
+        with self._lock:
+            bisect.insort(self._completions, completed_at)
+
+    def _poll(self):
+        ingested = self._count() - self._baseline
+        now = time.monotonic()
+        with self._lock:
+            # rows can be visible before the client sees the response
+            while self._matched < min(ingested, len(self._completions)):
+                self._lags.append(max(now - self._completions[self._matched], 0.0))
+                self._matched += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._poll()
+
+    def stop(self, drain_timeout: float = 30.0) -> Dict[str, Any]:
+        """Wait up to `drain_timeout` for outstanding rows, then report"""
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._matched >= len(self._completions):
+                    break
+            time.sleep(self.interval)
+        self._stop.set()
+        self._thread.join()
+        self._poll()
+        self.engine.dispose()
+        with self._lock:
+            return {
+                "reported": len(self._completions),
+                "ingested": self._matched,
+                "missing": len(self._completions) - self._matched,
+                "lag_ms": percentiles([1000.0 * lag for lag in self._lags]),
+            }
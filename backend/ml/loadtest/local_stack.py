@@ -0,0 +1,194 @@
+"""
+The prediction and analytics services running locally, without the
+docker-compose stack.
+
+- Model registry: MLflow's file store under <workdir>/mlruns stands in for
+  the tracking server. The same client code registers and loads versions;
+  only MLFLOW_TRACKING_URI differs. A no-show model trained on synthetic
+  bookings is registered on first use.
+- Database: an SQLite file (<workdir>/healthcare.db, WAL mode) stands in
+  for Postgres. Both services reach it through FEATURE_DB_URL, as they
+  would reach Postgres.
+- The services run as subprocesses from their source trees, logging to
+  <workdir>/logs. gRPC stubs are generated into <workdir>/protos.
+"""
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+ML_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PROTO_ROOT = os.path.abspath(os.path.join(ML_ROOT, "..", "shared", "protos"))
+PREDICTION_SRC = os.path.join(ML_ROOT, "prediction-service", "src")
+ANALYTICS_SRC = os.path.join(ML_ROOT, "analytics-service", "src")
+
+# Registered name the prediction service loads
+MODEL_NAME = "no_show_prediction"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalStack:
+    def __init__(
+        self,
+        workdir: str,
+        ingest: str = "http",
+        feature_store: bool = True,
+        extra_env: Optional[Dict[str, str]] = None
+    ):
+        if ingest not in ("http", "log"):
+            raise ValueError(f"Unknown ingest mode '{ingest}'; expected 'http' or 'log'")
+        self.workdir = os.path.abspath(workdir)
+        self.ingest = ingest
+        self.feature_store = feature_store
+        self.extra_env = extra_env or {}
+        self.tracking_uri = "file://" + os.path.join(self.workdir, "mlruns")
+        self.database_path = os.path.join(self.workdir, "healthcare.db")
+        self.database_url = f"sqlite:///{self.database_path}"
+        self.prediction_url = ""
+        self.analytics_url = ""
+        self._processes: List[Tuple[str, subprocess.Popen]] = []
+        os.makedirs(os.path.join(self.workdir, "logs"), exist_ok=True)
+
+    # ---- registry ----
+
+    def seed_registry(self, rows: int = 20000, epochs: int = 20, reseed: bool = False) -> str:
+        """Train and register a no-show model on synthetic bookings, unless one is registered"""
+        # read by MlflowClient() and mlflow.start_run() in this process
+        os.environ["MLFLOW_TRACKING_URI"] = self.tracking_uri
+        import mlflow
+        from models.no_show_model import NoShowPredictionModel
+        from traffic import BookingGenerator
+
+        client = mlflow.tracking.MlflowClient()
+        if not reseed:
+            try:
+                versions = client.get_latest_versions(MODEL_NAME)
+            except mlflow.exceptions.MlflowException:
+                versions = []
+            if versions:
+                return max(versions, key=lambda v: int(v.version)).version
+
+        # a different population from the replayed traffic
+        generator = BookingGenerator(seed=1_000_003)
+        training, validation = generator.training_set(rows), generator.training_set(rows // 5)
+        model = NoShowPredictionModel()
+        metrics = model.train(training, validation, epochs=epochs, batch_size=256)
+        version = model.save_model("loadtest")
+        print(f"Registered {MODEL_NAME} version {version} (val AUC {metrics['val_auc']:.3f})", flush=True)
+        return str(version)
+
+    # ---- database ----
+
+    def create_database(self):
+        # WAL lets the probe read while both services write
+        with sqlite3.connect(self.database_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    # ---- services ----
+
+    def _generate_stubs(self) -> str:
+        out = os.path.join(self.workdir, "protos")
+        os.makedirs(out, exist_ok=True)
+        protoc = [sys.executable, "-m", "grpc_tools.protoc", f"--python_out={out}"]
+        subprocess.run(
+            protoc + [
+                f"-I{PROTO_ROOT}",
+                os.path.join(PROTO_ROOT, "common", "v1", "common.proto"),
+                os.path.join(PROTO_ROOT, "appointment", "v1", "appointment.proto"),
+            ],
+            check=True
+        )
+        # top-level ml_service_pb2 / ml_service_pb2_grpc, as main.py imports them
+        ml_protos = os.path.join(PROTO_ROOT, "ml", "v1")
+        subprocess.run(
+            protoc + [
+                f"--grpc_python_out={out}", f"-I{ml_protos}", f"-I{PROTO_ROOT}",
+                os.path.join(ml_protos, "ml_service.proto"),
+            ],
+            check=True
+        )
+        return out
+
+    def _env(self, **values: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "MLFLOW_TRACKING_URI": self.tracking_uri,
+            "FEATURE_DB_URL": self.database_url,
+            "MODEL_CACHE_DIR": os.path.join(self.workdir, "model-cache"),
+        })
+        if self.ingest == "log":
+            env["EVENT_LOG_DIR"] = os.path.join(self.workdir, "events")
+        env.update(values)
+        env.update(self.extra_env)
+        return env
+
+    def _spawn(self, name: str, args: List[str], cwd: str, env: Dict[str, str]):
+        with open(os.path.join(self.workdir, "logs", f"{name}.log"), "ab") as log:
+            process = subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self._processes.append((name, process))
+
+    def _wait_ready(self, url: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for name, process in self._processes:
+                if process.poll() is not None:
+                    raise RuntimeError(
+                        f"{name} exited with {process.returncode}; "
+                        f"see {os.path.join(self.workdir, 'logs', name + '.log')}"
+                    )
+            try:
+                if requests.get(url, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+    def start(self, timeout: float = 180.0):
+        self.create_database()
+        analytics_port = _free_port()
+        self.analytics_url = f"http://127.0.0.1:{analytics_port}"
+        self._spawn(
+            "analytics-service",
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(analytics_port), "--log-level", "warning"],
+            ANALYTICS_SRC,
+            self._env()
+        )
+        self._wait_ready(f"{self.analytics_url}/analytics/db/pool", timeout)
+
+        stubs = self._generate_stubs()
+        prediction_port = _free_port()
+        self.prediction_url = f"http://127.0.0.1:{prediction_port}"
+        env = self._env(
+            REST_HOST="127.0.0.1",
+            REST_PORT=str(prediction_port),
+            GRPC_PORT=str(_free_port()),
+            ANALYTICS_URL=self.analytics_url,
+            MODEL_VERSION="latest",
+            PYTHONPATH=os.pathsep.join(filter(None, [stubs, os.environ.get("PYTHONPATH")])),
+        )
+        if not self.feature_store:
+            env.pop("FEATURE_DB_URL")
+        self._spawn("prediction-service", [sys.executable, "main.py"], PREDICTION_SRC, env)
+        self._wait_ready(f"{self.prediction_url}/health", timeout)
+
+    def stop(self):
+        for _, process in reversed(self._processes):
+            process.terminate()
+        for _, process in self._processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes = []
@@ -0,0 +1,144 @@
+"""
+Replay appointment-booking traffic through prediction-service -> analytics-service.
+
+    python loadtest/run_load_test.py --rates 20,50,100 --duration 30
+
+By default both services are started locally against a file-based MLflow
+registry and an SQLite database in --workdir (see local_stack.py). Pass
+--prediction-url and --database-url (and optionally --analytics-url) to
+load an already running stack instead.
+
+Each rate runs for --duration seconds of Poisson arrivals. It reports:
+- throughput
+- latency percentiles, measured from each request's scheduled send time
+- shed / degraded counts
+- ingest lag: how long after a prediction was served its row appeared in
+  the `predictions` table
+
+Rates run in order. Each waits for the previous rate's rows to be ingested
+(up to --drain-timeout).
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Optional
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prediction-service", "src"))
+
+from ingest_lag import IngestLagProbe  # noqa: E402
+from local_stack import LocalStack  # noqa: E402
+from traffic import BookingGenerator, OpenLoopRunner  # noqa: E402
+
+
+def _ms(value) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def _get_json(url: Optional[str]) -> Any:
+    """Service-side stats for the report; None if unavailable"""
+    if not url:
+        return None
+    try:
+        response = requests.get(url, timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except requests.RequestException:
+        return None
+
+
+def print_step(step):
+    latency, lag = step["latency_ms"], step["ingest"]["lag_ms"]
+    print(
+        f"{step['target_rate']:>8.1f} {step['throughput_rps']:>9.1f} {step['sent']:>7} {step['ok']:>7} "
+        f"{step['rejected'] + step['deadline_exceeded'] + step['errors']:>7} {step['degraded']:>7} "
+        f"{_ms(latency['p50']):>8} {_ms(latency['p90']):>8} {_ms(latency['p99']):>8} "
+        f"{_ms(lag['p50']):>9} {_ms(lag['p99']):>9} {step['ingest']['missing']:>8}",
+        flush=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="20,50,100", help="comma-separated requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per rate")
+    parser.add_argument("--workers", type=int, default=64, help="client threads")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--explain", action="store_true", help="request risk_factors")
+    parser.add_argument("--request-timeout-ms", type=float, default=None, help="X-Request-Timeout-Ms to send")
+    parser.add_argument("--no-feature-store", action="store_true",
+                        help="send history features instead of having the service look them up")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the report here")
+    local = parser.add_argument_group("local stack")
+    local.add_argument("--workdir", default=".loadtest")
+    local.add_argument("--ingest", choices=("http", "log"), default="http",
+                       help="report predictions by POST or through the shared event log")
+    local.add_argument("--train-rows", type=int, default=20000)
+    local.add_argument("--reseed", action="store_true", help="register a new model version")
+    local.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                       help="extra environment for both services (repeatable)")
+    remote = parser.add_argument_group("running stack")
+    remote.add_argument("--prediction-url")
+    remote.add_argument("--analytics-url")
+    remote.add_argument("--database-url", help="SQLAlchemy URL of the analytics database")
+    args = parser.parse_args()
+
+    stack = None
+    if args.prediction_url:
+        if not args.database_url:
+            parser.error("--database-url is required with --prediction-url")
+        prediction_url, database_url = args.prediction_url, args.database_url
+        analytics_url = args.analytics_url
+    else:
+        stack = LocalStack(
+            args.workdir,
+            ingest=args.ingest,
+            feature_store=not args.no_feature_store,
+            extra_env=dict(item.split("=", 1) for item in args.env)
+        )
+        stack.seed_registry(rows=args.train_rows, reseed=args.reseed)
+        stack.start()
+        prediction_url, database_url = stack.prediction_url, stack.database_url
+        analytics_url = stack.analytics_url
+
+    steps = []
+    try:
+        print(
+            f"{'rate':>8} {'tput':>9} {'sent':>7} {'ok':>7} {'failed':>7} {'degr':>7} "
+            f"{'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'lag50_ms':>9} {'lag99_ms':>9} {'missing':>8}"
+        )
+        generator = BookingGenerator(patients=args.patients, seed=args.seed)
+        for i, rate in enumerate(float(value) for value in args.rates.split(",")):
+            probe = IngestLagProbe(database_url)
+            runner = OpenLoopRunner(
+                prediction_url,
+                generator,
+                workers=args.workers,
+                request_timeout_ms=args.request_timeout_ms,
+                explain=args.explain,
+                use_feature_store=not args.no_feature_store,
+                on_reported=probe.reported
+            )
+            probe.start()
+            step = runner.run(rate, args.duration, seed=args.seed + i)
+            step["ingest"] = probe.stop(args.drain_timeout)
+            # admission / prediction cache counters and the analytics DB pool, for the JSON report
+            step["prediction_service"] = _get_json(f"{prediction_url}/admission")
+            step["analytics_pool"] = _get_json(analytics_url and f"{analytics_url}/analytics/db/pool")
+            steps.append(step)
+            print_step(step)
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"steps": steps}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
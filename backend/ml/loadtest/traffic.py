@@ -0,0 +1,284 @@
+"""
+Synthetic appointment-booking traffic and an open-loop load generator.
+
+BookingGenerator models a clinic's patient population: each patient has
+stable attributes and a latent no-show propensity, some patients book far
+more often than others, and appointments fall on weekdays in business
+hours a few days to weeks ahead. Each patient's no-show history is tracked
+as bookings resolve, so the features the services see (and the labels used
+to seed the registry) stay consistent with one another.
+
+OpenLoopRunner sends bookings to the prediction service at a fixed Poisson
+arrival rate, whether or not earlier requests have returned. Latency is
+measured from each request's scheduled send time, so time spent waiting
+for a free client thread counts against the service rather than being
+hidden (coordinated omission).
+"""
+import datetime
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import requests
+
+from feature_encoders import NO_SHOW_ENCODER
+
+# feature_store.STORE_COLUMNS; not imported, as that pulls in the model stack
+STORE_COLUMNS = ("previous_no_shows", "days_since_last_visit")
+
+APPOINTMENT_TYPES = ("routine", "urgent", "follow_up")
+INSURANCE_TYPES = ("private", "public", "none")
+
+
+class Booking(NamedTuple):
+    patient_id: str
+    appointment_id: str
+    start_time: str
+    # string-valued, as the appointment service sends them
+    features: Dict[str, str]
+    # ground truth the outcome is drawn from
+    no_show_probability: float
+
+
+class _Patient:
+    def __init__(self, rng: np.random.Generator, index: int):
+        self.patient_id = f"patient-{index:06d}"
+        self.age = int(np.clip(rng.normal(45, 18), 0, 95))
+        self.gender = "male" if rng.random() < 0.48 else "female"
+        self.insurance = INSURANCE_TYPES[rng.choice(3, p=(0.55, 0.35, 0.10))]
+        self.distance = float(rng.gamma(2.0, 6.0))
+        # per-patient no-show tendency on the logit scale
+        self.propensity = float(rng.normal(0.0, 0.8))
+        self.no_shows = 0
+        self.last_visit: Optional[datetime.datetime] = None
+
+
+class BookingGenerator:
+    def __init__(self, patients: int = 5000, seed: int = 0, start: Optional[datetime.datetime] = None):
+        self._rng = np.random.default_rng(seed)
+        self._patients = [_Patient(self._rng, i) for i in range(patients)]
+        # Zipf-like booking frequency: a few patients book very often
+        weights = np.cumsum(1.0 / np.arange(1, patients + 1) ** 0.8)
+        self._cumulative = weights / weights[-1]
+        self._now = start or datetime.datetime.utcnow().replace(microsecond=0)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> Booking:
+        with self._lock:
+            rng = self._rng
+            index = int(np.searchsorted(self._cumulative, rng.random()))
+            patient = self._patients[min(index, len(self._patients) - 1)]
+            lead_days = int(rng.integers(1, 30))
+            start = (self._now + datetime.timedelta(days=lead_days)).replace(
+                hour=int(rng.integers(8, 17)), minute=int(rng.choice((0, 15, 30, 45))), second=0
+            )
+            # move weekend appointments to the following Monday
+            if start.weekday() >= 5:
+                start += datetime.timedelta(days=7 - start.weekday())
+            appointment_type = APPOINTMENT_TYPES[rng.choice(3, p=(0.6, 0.15, 0.25))]
+            weather = int(rng.choice(4, p=(0.6, 0.25, 0.1, 0.05)))
+            days_since = (start - patient.last_visit).days if patient.last_visit else 365
+
+            logit = (
+                -2.2 + patient.propensity
+                + 0.45 * min(patient.no_shows, 5)
+                + 0.03 * patient.distance
+                + 0.02 * lead_days
+                + 0.25 * weather
+                + {"private": -0.3, "public": 0.1, "none": 0.6}[patient.insurance]
+                + {"routine": 0.0, "urgent": -1.0, "follow_up": 0.3}[appointment_type]
+                - 0.01 * (patient.age - 45)
+            )
+            self._sequence += 1
+            return Booking(
+                patient_id=patient.patient_id,
+                appointment_id=f"appt-{self._sequence:09d}",
+                start_time=start.isoformat(),
+                features={
+                    "age": str(patient.age),
+                    "gender": patient.gender,
+                    # encoder convention: 0-6 for Sun-Sat
+                    "day_of_week": str((start.weekday() + 1) % 7),
+                    "time_of_day": start.strftime("%H:%M"),
+                    "previous_no_shows": str(patient.no_shows),
+                    "days_since_last_visit": str(days_since),
+                    "appointment_type": appointment_type,
+                    "insurance_type": patient.insurance,
+                    "distance_to_clinic": f"{patient.distance:.2f}",
+                    "weather_condition": str(weather),
+                },
+                no_show_probability=1.0 / (1.0 + math.exp(-logit)),
+            )
+
+    def resolve(self, booking: Booking) -> str:
+        """Draw the appointment's outcome and update the patient's history"""
+        with self._lock:
+            no_show = self._rng.random() < booking.no_show_probability
+            patient = self._patients[int(booking.patient_id.rsplit("-", 1)[1])]
+            if no_show:
+                patient.no_shows += 1
+            else:
+                patient.last_visit = datetime.datetime.fromisoformat(booking.start_time)
+            return "NO_SHOW" if no_show else "COMPLETED"
+
+    def training_set(self, rows: int) -> Dict[str, Any]:
+        """{features, labels, timestamps} from `rows` resolved bookings, encoded"""
+        features, labels, timestamps = [], [], []
+        for _ in range(rows):
+            booking = self.next()
+            features.append(encode(booking))
+            labels.append(1 if self.resolve(booking) == "NO_SHOW" else 0)
+            timestamps.append(booking.start_time)
+        return {"features": features, "labels": labels, "timestamps": timestamps}
+
+
+def encode(booking: Booking, omit_store_columns: bool = False) -> Dict[str, float]:
+    """The booking's numeric features, as the REST endpoint takes them"""
+    values = NO_SHOW_ENCODER.encode(booking.features)[0].tolist()
+    encoded = dict(zip(NO_SHOW_ENCODER.columns, values))
+    if omit_store_columns:
+        # left for the prediction service's feature store to fill in
+        for column in STORE_COLUMNS:
+            encoded.pop(column)
+    return encoded
+
+
+def percentiles(values: List[float], points=(50, 90, 99)) -> Dict[str, Optional[float]]:
+    if not values:
+        return {**{f"p{p}": None for p in points}, "max": None}
+    array = np.asarray(values)
+    return {**{f"p{p}": float(np.percentile(array, p)) for p in points}, "max": float(array.max())}
+
+
+class OpenLoopRunner:
+    def __init__(
+        self,
+        prediction_url: str,
+        generator: BookingGenerator,
+        workers: int = 64,
+        timeout: float = 10.0,
+        request_timeout_ms: Optional[float] = None,
+        explain: bool = False,
+        use_feature_store: bool = False,
+        on_reported: Optional[Callable[[float], None]] = None
+    ):
+        self.prediction_url = prediction_url.rstrip("/")
+        self.generator = generator
+        self.workers = workers
+        self.timeout = timeout
+        self.request_timeout_ms = request_timeout_ms
+        self.explain = explain
+        self.use_feature_store = use_feature_store
+        # called with the completion time of every prediction that the
+        # service reports to analytics (non-degraded successes)
+        self.on_reported = on_reported
+        self._local = threading.local()
+        self._outcomes: List[Dict[str, str]] = []
+        self._outcomes_lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, booking: Booking, scheduled: float) -> Dict[str, Any]:
+        headers = {}
+        if self.request_timeout_ms:
+            headers["X-Request-Timeout-Ms"] = str(int(self.request_timeout_ms))
+        body = {
+            "patient_id": booking.patient_id,
+            "appointment_id": booking.appointment_id,
+            "features": encode(booking, omit_store_columns=self.use_feature_store),
+            "start_time": booking.start_time,
+            "explain": self.explain,
+        }
+        try:
+            response = self._session().post(
+                f"{self.prediction_url}/predict/no-show", json=body, headers=headers, timeout=self.timeout
+            )
+            status = response.status_code
+            degraded = status == 200 and response.json().get("degraded", False)
+        except requests.RequestException:
+            status, degraded = None, False
+        finished = time.monotonic()
+        if status == 200 and not degraded and self.on_reported is not None:
+            self.on_reported(finished)
+        if status == 200:
+            # the appointment happens, feeding the patient's later bookings
+            outcome = self.generator.resolve(booking)
+            if self.use_feature_store:
+                with self._outcomes_lock:
+                    self._outcomes.append({
+                        "patient_id": booking.patient_id,
+                        "appointment_id": booking.appointment_id,
+                        "status": outcome,
+                        "start_time": booking.start_time,
+                    })
+        return {"latency": finished - scheduled, "status": status, "degraded": degraded}
+
+    def flush_outcomes(self):
+        """Post resolved appointments to the feature store, as the appointment service would"""
+        with self._outcomes_lock:
+            events, self._outcomes = self._outcomes, []
+        if events:
+            self._session().post(
+                f"{self.prediction_url}/features/appointment-events", json=events, timeout=self.timeout
+            ).raise_for_status()
+
+    def run(self, rate: float, duration: float, seed: int = 0) -> Dict[str, Any]:
+        """Send Poisson arrivals at `rate` per second for `duration` seconds"""
+        rng = np.random.default_rng(seed)
+        arrivals = np.cumsum(rng.exponential(1.0 / rate, size=int(rate * duration * 1.2) + 16))
+        arrivals = arrivals[arrivals < duration]
+
+        stop_outcomes = threading.Event()
+
+        def post_outcomes():
+            while not stop_outcomes.wait(1.0):
+                try:
+                    self.flush_outcomes()
+                except requests.RequestException:
+                    pass
+
+        outcome_thread = None
+        if self.use_feature_store:
+            outcome_thread = threading.Thread(target=post_outcomes, name="outcomes", daemon=True)
+            outcome_thread.start()
+
+        futures = []
+        started = time.monotonic()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="load") as pool:
+            for offset in arrivals:
+                scheduled = started + offset
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(self._send, self.generator.next(), scheduled))
+        elapsed = time.monotonic() - started
+        stop_outcomes.set()
+        if outcome_thread is not None:
+            outcome_thread.join()
+            try:
+                self.flush_outcomes()
+            except requests.RequestException:
+                pass
+
+        results = [future.result() for future in futures]
+        ok = [r for r in results if r["status"] == 200]
+        return {
+            "target_rate": rate,
+            "duration_s": elapsed,
+            "sent": len(results),
+            "ok": len(ok),
+            "degraded": sum(1 for r in ok if r["degraded"]),
+            "rejected": sum(1 for r in results if r["status"] == 429),
+            "deadline_exceeded": sum(1 for r in results if r["status"] == 504),
+            "errors": sum(1 for r in results if r["status"] not in (200, 429, 504)),
+            "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+            "latency_ms": percentiles([1000.0 * r["latency"] for r in ok]),
+        }
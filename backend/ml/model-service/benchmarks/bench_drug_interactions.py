@@ -0,0 +1,64 @@
+"""
+Drug-interaction index: build, load and per-patient check latency on a
+synthetic knowledge base, for increasingly long medication lists.
+
+    python benchmarks/bench_drug_interactions.py [--drugs 20000] [--pairs 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from drug_interactions import DrugInteractionIndex  # noqa: E402
+
+SEVERITIES = ("minor", "moderate", "major")
+
+
+def synthetic_rows(drugs: int, pairs: int, rng: np.random.Generator):
+    a = rng.integers(0, drugs, size=pairs)
+    b = rng.integers(0, drugs, size=pairs)
+    severity = rng.integers(0, len(SEVERITIES), size=pairs)
+    for i in range(pairs):
+        yield f"drug-{a[i]}", f"drug-{b[i]}", SEVERITIES[severity[i]], f"interaction class {i % 500}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drugs", type=int, default=20000)
+    parser.add_argument("--pairs", type=int, default=1000000)
+    parser.add_argument("--patients", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    started = time.perf_counter()
+    built = DrugInteractionIndex.build(synthetic_rows(args.drugs, args.pairs, rng))
+    print(f"build: {time.perf_counter() - started:.2f}s, {built.num_pairs} pairs, {len(built.names)} drugs")
+
+    with tempfile.TemporaryDirectory() as directory:
+        built.save(directory)
+        started = time.perf_counter()
+        index = DrugInteractionIndex.load(directory)
+        print(f"load (mmap): {1000 * (time.perf_counter() - started):.1f}ms")
+
+        print(f"{'meds':>5} {'pairs':>6} {'us/patient':>11} {'hits/patient':>13}")
+        for meds in (10, 20, 50, 100):
+            patients = [
+                [f"drug-{d}" for d in rng.choice(len(index.names), size=meds, replace=False)]
+                for _ in range(args.patients)
+            ]
+            index.check(patients[0])
+            hits = 0
+            started = time.perf_counter()
+            for medications in patients:
+                hits += len(index.check(medications))
+            elapsed = (time.perf_counter() - started) / args.patients
+            print(f"{meds:>5} {meds * (meds - 1) // 2:>6} {1e6 * elapsed:>11.1f} {hits / args.patients:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
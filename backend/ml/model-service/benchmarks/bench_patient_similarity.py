@@ -0,0 +1,65 @@
+"""
+Similar-patient index: insert throughput, k-NN latency and recall of the
+partitioned (IVF) index against exact search on synthetic clustered data.
+
+    python benchmarks/bench_patient_similarity.py [--patients 1000000] [--k 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from feature_encoders import PATIENT_PROFILE_ENCODER  # noqa: E402
+from patient_similarity import VectorIndex  # noqa: E402
+
+
+def synthetic_patients(count: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(500, PATIENT_PROFILE_ENCODER.width)) * 4
+    noise = rng.normal(size=(count, PATIENT_PROFILE_ENCODER.width))
+    return (centers[rng.integers(0, len(centers), size=count)] + noise).astype(np.float32)
+
+
+def timed_search(index: VectorIndex, queries: np.ndarray, k: int, batch: int):
+    started = time.perf_counter()
+    results = [index.search(queries[i:i + batch], k) for i in range(0, len(queries), batch)]
+    elapsed = (time.perf_counter() - started) / len(queries)
+    return np.vstack([ids for _, ids in results]), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--chunk", type=int, default=50000, help="rows per incremental insert")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    patients = synthetic_patients(args.patients, rng)
+    queries = patients[rng.choice(args.patients, size=args.queries, replace=False)] + 0.05
+
+    exact = VectorIndex(PATIENT_PROFILE_ENCODER.width, ivf_threshold=args.patients + 1)
+    exact.add(patients)
+    partitioned = VectorIndex(PATIENT_PROFILE_ENCODER.width, ivf_threshold=min(100000, args.patients))
+    started = time.perf_counter()
+    for start in range(0, args.patients, args.chunk):
+        partitioned.add(patients[start:start + args.chunk])
+    print(f"incremental insert (incl. partitioning): {time.perf_counter() - started:.2f}s")
+
+    print(f"{'index':>8} {'nprobe':>6} {'batch':>5} {'ms/query':>9} {'recall@k':>9}")
+    truth, elapsed = timed_search(exact, queries, args.k, batch=32)
+    print(f"{'exact':>8} {'-':>6} {32:>5} {1000 * elapsed:>9.3f} {1.0:>9.3f}")
+    for nprobe in (4, 8, 16, 32):
+        partitioned.nprobe = nprobe
+        for batch in (1, 32):
+            found, elapsed = timed_search(partitioned, queries, args.k, batch)
+            recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(truth, found)])
+            print(f"{'ivf':>8} {nprobe:>6} {batch:>5} {1000 * elapsed:>9.3f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
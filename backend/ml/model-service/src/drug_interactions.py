@@ -0,0 +1,266 @@
+"""
+Indexed drug-interaction knowledge base.
+
+The knowledge base is compiled from a CSV of interacting pairs
+(drug_a, drug_b, severity, description) into a versioned subdirectory
+of the index directory, named by the CURRENT pointer file:
+
+    CURRENT            name of the live version, replaced atomically
+    index-*/
+      names.json         interned, normalized drug names; position = drug id
+      descriptions.json  de-duplicated interaction descriptions
+      pair_keys.npy      sorted uint64 keys (low_id << 32 | high_id)
+      severity.npy       uint8 RiskLevel value per pair
+      description.npy    uint32 index into descriptions.json per pair
+
+A rebuild writes a new version and only then swaps CURRENT, so readers
+never see a mix of old and new files. Workers that still map an older
+version keep reading it until they reload.
+
+The .npy arrays are memory-mapped read-only, so loading is near-instant
+and every worker process shares the same page-cache copy. A medication
+list is checked in one vectorized pass: all id pairs are formed at once
+and looked up with a single searchsorted over the pair keys.
+
+    python src/drug_interactions.py build interactions.csv /data/drug-index
+"""
+import csv
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Severity labels in the source file -> healthcare.common.v1.RiskLevel
+SEVERITY_LEVELS = {
+    'minor': 1,
+    'low': 1,
+    'moderate': 2,
+    'medium': 2,
+    'major': 3,
+    'high': 3,
+    'contraindicated': 3,
+}
+
+# Pointer file naming the live version directory
+CURRENT_FILE = 'CURRENT'
+# Versions kept on disk: the live one and its predecessor, still mapped by
+# workers that haven't reloaded
+KEEP_VERSIONS = 2
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_drug_name(name: str) -> str:
+    return _WHITESPACE.sub(' ', name.strip().lower())
+
+
+def _pair_key(a: int, b: int) -> int:
+    low, high = (a, b) if a < b else (b, a)
+    return (low << 32) | high
+
+
+class Interaction(NamedTuple):
+    medication1: str
+    medication2: str
+    risk_level: int
+    description: str
+
+
+class DrugInteractionIndex:
+    def __init__(
+        self,
+        names: List[str],
+        descriptions: List[str],
+        pair_keys: np.ndarray,
+        severity: np.ndarray,
+        description_ids: np.ndarray
+    ):
+        self.names = names
+        self.descriptions = descriptions
+        self.pair_keys = pair_keys
+        self.severity = severity
+        self.description_ids = description_ids
+        self._ids: Dict[str, int] = {name: i for i, name in enumerate(names)}
+
+    @property
+    def num_pairs(self) -> int:
+        return int(self.pair_keys.shape[0])
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[str, str, str, str]]) -> "DrugInteractionIndex":
+        """Intern drug names and build the sorted pair table from source rows"""
+        ids: Dict[str, int] = {}
+        description_ids: Dict[str, int] = {}
+        pairs: Dict[int, Tuple[int, int]] = {}
+
+        for drug_a, drug_b, severity, description in rows:
+            a, b = normalize_drug_name(drug_a), normalize_drug_name(drug_b)
+            if not a or not b or a == b:
+                continue
+            level = SEVERITY_LEVELS.get(severity.strip().lower())
+            if level is None:
+                raise ValueError(f"Unknown severity '{severity}' for {drug_a} / {drug_b}")
+            key = _pair_key(ids.setdefault(a, len(ids)), ids.setdefault(b, len(ids)))
+            description_id = description_ids.setdefault(description.strip(), len(description_ids))
+            # keep the most severe entry when a pair is listed twice
+            if key not in pairs or pairs[key][0] < level:
+                pairs[key] = (level, description_id)
+
+        keys = np.fromiter(sorted(pairs), dtype=np.uint64, count=len(pairs))
+        return cls(
+            names=list(ids),
+            descriptions=list(description_ids),
+            pair_keys=keys,
+            severity=np.array([pairs[int(key)][0] for key in keys], dtype=np.uint8),
+            description_ids=np.array([pairs[int(key)][1] for key in keys], dtype=np.uint32)
+        )
+
+    @classmethod
+    def from_csv(cls, path: str) -> "DrugInteractionIndex":
+        with open(path, newline='') as source:
+            reader = csv.DictReader(source)
+            return cls.build(
+                (row['drug_a'], row['drug_b'], row['severity'], row.get('description') or '')
+                for row in reader
+            )
+
+    def save(self, directory: str):
+        """
+        Write the index into a new version directory, then atomically point
+        CURRENT at it. Versions beyond the last KEEP_VERSIONS are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        version_dir = tempfile.mkdtemp(prefix='index-', dir=directory)
+        os.chmod(version_dir, 0o755)
+        files = [
+            ('names.json', self.names),
+            ('descriptions.json', self.descriptions),
+            ('severity.npy', self.severity),
+            ('description.npy', self.description_ids),
+            ('pair_keys.npy', self.pair_keys),
+        ]
+        for name, value in files:
+            if name.endswith('.json'):
+                with open(os.path.join(version_dir, name), 'w') as out:
+                    json.dump(value, out)
+            else:
+                with open(os.path.join(version_dir, name), 'wb') as out:
+                    np.save(out, value)
+
+        tmp = os.path.join(directory, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as out:
+            out.write(os.path.basename(version_dir))
+        os.replace(tmp, os.path.join(directory, CURRENT_FILE))
+        _prune_versions(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "DrugInteractionIndex":
+        """Memory-map the live version of a saved index"""
+        directory = current_version(directory)
+        with open(os.path.join(directory, 'names.json')) as source:
+            names = json.load(source)
+        with open(os.path.join(directory, 'descriptions.json')) as source:
+            descriptions = json.load(source)
+        return cls(
+            names=names,
+            descriptions=descriptions,
+            pair_keys=np.load(os.path.join(directory, 'pair_keys.npy'), mmap_mode='r'),
+            severity=np.load(os.path.join(directory, 'severity.npy'), mmap_mode='r'),
+            description_ids=np.load(os.path.join(directory, 'description.npy'), mmap_mode='r')
+        )
+
+    def lookup_ids(self, medications: Iterable[str]) -> Tuple[np.ndarray, List[str]]:
+        """Drug ids of the known medications and their names as given"""
+        ids, given = [], []
+        seen = set()
+        for medication in medications:
+            drug_id = self._ids.get(normalize_drug_name(medication))
+            if drug_id is not None and drug_id not in seen:
+                seen.add(drug_id)
+                ids.append(drug_id)
+                given.append(medication)
+        return np.array(ids, dtype=np.uint64), given
+
+    def check(self, medications: Iterable[str]) -> List[Interaction]:
+        """All known interactions among `medications`, most severe first"""
+        ids, given = self.lookup_ids(medications)
+        if ids.shape[0] < 2 or self.num_pairs == 0:
+            return []
+
+        left, right = np.triu_indices(ids.shape[0], k=1)
+        low = np.minimum(ids[left], ids[right])
+        high = np.maximum(ids[left], ids[right])
+        keys = (low << np.uint64(32)) | high
+
+        positions = np.searchsorted(self.pair_keys, keys)
+        positions[positions == self.num_pairs] = 0
+        hits = np.nonzero(self.pair_keys[positions] == keys)[0]
+
+        interactions = [
+            Interaction(
+                medication1=given[left[hit]],
+                medication2=given[right[hit]],
+                risk_level=int(self.severity[positions[hit]]),
+                description=self.descriptions[int(self.description_ids[positions[hit]])]
+            )
+            for hit in hits
+        ]
+        interactions.sort(key=lambda interaction: -interaction.risk_level)
+        return interactions
+
+
+def current_version(directory: str) -> str:
+    """
+    The live version directory of an index. Indexes written before
+    versioning have their files directly in `directory`.
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as source:
+            return os.path.join(directory, source.read().strip())
+    except FileNotFoundError:
+        return directory
+
+
+def index_exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(current_version(directory), 'pair_keys.npy'))
+
+
+def _prune_versions(directory: str):
+    """Remove version directories older than the last KEEP_VERSIONS"""
+    versions = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_dir() and entry.name.startswith('index-')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    live = os.path.basename(current_version(directory))
+    for entry in versions[:-KEEP_VERSIONS]:
+        if entry.name != live:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_index_from_env() -> Optional[DrugInteractionIndex]:
+    """
+    Load the index at DRUG_INTERACTION_INDEX, building it first from
+    DRUG_INTERACTION_SOURCE if it hasn't been built yet.
+    """
+    directory = os.getenv("DRUG_INTERACTION_INDEX")
+    if not directory:
+        return None
+    if not index_exists(directory):
+        source = os.getenv("DRUG_INTERACTION_SOURCE")
+        if not source:
+            raise FileNotFoundError(f"No drug interaction index at {directory}")
+        DrugInteractionIndex.from_csv(source).save(directory)
+    return DrugInteractionIndex.load(directory)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        sys.exit("usage: drug_interactions.py build <source.csv> <index_dir>")
+    index = DrugInteractionIndex.from_csv(sys.argv[2])
+    index.save(sys.argv[3])
+    print(f"Indexed {len(index.names)} drugs, {index.num_pairs} interacting pairs")
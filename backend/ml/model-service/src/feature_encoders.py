@@ -0,0 +1,167 @@
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+
+# Element type of PackedFeatures.values
+PACKED_DTYPE = np.dtype('<f4')
+
+
+def _categorical(mapping: Dict[str, int], default: int) -> Callable[[str], float]:
+    return lambda value: float(mapping.get(value, default))
+
+
+def _gender(value: str) -> float:
+    return 1.0 if value.lower() == 'male' else 0.0
+
+
+def _day_of_week(value: str) -> float:
+    return float(int(value) % 7)  # 0-6 for Sun-Sat
+
+
+def _time_of_day(value: str) -> float:
+    return int(value.split(':')[0]) / 24.0  # Normalize to 0-1
+
+
+class FeatureEncoder:
+    """
+    Turns a request's string-valued feature map into a float32 row for one
+    model. String values go through the column's parser (plain float() if
+    it has none); missing columns take their default.
+
+    Clients that already hold encoded features send them as a PackedFeatures
+    block tagged with `schema_id`; decode_packed() views it as an array
+    without any per-field parsing.
+    """
+
+    def __init__(
+        self,
+        schema_id: str,
+        columns: List[str],
+        parsers: Optional[Dict[str, Callable[[str], float]]] = None,
+        defaults: Optional[Dict[str, float]] = None
+    ):
+        self.schema_id = schema_id
+        self.columns = list(columns)
+        parsers = parsers or {}
+        defaults = defaults or {}
+        self._parsers = [parsers.get(column, float) for column in self.columns]
+        self._defaults = [float(defaults.get(column, 0.0)) for column in self.columns]
+
+    @property
+    def width(self) -> int:
+        return len(self.columns)
+
+    def encode_into(self, data: Mapping[str, Any], out: np.ndarray):
+        """Write the encoded features for `data` into a length-F row"""
+        for i, (column, parse, default) in enumerate(zip(self.columns, self._parsers, self._defaults)):
+            value = data.get(column)
+            if value is None or value == '':
+                out[i] = default
+            elif isinstance(value, str):
+                out[i] = parse(value)
+            else:
+                out[i] = float(value)
+
+    def encode(self, data: Mapping[str, Any]) -> np.ndarray:
+        """Encode one request as a (1, F) batch"""
+        row = np.empty((1, self.width), dtype=np.float32)
+        self.encode_into(data, row[0])
+        return row
+
+    def encode_batch(self, rows: List[Mapping[str, Any]]) -> np.ndarray:
+        """Encode several requests as an (N, F) batch"""
+        batch = np.empty((len(rows), self.width), dtype=np.float32)
+        for i, data in enumerate(rows):
+            self.encode_into(data, batch[i])
+        return batch
+
+    def decode_packed(self, packed: Any) -> np.ndarray:
+        """
+        View a PackedFeatures message as a read-only (N, F) float32 array.
+        No copy is made; raises ValueError if it doesn't match this schema.
+        """
+        if packed.schema_id != self.schema_id:
+            raise ValueError(f"Expected feature schema '{self.schema_id}', got '{packed.schema_id}'")
+        if packed.columns != self.width:
+            raise ValueError(f"Schema '{self.schema_id}' has {self.width} columns, got {packed.columns}")
+        values = np.frombuffer(packed.values, dtype=PACKED_DTYPE)
+        if values.size != packed.rows * packed.columns:
+            raise ValueError(
+                f"Packed block holds {values.size} values, expected {packed.rows} x {packed.columns}"
+            )
+        return values.reshape(packed.rows, packed.columns)
+
+    def pack(self, features: np.ndarray) -> Dict[str, Any]:
+        """Fields of a PackedFeatures message for an (N, F) batch"""
+        features = np.ascontiguousarray(features, dtype=PACKED_DTYPE).reshape(-1, self.width)
+        return {
+            'schema_id': self.schema_id,
+            'rows': features.shape[0],
+            'columns': self.width,
+            'values': features.tobytes(),
+        }
+
+
+NO_SHOW_ENCODER = FeatureEncoder(
+    schema_id='no_show.v1',
+    columns=[
+        'age', 'gender', 'day_of_week', 'time_of_day',
+        'previous_no_shows', 'days_since_last_visit',
+        'appointment_type', 'insurance_type',
+        'distance_to_clinic', 'weather_condition'
+    ],
+    parsers={
+        'gender': _gender,
+        'day_of_week': _day_of_week,
+        'time_of_day': _time_of_day,
+        'appointment_type': _categorical({'routine': 0, 'urgent': 1, 'follow_up': 2}, 0),
+        'insurance_type': _categorical({'private': 0, 'public': 1, 'none': 2}, 2),
+    }
+)
+
+TREATMENT_OUTCOME_ENCODER = FeatureEncoder(
+    schema_id='treatment_outcome.v1',
+    columns=[
+        'age', 'gender', 'condition_severity', 'previous_treatments',
+        'comorbidity_count', 'treatment_type', 'adherence_score',
+        'insurance_type'
+    ],
+    parsers={
+        'gender': _gender,
+        'treatment_type': _categorical({'medication': 0, 'therapy': 1, 'surgery': 2, 'combined': 3}, 0),
+        'insurance_type': _categorical({'private': 0, 'public': 1, 'none': 2}, 2),
+    }
+)
+
+READMISSION_RISK_ENCODER = FeatureEncoder(
+    schema_id='readmission_risk.v1',
+    columns=[
+        'age', 'gender', 'length_of_stay', 'previous_admissions',
+        'chronic_conditions', 'medication_count', 'emergency_visits_6m',
+        'discharge_disposition'
+    ],
+    parsers={
+        'gender': _gender,
+        'discharge_disposition': _categorical({'home': 0, 'home_care': 1, 'facility': 2, 'other': 3}, 0),
+    }
+)
+
+# Clinical profile used to find similar past patients for recommendations
+PATIENT_PROFILE_ENCODER = FeatureEncoder(
+    schema_id='patient_profile.v1',
+    columns=[
+        'age', 'gender', 'condition_severity', 'comorbidity_count',
+        'chronic_conditions', 'previous_treatments', 'previous_admissions',
+        'medication_count'
+    ],
+    parsers={
+        'gender': _gender,
+    }
+)
+
+FEATURE_SCHEMAS = {
+    encoder.schema_id: encoder
+    for encoder in (
+        NO_SHOW_ENCODER, TREATMENT_OUTCOME_ENCODER, READMISSION_RISK_ENCODER, PATIENT_PROFILE_ENCODER
+    )
+}
@@ -0,0 +1,331 @@
+"""
+Parallel hyperparameter search for the no-show model.
+
+Trials run in a spawn-based process pool (TensorFlow is not fork-safe),
+each process pinned to `threads_per_trial` intra-op threads so that
+`workers * threads_per_trial` stays within the CPU count. The encoded
+training and validation arrays are copied once into a shared-memory block
+that every worker maps read-only instead of receiving a pickled copy per
+trial.
+
+Strategies:
+    grid     every combination of the search space
+    random   `max_trials` samples from it
+    halving  successive halving: all candidates train for `min_epochs`, the
+             best 1/eta continue (from their saved weights) for eta times as
+             many epochs, and so on up to `max_epochs`
+
+Grid and random trials are pruned once past `min_epochs` if their
+validation AUC trails the best finished trial by more than `prune_margin`.
+"""
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+LOGGER = logging.getLogger("hyperparameter_search")
+
+DEFAULT_SPACE = {
+    "layer_sizes": [(64, 32, 16), (128, 64, 32), (32, 16), (64, 32)],
+    "dropout": [0.1, 0.2, 0.3],
+    "epochs": [20, 50],
+    "batch_size": [32, 64, 128],
+}
+
+STRATEGIES = ("grid", "random", "halving")
+
+
+class TrialResult(NamedTuple):
+    trial_id: int
+    params: Dict[str, Any]
+    epochs: int
+    val_auc: float
+    val_loss: float
+    pruned: bool
+    weights_path: str
+    seconds: float
+
+
+def grid_candidates(space: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_candidates(space: Dict[str, Sequence[Any]], count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Up to `count` distinct samples from the grid"""
+    candidates = grid_candidates(space)
+    random.Random(seed).shuffle(candidates)
+    return candidates[:count]
+
+
+class SharedDataset:
+    """
+    X_train, y_train, X_val, y_val packed into one float32 shared-memory
+    block. The parent owns the block; workers attach by name.
+    """
+
+    NAMES = ("X_train", "y_train", "X_val", "y_val")
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        arrays = {name: np.ascontiguousarray(arrays[name], dtype=np.float32) for name in self.NAMES}
+        self.layout: List[Tuple[str, Tuple[int, ...], int]] = []
+        offset = 0
+        for name in self.NAMES:
+            self.layout.append((name, arrays[name].shape, offset))
+            offset += arrays[name].nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (name, shape, start), array in zip(self.layout, arrays.values()):
+            np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf, offset=start)[...] = array
+
+    @property
+    def handle(self) -> Tuple[str, List[Tuple[str, Tuple[int, ...], int]]]:
+        return self.shm.name, self.layout
+
+    @staticmethod
+    def attach(handle) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray]]:
+        name, layout = handle
+        shm = shared_memory.SharedMemory(name=name)
+        arrays = {}
+        for array_name, shape, start in layout:
+            view = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=start)
+            view.flags.writeable = False
+            arrays[array_name] = view
+        return shm, arrays
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# ---- worker process state, set once by _init_worker ----
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(handle, best_auc, threads: int):
+    # must run before TensorFlow creates its thread pools
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    shm, arrays = SharedDataset.attach(handle)
+    # keep the mapping alive for the life of the process
+    _worker.update(shm=shm, arrays=arrays, best_auc=best_auc)
+
+
+def _run_trial(
+    trial_id: int,
+    params: Dict[str, Any],
+    epochs: int,
+    weights_dir: str,
+    initial_epoch: int = 0,
+    min_epochs: int = 0,
+    prune_margin: Optional[float] = None
+) -> TrialResult:
+    import tensorflow as tf
+    from models.no_show_model import NoShowPredictionModel
+
+    started = time.perf_counter()
+    arrays, best_auc = _worker["arrays"], _worker["best_auc"]
+    model = NoShowPredictionModel().build_model(params["layer_sizes"], params["dropout"])
+    weights_path = os.path.join(weights_dir, f"trial-{trial_id}.weights.h5")
+    if initial_epoch > 0:
+        model.load_weights(weights_path)
+
+    class PruneWeakTrial(tf.keras.callbacks.Callback):
+        pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            if prune_margin is None or epoch + 1 < min_epochs:
+                return
+            if logs.get("val_auc", 0.0) < best_auc.value - prune_margin:
+                self.pruned = True
+                self.model.stop_training = True
+
+    pruner = PruneWeakTrial()
+
+    history = model.fit(
+        arrays["X_train"], arrays["y_train"],
+        validation_data=(arrays["X_val"], arrays["y_val"]),
+        initial_epoch=initial_epoch,
+        epochs=epochs,
+        batch_size=params["batch_size"],
+        verbose=0,
+        callbacks=[
+            tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True),
+            pruner,
+        ]
+    )
+    model.save_weights(weights_path)
+
+    val_loss, _, val_auc = model.evaluate(arrays["X_val"], arrays["y_val"], verbose=0)
+    if not pruner.pruned:
+        with best_auc.get_lock():
+            best_auc.value = max(best_auc.value, val_auc)
+    return TrialResult(
+        trial_id=trial_id,
+        params=params,
+        epochs=initial_epoch + len(history.history["loss"]),
+        val_auc=float(val_auc),
+        val_loss=float(val_loss),
+        pruned=pruner.pruned,
+        weights_path=weights_path,
+        seconds=time.perf_counter() - started
+    )
+
+
+class HyperparameterSearch:
+    def __init__(
+        self,
+        space: Optional[Dict[str, Sequence[Any]]] = None,
+        strategy: str = "random",
+        max_trials: int = 20,
+        workers: int = 0,
+        threads_per_trial: int = 1,
+        min_epochs: int = 5,
+        max_epochs: int = 50,
+        eta: int = 3,
+        prune_margin: Optional[float] = 0.02,
+        seed: int = 0
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy '{strategy}'; expected one of {STRATEGIES}")
+        self.space = {**DEFAULT_SPACE, **(space or {})}
+        self.strategy = strategy
+        self.max_trials = max_trials
+        self.threads_per_trial = max(1, threads_per_trial)
+        self.workers = workers or max(1, (os.cpu_count() or 1) // self.threads_per_trial)
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.eta = eta
+        self.prune_margin = prune_margin
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls, **overrides) -> "HyperparameterSearch":
+        options = {
+            "strategy": os.getenv("TUNING_STRATEGY", "random"),
+            "max_trials": int(os.getenv("TUNING_MAX_TRIALS", "20")),
+            "workers": int(os.getenv("TUNING_WORKERS", "0")),
+            "threads_per_trial": int(os.getenv("TUNING_THREADS_PER_TRIAL", "1")),
+        }
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**options)
+
+    def candidates(self) -> List[Dict[str, Any]]:
+        if self.strategy == "grid":
+            return grid_candidates(self.space)
+        space = self.space
+        if self.strategy == "halving":
+            # the epoch budget is set per rung, not searched
+            space = {name: values for name, values in space.items() if name != "epochs"}
+        return random_candidates(space, self.max_trials, self.seed)
+
+    def run(self, arrays: Dict[str, np.ndarray], weights_dir: str) -> List[TrialResult]:
+        """
+        Run the search over encoded arrays (X_train, y_train, X_val, y_val).
+        Trial weights are written to `weights_dir`. Returns every trial's
+        final result, best first.
+        """
+        dataset = SharedDataset(arrays)
+        context = mp.get_context("spawn")
+        best_auc = context.Value('d', 0.0)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(dataset.handle, best_auc, self.threads_per_trial)
+            ) as pool:
+                if self.strategy == "halving":
+                    results = self._successive_halving(pool, weights_dir)
+                else:
+                    results = self._run_all(pool, weights_dir)
+        finally:
+            dataset.close()
+        return sorted(results, key=lambda result: (result.pruned, -result.val_auc))
+
+    def _run_all(self, pool, weights_dir: str) -> List[TrialResult]:
+        futures = [
+            pool.submit(
+                _run_trial, trial_id, params, params["epochs"], weights_dir,
+                min_epochs=self.min_epochs, prune_margin=self.prune_margin
+            )
+            for trial_id, params in enumerate(self.candidates())
+        ]
+        return [future.result() for future in futures]
+
+    def _successive_halving(self, pool, weights_dir: str) -> List[TrialResult]:
+        trials = dict(enumerate(self.candidates()))
+        finished: Dict[int, TrialResult] = {}
+        survivors = list(trials)
+        budget = self.min_epochs
+        while True:
+            futures = [
+                pool.submit(
+                    _run_trial, trial_id, trials[trial_id], budget, weights_dir,
+                    initial_epoch=finished[trial_id].epochs if trial_id in finished else 0
+                )
+                for trial_id in survivors
+            ]
+            for future in futures:
+                result = future.result()
+                finished[result.trial_id] = result
+            LOGGER.info(f"Halving rung at {budget} epochs: {len(survivors)} trials")
+            if len(survivors) <= 1 or budget >= self.max_epochs:
+                break
+            ranked = sorted(survivors, key=lambda trial_id: -finished[trial_id].val_auc)
+            survivors = ranked[:max(1, len(ranked) // self.eta)]
+            budget = min(budget * self.eta, self.max_epochs)
+        # only trials that made the last rung count as finished candidates
+        return [
+            result if result.trial_id in survivors else result._replace(pruned=True)
+            for result in finished.values()
+        ]
+
+
+def tune_and_register(
+    model: Any,
+    training_data: Dict[str, Any],
+    validation_data: Dict[str, Any],
+    version: str,
+    search: HyperparameterSearch
+) -> Dict[str, Any]:
+    """
+    Search hyperparameters for `model` (a NoShowPredictionModel), load the
+    best trial's weights into it and save and register it through
+    model.save_model(). `version` names the run; the result's
+    model_version is the registered version.
+    """
+    arrays = {
+        "X_train": np.vstack([model.preprocess_data(d) for d in training_data['features']]),
+        "y_train": np.asarray(training_data['labels']),
+        "X_val": np.vstack([model.preprocess_data(d) for d in validation_data['features']]),
+        "y_val": np.asarray(validation_data['labels']),
+    }
+    with tempfile.TemporaryDirectory() as weights_dir:
+        results = search.run(arrays, weights_dir)
+        best = results[0]
+        model.build_model(best.params["layer_sizes"], best.params["dropout"])
+        model.model.load_weights(best.weights_path)
+    _, model.training_cutoff = model.rows_since(training_data, None)
+
+    metrics = {"val_auc": best.val_auc, "val_loss": best.val_loss}
+    metrics.update(model.build_quantized_variants(arrays["X_val"], arrays["y_val"]))
+    model.build_drift_baseline(arrays["X_train"])
+    registered_version = model.save_model(version)
+    trials = [
+        {key: value for key, value in result._asdict().items() if key != "weights_path"}
+        for result in results
+    ]
+    return {"model_version": registered_version, "best": trials[0], "metrics": metrics, "trials": trials}
@@ -1,22 +1,59 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import os
 import mlflow
+from models.evaluation import evaluate_many, iter_chunks, iter_csv_chunks
 from models.no_show_model import NoShowPredictionModel
+from hyperparameter_search import HyperparameterSearch, tune_and_register
 
 app = FastAPI(title="Healthcare ML Model Service")
 
 # Initialize models
 no_show_model = NoShowPredictionModel()
 
+# Evaluation keeps at most this many versions loaded at once
+EVALUATION_MAX_MODELS = max(1, int(os.getenv("EVALUATION_MAX_MODELS", "4")))
+# dataset_path is resolved under this directory
+EVALUATION_DATA_DIR = os.getenv("EVALUATION_DATA_DIR", "/data/evaluation")
+
 class PredictionRequest(BaseModel):
     patient_id: str
     features: Dict[str, Any]
 
 class TrainingRequest(BaseModel):
+    # {features, labels} plus optional ISO-8601 appointment `timestamps`
+    training_data: Dict[str, Any]
+    validation_data: Dict[str, Any]
+    # names the MLflow run; the registry assigns the version number returned
+    model_version: str
+    # "full" trains from scratch; "incremental" fine-tunes base_version on
+    # the training rows newer than its recorded training cutoff
+    mode: str = "full"
+    base_version: str = "latest"
+    epochs: Optional[int] = None
+    learning_rate: float = 1e-4
+
+class TuningRequest(BaseModel):
     training_data: Dict[str, Any]
     validation_data: Dict[str, Any]
     model_version: str
+    # unset fields fall back to TUNING_* environment defaults
+    strategy: Optional[str] = None
+    max_trials: Optional[int] = None
+    workers: Optional[int] = None
+    threads_per_trial: Optional[int] = None
+    search_space: Optional[Dict[str, List[Any]]] = None
+
+class EvaluationRequest(BaseModel):
+    # either in-memory {features, labels} or an encoded CSV on the service's disk
+    test_data: Optional[Dict[str, Any]] = None
+    dataset_path: Optional[str] = None
+    label_column: str = "no_show"
+    # registered versions to compare; default: all of them
+    versions: Optional[List[str]] = None
+    chunk_size: int = 10000
 
 @app.post("/models/no-show/predict")
 async def predict_no_show(request: PredictionRequest):
@@ -35,21 +72,138 @@ async def predict_no_show(request: PredictionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/models/no-show/train")
-async def train_no_show_model(request: TrainingRequest):
+def train_no_show_model(request: TrainingRequest):
+    """
+    Train in a separate model instance and swap it in only once registered,
+    so the serving model is untouched while training and after a rejection.
+    """
+    global no_show_model
     try:
-        # Train the model
-        metrics = no_show_model.train(
-            request.training_data,
-            request.validation_data
-        )
+        candidate = NoShowPredictionModel()
+        if request.mode == "incremental":
+            candidate.load_model(request.base_version)
+            cutoff = candidate.load_training_cutoff(request.base_version)
+            metrics = candidate.fine_tune(
+                request.training_data,
+                request.validation_data,
+                since=cutoff,
+                epochs=request.epochs or 10,
+                learning_rate=request.learning_rate
+            )
+            if not metrics["accepted"]:
+                # keep serving the base version
+                return {
+                    "model_version": None,
+                    "base_version": request.base_version,
+                    "metrics": metrics
+                }
+        elif request.mode == "full":
+            # Train the model from scratch
+            candidate.build_model()
+            metrics = candidate.train(
+                request.training_data,
+                request.validation_data,
+                epochs=request.epochs or 50
+            )
+        else:
+            raise ValueError(f"Unknown training mode '{request.mode}'")
 
-        # Save the model
-        no_show_model.save_model(request.model_version)
+        # Save and register the model; later incremental runs start from it
+        registered_version = candidate.save_model(request.model_version)
+        no_show_model = candidate
 
+        cutoff = candidate.training_cutoff
         return {
-            "model_version": request.model_version,
+            "model_version": registered_version,
+            "training_cutoff": cutoff.isoformat() if cutoff else None,
             "metrics": metrics
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/models/no-show/tune")
+def tune_no_show_model(request: TuningRequest):
+    """Search hyperparameters in worker processes and register the best model"""
+    try:
+        search = HyperparameterSearch.from_env(
+            space=request.search_space,
+            strategy=request.strategy,
+            max_trials=request.max_trials,
+            workers=request.workers,
+            threads_per_trial=request.threads_per_trial
+        )
+        result = tune_and_register(
+            no_show_model,
+            request.training_data,
+            request.validation_data,
+            request.model_version,
+            search
+        )
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _load_version(version: str) -> NoShowPredictionModel:
+    model = NoShowPredictionModel()
+    model.load_model(version)
+    return model
+
+def _resolve_dataset_path(dataset_path: str) -> str:
+    """dataset_path under EVALUATION_DATA_DIR; ValueError if it escapes it"""
+    root = os.path.realpath(EVALUATION_DATA_DIR)
+    path = os.path.realpath(os.path.join(root, dataset_path))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"dataset_path must be inside {EVALUATION_DATA_DIR}")
+    return path
+
+@app.post("/models/no-show/evaluate")
+def evaluate_no_show_models(request: EvaluationRequest):
+    """
+    Backtest several model versions in streamed passes over a test set:
+    each chunk is read once per group of up to EVALUATION_MAX_MODELS
+    versions and scored by every version in the group in parallel.
+    """
+    try:
+        if (request.test_data is None) == (request.dataset_path is None):
+            raise ValueError("Provide exactly one of test_data or dataset_path")
+        dataset_path = None
+        if request.dataset_path is not None:
+            dataset_path = _resolve_dataset_path(request.dataset_path)
+        versions = request.versions or [
+            v.version for v in mlflow.search_model_versions(f"name='{no_show_model.model_name}'")
+        ]
+        if not versions:
+            raise LookupError(f"No registered versions of '{no_show_model.model_name}'")
+
+        results = {}
+        for start in range(0, len(versions), EVALUATION_MAX_MODELS):
+            group = versions[start:start + EVALUATION_MAX_MODELS]
+            with ThreadPoolExecutor(max_workers=len(group)) as pool:
+                models = dict(zip(group, pool.map(_load_version, group)))
+
+            if dataset_path is not None:
+                chunks = iter_csv_chunks(
+                    dataset_path, no_show_model.feature_columns, request.label_column, request.chunk_size
+                )
+                scorers = {version: model.score_batch for version, model in models.items()}
+            else:
+                chunks = iter_chunks(request.test_data['features'], request.test_data['labels'], request.chunk_size)
+                scorers = {version: model.score_rows for version, model in models.items()}
+            evaluators = evaluate_many(scorers, chunks)
+            results.update((version, evaluator.result()) for version, evaluator in evaluators.items())
+            # release this group's models before loading the next
+            del models, scorers
+        return results
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
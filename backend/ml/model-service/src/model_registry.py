@@ -0,0 +1,447 @@
+"""
+Multi-model serving registry.
+
+Each named model is loaded from MLflow on first use together with its own
+feature encoder, micro-batching queue and memory accounting, and evicted
+again once it has been idle for a while or the memory budget is exceeded,
+so one process can serve many models without keeping them all resident.
+
+Request threads never lock: they read an immutable snapshot of the
+resident models. Loads are single-flight per model and scoring runs on a
+dedicated inference pool sized to the CPU count rather than on the gRPC
+handler threads.
+"""
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import mlflow
+import numpy as np
+import tensorflow as tf
+
+from feature_encoders import FeatureEncoder
+from models.artifact_cache import ArtifactCache, registered_artifact, resolve
+from models.base_model import load_quantized_engine
+from models.dense_engine import DenseInferenceEngine
+
+LOGGER = logging.getLogger("model_registry")
+
+_STOP = object()
+
+
+class BatcherClosedError(RuntimeError):
+    """The model was evicted between lookup and submit"""
+
+
+class ModelSpec:
+    """How to obtain and feed one named model"""
+
+    def __init__(
+        self,
+        name: str,
+        registered_name: str,
+        encoder: FeatureEncoder,
+        fallback_builder: Optional[Callable[[int], tf.keras.Model]] = None,
+        version: Optional[str] = None,
+        precision: Optional[str] = None,
+        cache: Optional[ArtifactCache] = None
+    ):
+        self.name = name
+        self.registered_name = registered_name
+        self.encoder = encoder
+        self.fallback_builder = fallback_builder
+        self.version = version or os.getenv(f"{name.upper()}_MODEL_VERSION", "latest")
+        self.precision = precision or os.getenv(
+            f"{name.upper()}_MODEL_PRECISION", os.getenv("MODEL_PRECISION", "float32")
+        )
+        self.cache = cache if cache is not None else ArtifactCache.from_env()
+
+    def resolve_version(self) -> str:
+        """Pin 'latest' to a concrete registry version number"""
+        if self.version != "latest":
+            return self.version
+        return resolve(mlflow.tracking.MlflowClient(), self.cache, self.registered_name, "latest").version
+
+    def load(self):
+        """
+        Return (version, keras model, engine) from MLflow (through the
+        artifact cache), or the fallback model. A quantized precision loads only its NumPy engine; the Keras
+        model is loaded instead when training rejected that variant.
+        """
+        try:
+            version = self.resolve_version()
+            if self.precision != "float32":
+                engine = load_quantized_engine(
+                    mlflow.tracking.MlflowClient(), self.registered_name, version, self.precision, self.cache
+                )
+                if engine is not None:
+                    return version, None, engine
+                LOGGER.warning(f"Serving float32 '{self.name}' version {version}")
+            with registered_artifact(
+                mlflow.tracking.MlflowClient(), self.cache, self.registered_name, version
+            ) as path:
+                model = mlflow.tensorflow.load_model(path)
+            return version, model, None
+        except Exception as e:
+            if self.fallback_builder is None:
+                raise
+            LOGGER.warning(f"Serving untrained '{self.name}' model; MLflow load failed: {e}")
+            return "untrained", self.fallback_builder(self.encoder.width), None
+
+
+class MicroBatcher:
+    """
+    Collects single-row requests for one model and scores them together.
+    A batch closes when it reaches `max_batch_size` rows or when the first
+    row has waited `max_wait` seconds. With no wait, a batch is whatever
+    queued up while the previous one was being dispatched.
+
+    With an executor, `slots` bounds the batches in flight (taken before
+    submit, released when scored). While every slot is busy the batcher
+    waits, so rows pile up into the next batch instead of the executor
+    queueing many tiny ones.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        score: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait: float = 0.0,
+        executor: Optional[Executor] = None,
+        slots: Optional[threading.Semaphore] = None
+    ):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # batches are scored here when given, otherwise on the batcher thread
+        self.executor = executor
+        self.slots = slots
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        # orders submits against close() so no row lands behind the stop marker
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: np.ndarray) -> Future:
+        future: Future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise BatcherClosedError("Batcher is closed")
+            self._queue.put((row, future))
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            if self.slots is not None and self.executor is not None:
+                # wait for a free inference slot before collecting the batch,
+                # so everything that arrives meanwhile joins it
+                self.slots.acquire()
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        if self.executor is None:
+            self._score_batch(batch)
+            return
+        try:
+            self.executor.submit(self._score_in_slot, batch)
+        except RuntimeError as e:
+            # executor already shut down
+            self._release_slot()
+            for _, future in batch:
+                future.set_exception(e)
+
+    def _score_in_slot(self, batch):
+        try:
+            self._score_batch(batch)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        if self.slots is not None:
+            self.slots.release()
+
+    def _score_batch(self, batch):
+        try:
+            scores = self.score(np.vstack([row for row, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), score in zip(batch, scores):
+            future.set_result(float(score))
+
+    def close(self):
+        """Stop accepting rows; rows already queued are still scored"""
+        with self._submit_lock:
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+
+class LoadedModel:
+    """A resident model version with everything needed to serve it"""
+
+    def __init__(
+        self,
+        spec: ModelSpec,
+        version: str,
+        model: Optional[tf.keras.Model],
+        batcher_options: Dict[str, Any],
+        executor: Optional[Executor] = None,
+        engine: Optional[DenseInferenceEngine] = None,
+        slots: Optional[threading.Semaphore] = None
+    ):
+        self.name = spec.name
+        self.version = version
+        self.model = model
+        self.encoder = spec.encoder
+        self.engine = engine or _try_engine(model)
+        self.memory_bytes = (_weights_nbytes(model) if model is not None else 0) + (
+            _engine_nbytes(self.engine) if self.engine is not None else 0
+        )
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self._request_counter = itertools.count(1)
+        self.batcher = MicroBatcher(spec.name, self.score_batch, executor=executor, slots=slots, **batcher_options)
+
+    def touch(self):
+        # plain attribute stores and itertools.count are atomic under the GIL
+        self.last_used = time.monotonic()
+        self.requests = next(self._request_counter)
+
+    def score_batch(self, features: np.ndarray) -> np.ndarray:
+        """Positive-class probability for each row of an (N, F) batch"""
+        if self.engine is not None:
+            return self.engine.predict(features)[:, 0]
+        return self.model.predict(features, verbose=0)[:, 0]
+
+    def predict(self, data: Mapping[str, Any], timeout: Optional[float] = None) -> float:
+        """Score one request through the model's batching queue"""
+        return self.predict_row(self.encoder.encode(data), timeout)
+
+    def predict_row(self, row: np.ndarray, timeout: Optional[float] = None) -> float:
+        """Score one already-encoded (1, F) row through the batching queue"""
+        self.touch()
+        return self.batcher.submit(row).result(timeout)
+
+    def close(self):
+        self.batcher.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "memory_bytes": self.memory_bytes,
+            "requests": self.requests,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "engine": "numpy" if self.engine is not None else "keras",
+            "precision": self.engine.precision if self.engine is not None else "float32",
+        }
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        specs: List[ModelSpec],
+        idle_ttl: float = 900.0,
+        memory_budget_bytes: int = 0,
+        sweep_interval: float = 60.0,
+        batcher_options: Optional[Dict[str, Any]] = None,
+        inference_threads: int = 0
+    ):
+        self.specs = {spec.name: spec for spec in specs}
+        self.idle_ttl = idle_ttl
+        self.memory_budget_bytes = memory_budget_bytes
+        self.sweep_interval = sweep_interval
+        self.batcher_options = batcher_options or {}
+        self.inference_threads = inference_threads or os.cpu_count() or 1
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=self.inference_threads,
+            thread_name_prefix="inference"
+        )
+        # one per inference thread, shared by every model's batcher: jobs wait
+        # for a slot instead of queueing in the executor
+        self.inference_slots = threading.BoundedSemaphore(self.inference_threads)
+        # Readers use the published snapshot as-is; writers replace it
+        # wholesale while holding _lock.
+        self._snapshot: Mapping[str, LoadedModel] = MappingProxyType({})
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, specs: List[ModelSpec]) -> "ModelRegistry":
+        return cls(
+            specs,
+            idle_ttl=float(os.getenv("MODEL_IDLE_TTL_SECONDS", "900")),
+            memory_budget_bytes=int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024,
+            batcher_options={
+                "max_batch_size": int(os.getenv("BATCH_MAX_SIZE", "64")),
+                "max_wait": float(os.getenv("BATCH_MAX_WAIT_MS", "0")) / 1000.0,
+            },
+            inference_threads=int(os.getenv("INFERENCE_THREADS", "0"))
+        )
+
+    def _publish(self, models: Dict[str, LoadedModel]):
+        self._snapshot = MappingProxyType(models)
+
+    def get(self, name: str) -> LoadedModel:
+        """Return the resident model, loading it on first use"""
+        loaded = self._snapshot.get(name)
+        if loaded is not None:
+            return loaded
+        if name not in self.specs:
+            raise KeyError(f"Unknown model '{name}'")
+
+        with self._lock:
+            loaded = self._snapshot.get(name)
+            if loaded is not None:
+                return loaded
+            pending = self._inflight.get(name)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[name] = Future()
+
+        if not leader:
+            # another thread is loading this model; share its result or error
+            return pending.result()
+
+        try:
+            spec = self.specs[name]
+            version, model, engine = spec.load()
+            loaded = LoadedModel(
+                spec, version, model, self.batcher_options, self.inference_executor, engine, self.inference_slots
+            )
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[name]
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._publish({**self._snapshot, name: loaded})
+            del self._inflight[name]
+        pending.set_result(loaded)
+        LOGGER.info(f"Loaded model '{name}' version {loaded.version} ({loaded.memory_bytes} bytes)")
+        self._enforce_budget(keep=name)
+        return loaded
+
+    def predict(self, name: str, data: Mapping[str, Any]) -> float:
+        try:
+            return self.get(name).predict(data)
+        except BatcherClosedError:
+            # evicted while we held a reference; reload and retry once
+            return self.get(name).predict(data)
+
+    def predict_row(self, name: str, row: np.ndarray) -> float:
+        try:
+            return self.get(name).predict_row(row)
+        except BatcherClosedError:
+            return self.get(name).predict_row(row)
+
+    def predict_features(self, name: str, features: np.ndarray) -> np.ndarray:
+        """Score an already-encoded (N, F) batch as one job on the inference pool"""
+        loaded = self.get(name)
+        loaded.touch()
+        with self.inference_slots:
+            # copy out of the engine's reusable buffer before the worker reuses it
+            return self.inference_executor.submit(
+                lambda: np.array(loaded.score_batch(features))
+            ).result()
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            loaded = self._snapshot.get(name)
+            if loaded is None:
+                return False
+            self._publish({key: value for key, value in self._snapshot.items() if key != name})
+        loaded.close()
+        LOGGER.info(f"Evicted model '{name}' version {loaded.version}")
+        return True
+
+    def evict_idle(self) -> List[str]:
+        """Evict models unused for longer than the idle TTL"""
+        now = time.monotonic()
+        idle = [name for name, loaded in self._snapshot.items() if now - loaded.last_used > self.idle_ttl]
+        return [name for name in idle if self.evict(name)]
+
+    def _enforce_budget(self, keep: str):
+        """Evict least recently used models until within the memory budget"""
+        if not self.memory_budget_bytes:
+            return
+        while self.memory_bytes() > self.memory_budget_bytes:
+            candidates = [loaded for name, loaded in self._snapshot.items() if name != keep]
+            if not candidates:
+                break
+            self.evict(min(candidates, key=lambda loaded: loaded.last_used).name)
+
+    def memory_bytes(self) -> int:
+        return sum(loaded.memory_bytes for loaded in self._snapshot.values())
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "memory_bytes": sum(loaded.memory_bytes for loaded in snapshot.values()),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "inference_threads": self.inference_threads,
+            "models": {name: loaded.stats() for name, loaded in snapshot.items()},
+        }
+
+    def _sweep(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                LOGGER.error(f"Idle model sweep failed: {e}", exc_info=True)
+
+    def start(self):
+        """Start the background idle-eviction sweep"""
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep, name="model-registry-sweep", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop.set()
+        for name in list(self._snapshot):
+            self.evict(name)
+        self.inference_executor.shutdown(wait=True)
+
+
+def _try_engine(model: tf.keras.Model) -> Optional[DenseInferenceEngine]:
+    try:
+        return DenseInferenceEngine.from_keras(model)
+    except ValueError:
+        return None
+
+
+def _weights_nbytes(model: tf.keras.Model) -> int:
+    return sum(weights.nbytes for weights in model.get_weights())
+
+
+def _engine_nbytes(engine: DenseInferenceEngine) -> int:
+    return sum(kernel.nbytes + bias.nbytes for kernel, bias, _ in engine.layers)
@@ -3,31 +3,45 @@ from concurrent import futures
 import tensorflow as tf
 import numpy as np
 import mlflow
+import os
 from typing import Dict, Any, List
 
 # Import generated protobuf code
 from healthcare.ml.v1 import ml_service_pb2
 from healthcare.ml.v1 import ml_service_pb2_grpc
 
+from feature_encoders import (
+    NO_SHOW_ENCODER, TREATMENT_OUTCOME_ENCODER, READMISSION_RISK_ENCODER, PATIENT_PROFILE_ENCODER
+)
+from model_registry import LoadedModel, ModelRegistry, ModelSpec
+from drug_interactions import load_index_from_env
+from patient_similarity import load_index_from_env as load_patient_index_from_env
+
 class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
     def __init__(self):
-        self.models = {}
-
-    def get_model(self, model_name: str) -> tf.keras.Model:
-        """Get model by name, creating it if it doesn't exist"""
-        if model_name not in self.models:
-            if model_name == "no_show":
-                self.models[model_name] = self.create_no_show_model()
-            elif model_name == "treatment_outcome":
-                self.models[model_name] = self.create_treatment_outcome_model()
-            elif model_name == "readmission_risk":
-                self.models[model_name] = self.create_readmission_risk_model()
-        return self.models[model_name]
-
-    def create_no_show_model(self) -> tf.keras.Model:
+        # Models are loaded from MLflow on first use and evicted when idle;
+        # the untrained builders below are only a fallback.
+        self.registry = ModelRegistry.from_env([
+            ModelSpec("no_show", "no_show_prediction", NO_SHOW_ENCODER, self.create_no_show_model),
+            ModelSpec("treatment_outcome", "treatment_outcome", TREATMENT_OUTCOME_ENCODER,
+                      self.create_treatment_outcome_model),
+            ModelSpec("readmission_risk", "readmission_risk", READMISSION_RISK_ENCODER,
+                      self.create_readmission_risk_model),
+        ])
+        self.registry.start()
+        # memory-mapped, so every worker shares one copy of the pair table
+        self.drug_interactions = load_index_from_env()
+        self.similar_patients = load_patient_index_from_env()
+        self.neighbours = int(os.getenv("RECOMMENDATION_NEIGHBOURS", "50"))
+
+    def get_model(self, model_name: str) -> LoadedModel:
+        """Get model by name, loading it if it isn't resident"""
+        return self.registry.get(model_name)
+
+    def create_no_show_model(self, input_dim: int = 10) -> tf.keras.Model:
         """Create the no-show prediction model"""
         model = tf.keras.Sequential([
-            tf.keras.layers.Dense(64, activation='relu', input_shape=(10,)),
+            tf.keras.layers.Dense(64, activation='relu', input_shape=(input_dim,)),
             tf.keras.layers.Dropout(0.2),
             tf.keras.layers.Dense(32, activation='relu'),
             tf.keras.layers.Dropout(0.2),
@@ -43,40 +57,78 @@ class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
         
         return model
         
-    def create_treatment_outcome_model(self) -> tf.keras.Model:
+    def create_treatment_outcome_model(self, input_dim: int = 8) -> tf.keras.Model:
         """Create the treatment outcome prediction model"""
         # Similar structure to no-show model
-        return self.create_no_show_model()
+        return self.create_no_show_model(input_dim)
         
-    def create_readmission_risk_model(self) -> tf.keras.Model:
+    def create_readmission_risk_model(self, input_dim: int = 8) -> tf.keras.Model:
         """Create the readmission risk prediction model"""
         # Similar structure to no-show model
-        return self.create_no_show_model()
+        return self.create_no_show_model(input_dim)
         
     def PredictNoShow(self, request, context):
         """Predict no-show probability"""
         try:
-            model = self.get_model("no_show")
-            features = self.preprocess_features(request.appointment_data)
-            probability = model.predict(features)[0][0]
+            if request.HasField("packed_features"):
+                row = NO_SHOW_ENCODER.decode_packed(request.packed_features)
+                if row.shape[0] != 1:
+                    raise ValueError(f"PredictNoShow takes one row, got {row.shape[0]}")
+                probability = self.registry.predict_row("no_show", row)
+            else:
+                probability = self.registry.predict("no_show", request.additional_data)
 
             return ml_service_pb2.NoShowPrediction(
                 patient_id=request.patient_id,
+                appointment_id=request.appointment_id,
                 probability=float(probability),
                 risk_level=self.get_risk_level(probability),
                 confidence=0.85  # Placeholder
             )
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return ml_service_pb2.NoShowPrediction()
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
             return ml_service_pb2.NoShowPrediction()
 
+    def PredictNoShowBatch(self, request, context):
+        """Predict no-show probability for a packed batch of appointments"""
+        try:
+            features = NO_SHOW_ENCODER.decode_packed(request.features)
+            if len(request.patient_ids) != features.shape[0]:
+                raise ValueError(
+                    f"Got {len(request.patient_ids)} patient ids for {features.shape[0]} feature rows"
+                )
+            probabilities = self.registry.predict_features("no_show", features)
+            appointment_ids = list(request.appointment_ids) or [""] * len(probabilities)
+
+            return ml_service_pb2.PredictNoShowBatchResponse(predictions=[
+                ml_service_pb2.NoShowPrediction(
+                    patient_id=patient_id,
+                    appointment_id=appointment_id,
+                    probability=float(probability),
+                    risk_level=self.get_risk_level(probability),
+                    confidence=0.85  # Placeholder
+                )
+                for patient_id, appointment_id, probability
+                in zip(request.patient_ids, appointment_ids, probabilities)
+            ])
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return ml_service_pb2.PredictNoShowBatchResponse()
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return ml_service_pb2.PredictNoShowBatchResponse()
+
     def PredictTreatmentOutcome(self, request, context):
         """Predict treatment outcome"""
         try:
-            model = self.get_model("treatment_outcome")
-            features = self.preprocess_features(request.treatment_data)
-            probability = model.predict(features)[0][0]
+            probability = self.registry.predict("treatment_outcome", request.treatment_data)
 
             return ml_service_pb2.TreatmentOutcome(
                 patient_id=request.patient_id,
@@ -92,9 +144,7 @@ class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
     def AssessReadmissionRisk(self, request, context):
         """Assess readmission risk"""
         try:
-            model = self.get_model("readmission_risk")
-            features = self.preprocess_features(request.patient_data)
-            probability = model.predict(features)[0][0]
+            probability = self.registry.predict("readmission_risk", request.clinical_data)
 
             return ml_service_pb2.ReadmissionRisk(
                 patient_id=request.patient_id,
@@ -110,14 +160,21 @@ class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
     def GetTreatmentRecommendations(self, request, context):
         """Get treatment recommendations"""
         try:
+            if self.similar_patients is None:
+                context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+                context.set_details("Patient similarity index is not configured")
+                return ml_service_pb2.TreatmentRecommendations()
+
+            profile = PATIENT_PROFILE_ENCODER.encode(request.clinical_data)
             recommendations = [
                 ml_service_pb2.TreatmentRecommendation(
-                    treatment="Standard Protocol A",
-                    confidence=0.92,
-                    rationale="Based on patient history and current condition"
+                    treatment=recommendation.treatment,
+                    confidence=recommendation.confidence,
+                    rationale=recommendation.rationale
                 )
+                for recommendation in self.similar_patients.recommend(profile, k=self.neighbours)[0]
             ]
-            
+
             return ml_service_pb2.TreatmentRecommendations(
                 recommendations=recommendations
             )
@@ -129,13 +186,19 @@ class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
     def AnalyzeDrugInteractions(self, request, context):
         """Analyze drug interactions"""
         try:
+            if self.drug_interactions is None:
+                context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+                context.set_details("Drug interaction index is not configured")
+                return ml_service_pb2.DrugInteractions()
+
             interactions = [
                 ml_service_pb2.DrugInteraction(
-                    medication1=request.medications[0],
-                    medication2=request.medications[1],
-                    risk_level=ml_service_pb2.RISK_LEVEL_MEDIUM,
-                    description="Potential interaction affecting drug metabolism"
+                    medication1=interaction.medication1,
+                    medication2=interaction.medication2,
+                    risk_level=interaction.risk_level,
+                    description=interaction.description
                 )
+                for interaction in self.drug_interactions.check(request.medications)
             ]
             
             return ml_service_pb2.DrugInteractions(
@@ -147,52 +210,8 @@ class MLModelService(ml_service_pb2_grpc.MLServiceServicer):
             return ml_service_pb2.DrugInteractions()
             
     def preprocess_features(self, data: Dict[str, Any]) -> np.ndarray:
-        """Convert input data to feature vector"""
-        # Define expected feature columns
-        feature_columns = [
-            'age', 'gender', 'day_of_week', 'time_of_day',
-            'previous_no_shows', 'days_since_last_visit',
-            'appointment_type', 'insurance_type',
-            'distance_to_clinic', 'weather_condition'
-        ]
-
-        # Convert data to feature vector
-        features = []
-        for column in feature_columns:
-            if column in data:
-                # Convert string values to numerical representations
-                if isinstance(data[column], str):
-                    if column == 'gender':
-                        features.append(1 if data[column].lower() == 'male' else 0)
-                    elif column == 'day_of_week':
-                        features.append(int(data[column]) % 7)  # 0-6 for Sun-Sat
-                    elif column == 'time_of_day':
-                        hour = int(data[column].split(':')[0])
-                        features.append(hour / 24.0)  # Normalize to 0-1
-                    elif column == 'appointment_type':
-                        # Map appointment types to numerical values
-                        appointment_types = {
-                            'routine': 0,
-                            'urgent': 1,
-                            'follow_up': 2
-                        }
-                        features.append(appointment_types.get(data[column], 0))
-                    elif column == 'insurance_type':
-                        # Map insurance types to numerical values
-                        insurance_types = {
-                            'private': 0,
-                            'public': 1,
-                            'none': 2
-                        }
-                        features.append(insurance_types.get(data[column], 2))
-                    else:
-                        features.append(float(data[column]))
-                else:
-                    features.append(float(data[column]))
-            else:
-                features.append(0)  # Default value for missing features
-
-        return np.array(features).reshape(1, -1)
+        """Convert input data to no-show feature vector"""
+        return NO_SHOW_ENCODER.encode(data)
 
     def get_risk_level(self, probability: float) -> int:
         """Convert probability to risk level"""
@@ -0,0 +1,116 @@
+"""
+Per-feature contributions to a Dense model's score, for a whole batch at once.
+
+Gradients of the first output with respect to the inputs come from an
+analytic backward pass over the DenseInferenceEngine's layers in NumPy, so
+explaining N rows costs a few matrix products instead of N model calls.
+
+Methods (both measured from a reference row, typically the training
+medians, so contributions are relative to a "typical" appointment):
+
+    integrated_gradients  (x - ref) * mean gradient at `steps` points on the
+                          straight line from ref to x (midpoint rule); the
+                          contributions sum to ~f(x) - f(ref)
+    gradient_x_input      (x - ref) * gradient at x; one backward pass,
+                          exact only for locally linear models
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .dense_engine import DenseInferenceEngine, _SIGMOID_CLIP
+from .drift import DriftSketch
+
+METHODS = ("integrated_gradients", "gradient_x_input")
+
+
+def input_gradients(engine: DenseInferenceEngine, features: np.ndarray) -> np.ndarray:
+    """d output[:, 0] / d features for an (N, F) batch, as an (N, F) array"""
+    x = np.asarray(features, dtype=np.float32).reshape(-1, engine.input_dim)
+    # forward, keeping each layer's activations
+    activations = []
+    for kernel, bias, activation in engine.layers:
+        z = x @ kernel
+        z += bias
+        if activation == "relu":
+            np.maximum(z, 0.0, out=z)
+        elif activation == "sigmoid":
+            np.clip(z, -_SIGMOID_CLIP, _SIGMOID_CLIP, out=z)
+            z = 1.0 / (1.0 + np.exp(-z))
+        elif activation == "tanh":
+            np.tanh(z, out=z)
+        activations.append(z)
+        x = z
+
+    # backward from the first output unit
+    grad = np.zeros_like(activations[-1])
+    grad[:, 0] = 1.0
+    for i in range(len(engine.layers) - 1, -1, -1):
+        kernel, _, activation = engine.layers[i]
+        out = activations[i]
+        if activation == "relu":
+            grad *= out > 0
+        elif activation == "sigmoid":
+            grad *= out * (1.0 - out)
+        elif activation == "tanh":
+            grad *= 1.0 - out * out
+        grad = grad @ kernel.T
+    return grad
+
+
+def reference_from_sketch(sketch: DriftSketch) -> np.ndarray:
+    """Training medians of numeric columns and most common codes of categorical ones"""
+    reference = np.zeros(len(sketch.columns), dtype=np.float32)
+    for i, column in enumerate(sketch.columns):
+        if column in sketch.categorical:
+            counts = sketch.category_counts[sketch.categorical.index(column)][:-1]
+            reference[i] = float(np.argmax(counts)) if counts.any() else 0.0
+        else:
+            median = sketch.quantile(column, 0.5)
+            reference[i] = median if median is not None else 0.0
+    return reference
+
+
+class AttributionEngine:
+    def __init__(
+        self,
+        engine: DenseInferenceEngine,
+        reference: Optional[np.ndarray] = None,
+        method: str = "integrated_gradients",
+        steps: int = 8,
+        max_rows: int = 65536
+    ):
+        if method not in METHODS:
+            raise ValueError(f"Unknown attribution method '{method}'; expected one of {METHODS}")
+        self.engine = engine
+        self.reference = (
+            np.zeros(engine.input_dim, dtype=np.float32) if reference is None
+            else np.asarray(reference, dtype=np.float32).reshape(engine.input_dim)
+        )
+        self.method = method
+        self.steps = steps if method == "integrated_gradients" else 1
+        # bounds the (rows * steps, F) interpolation batch
+        self.max_rows = max_rows
+        # midpoints of `steps` equal segments of [0, 1]
+        self._alphas = ((np.arange(self.steps, dtype=np.float32) + 0.5) / self.steps).reshape(1, -1, 1)
+
+    def explain(self, features: np.ndarray) -> np.ndarray:
+        """(N, F) contributions of each feature to each row's score"""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.engine.input_dim)
+        delta = features - self.reference
+        if self.method == "gradient_x_input":
+            return delta * input_gradients(self.engine, features)
+
+        out = np.empty_like(features)
+        chunk = max(1, self.max_rows // self.steps)
+        for start in range(0, features.shape[0], chunk):
+            d = delta[start:start + chunk]
+            # (n, steps, F) points on the path from the reference to each row
+            path = self.reference + self._alphas * d[:, None, :]
+            grads = input_gradients(self.engine, path.reshape(-1, self.engine.input_dim))
+            out[start:start + chunk] = d * grads.reshape(d.shape[0], self.steps, -1).mean(axis=1)
+        return out
+
+    def risk_factors(self, features: np.ndarray, columns: Sequence[str]) -> List[Dict[str, float]]:
+        """explain() as one {column: contribution} map per row"""
+        return [dict(zip(columns, row.tolist())) for row in self.explain(features)]
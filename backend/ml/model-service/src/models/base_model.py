@@ -1,14 +1,99 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import datetime
+import json
+import logging
+import os
+import tempfile
 import mlflow
 import tensorflow as tf
 import numpy as np
+from sklearn.metrics import roc_auc_score
+from .artifact_cache import ArtifactCache, registered_artifact, resolve
+from .dense_engine import DenseInferenceEngine
+from .drift import DriftSketch
+from .evaluation import evaluate_stream, iter_chunks, iter_csv_chunks
+
+LOGGER = logging.getLogger("base_model")
+
+# Rows encoded and scored at a time by evaluate()
+EVALUATION_CHUNK_SIZE = int(os.getenv("EVALUATION_CHUNK_SIZE", "10000"))
+
+# Reduced-precision variants generated next to the float32 model
+QUANTIZED_PRECISIONS = ("float16", "int8")
+
+# Run tag holding the newest appointment time a version was trained on
+TRAINING_CUTOFF_TAG = "training_cutoff"
+
+# Run artifact with the sketch of the training features and scores
+DRIFT_BASELINE_ARTIFACT = "drift/baseline.json"
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """ISO-8601 string -> naive UTC datetime"""
+    # fromisoformat() only accepts a trailing 'Z' from Python 3.11
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def resolve_run_id(client: Any, model_name: str, version: str, cache: Optional[ArtifactCache] = None) -> str:
+    """MLflow run that produced a registered model version ('latest' allowed)"""
+    return resolve(client, cache, model_name, version).run_id
+
+
+def load_drift_baseline(
+    client: Any,
+    model_name: str,
+    version: str,
+    cache: Optional[ArtifactCache] = None
+) -> Optional[DriftSketch]:
+    """Training sketch saved with a registered version, or None if it has none"""
+    try:
+        with registered_artifact(client, cache, model_name, version, DRIFT_BASELINE_ARTIFACT) as path:
+            with open(path) as f:
+                return DriftSketch.from_dict(json.load(f))
+    except Exception as e:
+        LOGGER.warning(f"No drift baseline for {model_name} version {version}: {e}")
+        return None
+
+
+def load_quantized_engine(
+    client: Any,
+    model_name: str,
+    version: str,
+    precision: str,
+    cache: Optional[ArtifactCache] = None
+) -> Optional[DenseInferenceEngine]:
+    """
+    The saved `precision` variant of a registered version, or None if
+    training rejected it (or the version predates quantized variants).
+    """
+    try:
+        with registered_artifact(client, cache, model_name, version, f"quantized/{precision}.npz") as path:
+            return DenseInferenceEngine.load(path)
+    except Exception as e:
+        LOGGER.warning(f"No {precision} variant of {model_name} version {version}: {e}")
+        return None
+
 
 class BaseModel(ABC):
     def __init__(self, model_name: str):
         self.model_name = model_name
         self.model = None
         self.mlflow_client = mlflow.tracking.MlflowClient()
+        # downloaded artifacts, shared with other processes on this host
+        self.artifact_cache = ArtifactCache.from_env()
+        # largest validation AUC loss a quantized variant may have vs float32
+        self.max_quantized_auc_drop = float(os.getenv("QUANTIZATION_MAX_AUC_DROP", "0.005"))
+        self.quantized_variants: Dict[str, DenseInferenceEngine] = {}
+        self.quantization_metrics: Dict[str, float] = {}
+        # newest training row of the current weights, saved with the version
+        self.training_cutoff: Optional[datetime.datetime] = None
+        # feature columns sketched as category counts rather than quantiles
+        self.categorical_columns: List[str] = []
+        self.drift_baseline: Optional[DriftSketch] = None
 
     @abstractmethod
     def preprocess_data(self, data: Dict[str, Any]) -> np.ndarray:
@@ -25,16 +110,148 @@ class BaseModel(ABC):
         """Make predictions using the model"""
         pass
 
-    def save_model(self, version: str):
-        """Save model to MLflow"""
-        with mlflow.start_run(run_name=f"{self.model_name}_v{version}"):
+    def rows_since(
+        self,
+        data: Dict[str, Any],
+        cutoff: Optional[datetime.datetime]
+    ) -> Tuple[Dict[str, Any], Optional[datetime.datetime]]:
+        """
+        The rows of a {features, labels, timestamps} dataset newer than
+        `cutoff` (all rows if None), and the newest timestamp among them.
+        Datasets without timestamps are returned whole.
+        """
+        timestamps = data.get('timestamps')
+        if not timestamps:
+            return data, None
+        parsed = [parse_timestamp(value) for value in timestamps]
+        keep = [i for i, when in enumerate(parsed) if cutoff is None or when > cutoff]
+        return {
+            'features': [data['features'][i] for i in keep],
+            'labels': [data['labels'][i] for i in keep],
+            'timestamps': [timestamps[i] for i in keep],
+        }, max((parsed[i] for i in keep), default=None)
+
+    def load_training_cutoff(self, version: str) -> Optional[datetime.datetime]:
+        """Training cutoff recorded with a registered version, if any"""
+        run_id = resolve_run_id(self.mlflow_client, self.model_name, version, self.artifact_cache)
+        value = self.mlflow_client.get_run(run_id).data.tags.get(TRAINING_CUTOFF_TAG)
+        return parse_timestamp(value) if value else None
+
+    def build_quantized_variants(self, X_val: np.ndarray, y_val: np.ndarray) -> Dict[str, float]:
+        """
+        Quantize the trained model and keep each variant whose validation
+        AUC is within max_quantized_auc_drop of the float32 model.
+        Returns the AUC of every precision, rejected ones included.
+        """
+        self.quantized_variants = {}
+        self.quantization_metrics = {}
+        try:
+            engine = DenseInferenceEngine.from_keras(self.model)
+        except ValueError as e:
+            LOGGER.warning(f"Not quantizing {self.model_name}: {e}")
+            return {}
+
+        X_val = X_val.reshape(-1, engine.input_dim)
+        y_val = np.asarray(y_val).reshape(-1)
+        try:
+            reference = roc_auc_score(y_val, np.array(engine.predict(X_val)[:, 0]))
+        except ValueError as e:
+            # e.g. a single-class validation set; nothing to gate on
+            LOGGER.warning(f"Not quantizing {self.model_name}: {e}")
+            return {}
+
+        self.quantization_metrics["val_auc_float32"] = reference
+        for precision in QUANTIZED_PRECISIONS:
+            variant = engine.quantized(precision)
+            auc = roc_auc_score(y_val, np.array(variant.predict(X_val)[:, 0]))
+            self.quantization_metrics[f"val_auc_{precision}"] = auc
+            if reference - auc > self.max_quantized_auc_drop:
+                LOGGER.warning(
+                    f"Rejected {precision} {self.model_name}: val AUC {auc:.4f} vs {reference:.4f} float32"
+                )
+                continue
+            self.quantized_variants[precision] = variant
+        return dict(self.quantization_metrics)
+
+    def build_drift_baseline(self, X: np.ndarray) -> DriftSketch:
+        """
+        Sketch the encoded training features and the trained model's scores
+        on them; saved with the version as the reference for drift checks.
+        """
+        X = np.asarray(X, dtype=np.float32).reshape(-1, len(self.feature_columns))
+        sketch = DriftSketch(self.feature_columns, self.categorical_columns)
+        for start in range(0, X.shape[0], EVALUATION_CHUNK_SIZE):
+            chunk = X[start:start + EVALUATION_CHUNK_SIZE]
+            sketch.update(chunk, self.score_batch(chunk))
+        self.drift_baseline = sketch
+        return sketch
+
+    def save_model(self, version: str) -> str:
+        """
+        Save model to MLflow, with any accepted quantized variants and the
+        drift baseline, and register it under model_name. `version` only
+        names the run; returns the version number the registry assigned.
+        """
+        with mlflow.start_run(run_name=f"{self.model_name}_v{version}") as run:
             mlflow.tensorflow.log_model(self.model, self.model_name)
+            if self.quantization_metrics:
+                mlflow.log_metrics(self.quantization_metrics)
+            mlflow.set_tag("quantized_variants", ",".join(sorted(self.quantized_variants)))
+            if self.training_cutoff is not None:
+                mlflow.set_tag(TRAINING_CUTOFF_TAG, self.training_cutoff.isoformat())
+            with tempfile.TemporaryDirectory() as directory:
+                for precision, variant in self.quantized_variants.items():
+                    path = os.path.join(directory, f"{precision}.npz")
+                    variant.save(path)
+                    mlflow.log_artifact(path, artifact_path="quantized")
+                if self.drift_baseline is not None:
+                    artifact_dir, name = os.path.split(DRIFT_BASELINE_ARTIFACT)
+                    path = os.path.join(directory, name)
+                    with open(path, "w") as f:
+                        json.dump(self.drift_baseline.to_dict(), f)
+                    mlflow.log_artifact(path, artifact_path=artifact_dir)
+        # registered once every artifact is logged, so a version that
+        # resolves as 'latest' always has its variants and baseline
+        registered = mlflow.register_model(f"runs:/{run.info.run_id}/{self.model_name}", self.model_name)
+        LOGGER.info(f"Registered {self.model_name} version {registered.version}")
+        return str(registered.version)
 
     def load_model(self, version: str):
-        """Load model from MLflow"""
-        model_uri = f"models:/{self.model_name}/{version}"
-        self.model = mlflow.tensorflow.load_model(model_uri)
+        """Load model from MLflow, through the local artifact cache"""
+        with registered_artifact(self.mlflow_client, self.artifact_cache, self.model_name, version) as path:
+            self.model = mlflow.tensorflow.load_model(path)
 
-    def evaluate(self, test_data: Dict[str, Any]) -> Dict[str, float]:
-        """Evaluate model performance"""
-        pass
+    def load_drift_baseline(self, version: str) -> Optional[DriftSketch]:
+        """Load the training sketch saved with a registered version"""
+        self.drift_baseline = load_drift_baseline(self.mlflow_client, self.model_name, version, self.artifact_cache)
+        return self.drift_baseline
+
+    def load_quantized_engine(self, version: str, precision: str) -> Optional[DenseInferenceEngine]:
+        """Load the `precision` variant saved with a registered version"""
+        return load_quantized_engine(self.mlflow_client, self.model_name, version, precision, self.artifact_cache)
+
+    def score_batch(self, features: np.ndarray) -> np.ndarray:
+        """Positive-class probability for each row of an encoded (N, F) batch"""
+        return self.model.predict(features, verbose=0).reshape(-1)
+
+    def score_rows(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Encode and score a list of feature dicts"""
+        return self.score_batch(np.vstack([self.preprocess_data(d) for d in rows]).astype(np.float32))
+
+    def evaluate(self, test_data: Dict[str, Any], chunk_size: int = EVALUATION_CHUNK_SIZE) -> Dict[str, Any]:
+        """
+        Evaluate model performance on {features, labels}. Rows are encoded
+        and scored chunk by chunk into fixed-size histograms, so memory
+        stays bounded however large the test set is.
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        chunks = iter_chunks(test_data['features'], test_data['labels'], chunk_size)
+        return evaluate_stream(self.score_rows, chunks).result()
+
+    def evaluate_csv(self, path: str, label_column: str, chunk_size: int = EVALUATION_CHUNK_SIZE) -> Dict[str, Any]:
+        """Evaluate on an encoded CSV with one column per feature, read in chunks"""
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        chunks = iter_csv_chunks(path, self.feature_columns, label_column, chunk_size)
+        return evaluate_stream(self.score_batch, chunks).result()
@@ -0,0 +1,194 @@
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+# exp() overflows float32 beyond ~88; sigmoid is saturated well before that
+_SIGMOID_CLIP = 80.0
+
+SUPPORTED_ACTIVATIONS = ("linear", "relu", "sigmoid", "tanh")
+
+# Storage precisions for saved weights; inference always runs in float32
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def quantize_kernel(kernel: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Stored form of a (in, out) kernel and its per-output-column scale.
+    int8 is symmetric per column: kernel ~= stored * scale.
+    """
+    if precision == "float32":
+        return kernel.astype(np.float32), None
+    if precision == "float16":
+        return kernel.astype(np.float16), None
+    if precision == "int8":
+        scale = np.abs(kernel).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        stored = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+        return stored, scale.astype(np.float32)
+    raise ValueError(f"Unknown precision '{precision}'; expected one of {PRECISIONS}")
+
+
+def dequantize_kernel(stored: np.ndarray, scale: Optional[np.ndarray]) -> np.ndarray:
+    kernel = stored.astype(np.float32)
+    if scale is not None:
+        kernel *= scale
+    return kernel
+
+
+class DenseInferenceEngine:
+    """
+    Forward pass of a Sequential stack of Dense layers in plain NumPy.
+
+    Keras' predict() pays milliseconds of framework overhead per call while
+    the no-show network is only a few thousand multiply-adds. This engine
+    copies the trained weights out as contiguous float32 arrays and runs the
+    layers with in-place ufuncs on buffers that are allocated once per
+    batch-size bucket (and per thread), so steady-state calls allocate
+    nothing. Dropout is the identity at inference time and is skipped.
+
+    Weights can be saved with float16 or per-column int8 kernels to shrink
+    the artifact; they are dequantized to float32 when loaded, since NumPy
+    has no reduced-precision BLAS path.
+    """
+
+    def __init__(self, layers: List[Tuple[np.ndarray, np.ndarray, str]], precision: str = "float32"):
+        if not layers:
+            raise ValueError("At least one Dense layer is required")
+        self.layers = []
+        for kernel, bias, activation in layers:
+            if activation not in SUPPORTED_ACTIVATIONS:
+                raise ValueError(f"Unsupported activation '{activation}'")
+            self.layers.append((
+                np.ascontiguousarray(kernel, dtype=np.float32),
+                np.ascontiguousarray(bias, dtype=np.float32),
+                activation
+            ))
+        self.input_dim = self.layers[0][0].shape[0]
+        self.output_dim = self.layers[-1][0].shape[1]
+        # precision the weights were stored at before being loaded
+        self.precision = precision
+        # the stored arrays of a quantized() engine, saved unchanged
+        self.stored_arrays: Optional[Dict[str, np.ndarray]] = None
+        self._local = threading.local()
+
+    @classmethod
+    def from_keras(cls, model: Any) -> "DenseInferenceEngine":
+        """Extract Dense weights from a trained tf.keras Sequential model"""
+        layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind in ("Dropout", "InputLayer"):
+                continue
+            if kind != "Dense":
+                raise ValueError(f"Unsupported layer type '{kind}'")
+            kernel, bias = layer.get_weights()
+            activation = layer.get_config()["activation"]
+            layers.append((kernel, bias, activation))
+        return cls(layers)
+
+    def to_arrays(self, precision: str = "float32") -> Dict[str, np.ndarray]:
+        """Weights as named arrays for np.savez, kernels stored at `precision`"""
+        arrays = {
+            "precision": np.array(precision),
+            "activations": np.array([activation for _, _, activation in self.layers]),
+        }
+        for i, (kernel, bias, _) in enumerate(self.layers):
+            stored, scale = quantize_kernel(kernel, precision)
+            arrays[f"kernel_{i}"] = stored
+            arrays[f"bias_{i}"] = bias
+            if scale is not None:
+                arrays[f"scale_{i}"] = scale
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> "DenseInferenceEngine":
+        """Rebuild an engine from to_arrays() output, dequantizing to float32"""
+        layers = [
+            (
+                dequantize_kernel(arrays[f"kernel_{i}"], arrays.get(f"scale_{i}")),
+                arrays[f"bias_{i}"],
+                str(activation)
+            )
+            for i, activation in enumerate(arrays["activations"])
+        ]
+        return cls(layers, precision=str(arrays["precision"]))
+
+    def quantized(self, precision: str) -> "DenseInferenceEngine":
+        """The engine as it will serve after a save/load round trip at `precision`"""
+        arrays = self.to_arrays(precision)
+        engine = DenseInferenceEngine.from_arrays(arrays)
+        engine.stored_arrays = arrays
+        return engine
+
+    def save(self, path: str, precision: Optional[str] = None):
+        """
+        Save at `precision` (default: the engine's own). A quantized() engine
+        saved at its precision writes exactly the weights it was scored with.
+        """
+        precision = precision or self.precision
+        if self.stored_arrays is not None and precision == self.precision:
+            arrays = self.stored_arrays
+        else:
+            arrays = self.to_arrays(precision)
+        with open(path, "wb") as out:
+            np.savez(out, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "DenseInferenceEngine":
+        with np.load(path) as arrays:
+            return cls.from_arrays({name: arrays[name] for name in arrays.files})
+
+    def _buffers(self, batch_size: int) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Thread-local buffers sized for the next power of two >= batch_size"""
+        cache: Dict[int, Tuple[np.ndarray, List[np.ndarray]]] = getattr(self._local, "buffers", None)
+        if cache is None:
+            cache = self._local.buffers = {}
+        bucket = 1 << max(batch_size - 1, 0).bit_length()
+        buffers = cache.get(bucket)
+        if buffers is None:
+            inputs = np.empty((bucket, self.input_dim), dtype=np.float32)
+            activations = [
+                np.empty((bucket, kernel.shape[1]), dtype=np.float32)
+                for kernel, _, _ in self.layers
+            ]
+            buffers = cache[bucket] = (inputs, activations)
+        return buffers
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Run the forward pass for an (N, F) batch and return (N, outputs).
+        The result is a view into a reused buffer: copy it before the next
+        call on the same thread if it must be kept.
+        """
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        n = features.shape[0]
+        if features.shape[1] != self.input_dim:
+            raise ValueError(f"Expected {self.input_dim} features, got {features.shape[1]}")
+
+        inputs, activations = self._buffers(n)
+        x = inputs[:n]
+        np.copyto(x, features, casting="unsafe")
+
+        for (kernel, bias, activation), buffer in zip(self.layers, activations):
+            out = buffer[:n]
+            np.matmul(x, kernel, out=out)
+            out += bias
+            if activation == "relu":
+                np.maximum(out, 0.0, out=out)
+            elif activation == "sigmoid":
+                np.clip(out, -_SIGMOID_CLIP, _SIGMOID_CLIP, out=out)
+                np.negative(out, out=out)
+                np.exp(out, out=out)
+                out += 1.0
+                np.reciprocal(out, out=out)
+            elif activation == "tanh":
+                np.tanh(out, out=out)
+            x = out
+        return x
+
+    def max_abs_error(self, model: Any, features: np.ndarray) -> float:
+        """Largest absolute difference from Keras' own predictions on `features`"""
+        expected = model.predict(features, verbose=0)
+        return float(np.max(np.abs(self.predict(features) - expected)))
@@ -0,0 +1,285 @@
+"""
+Constant-memory sketches of model inputs and outputs, for drift checks.
+
+A DriftSketch summarises a stream of encoded feature rows and predicted
+probabilities without keeping the rows:
+
+- numeric columns (and the probability) go into log-bucketed quantile
+  sketches: bucket k holds values in (gamma^(k-1), gamma^k], so any quantile
+  is known to within `relative_accuracy`. The bucket range is fixed, so
+  memory does not grow with the stream; magnitudes below `min_value` count
+  as zero and the extremes are clamped into the first/last bucket.
+- categorical columns (integer codes) get one counter per code, with codes
+  outside [0, max_categories) counted as "other".
+
+Sketches with the same configuration merge by adding counts, so sketches
+from several replicas or time windows combine into one. compare() computes
+PSI and Kolmogorov-Smirnov statistics against a baseline sketch, such as the
+one saved with a model version at training time.
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Name of the output-probability sketch, next to the feature columns
+PROBABILITY = "probability"
+
+# PSI above these is reported as moderate / significant drift
+PSI_THRESHOLDS = (0.1, 0.2)
+
+_PSI_FLOOR = 1e-4
+
+
+class DriftSketch:
+    def __init__(
+        self,
+        columns: Sequence[str],
+        categorical: Sequence[str] = (),
+        relative_accuracy: float = 0.01,
+        min_value: float = 1e-6,
+        buckets: int = 2048,
+        max_categories: int = 64
+    ):
+        self.columns = list(columns)
+        self.categorical = [column for column in self.columns if column in set(categorical)]
+        self.numeric = [column for column in self.columns if column not in set(categorical)] + [PROBABILITY]
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.buckets = buckets
+        self.max_categories = max_categories
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._key_offset = math.ceil(math.log(min_value) / self._log_gamma)
+
+        self._numeric_index = np.array([self.columns.index(c) for c in self.numeric[:-1]], dtype=np.int64)
+        self._categorical_index = np.array([self.columns.index(c) for c in self.categorical], dtype=np.int64)
+        n = len(self.numeric)
+        # [column, sign (0: negative, 1: positive), bucket]
+        self.counts = np.zeros((n, 2, buckets), dtype=np.int64)
+        self.zeros = np.zeros(n, dtype=np.int64)
+        self.missing = np.zeros(n, dtype=np.int64)
+        # [column, code]; the last slot counts codes out of range
+        self.category_counts = np.zeros((len(self.categorical), max_categories + 1), dtype=np.int64)
+        self.rows = 0
+
+    def empty_like(self) -> "DriftSketch":
+        return DriftSketch(
+            self.columns, self.categorical, self.relative_accuracy,
+            self.min_value, self.buckets, self.max_categories
+        )
+
+    # ---- updates ----
+
+    def update(self, features: np.ndarray, probabilities: Optional[np.ndarray] = None):
+        """Add an encoded (N, F) batch and, optionally, its (N,) predicted probabilities"""
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(self.columns))
+        n = features.shape[0]
+        if n == 0:
+            return
+        self.rows += n
+
+        if probabilities is None:
+            probabilities = np.full(n, np.nan)
+        numeric = np.column_stack([features[:, self._numeric_index], np.asarray(probabilities, dtype=np.float64).reshape(-1)])
+        missing = np.isnan(numeric)
+        self.missing += missing.sum(axis=0)
+        magnitude = np.abs(np.where(missing, 0.0, numeric))
+        present = ~missing
+        self.zeros += (present & (magnitude < self.min_value)).sum(axis=0)
+
+        column, row = np.nonzero((present & (magnitude >= self.min_value)).T)
+        if column.size:
+            values = numeric[row, column]
+            keys = np.ceil(np.log(np.abs(values)) / self._log_gamma).astype(np.int64) - self._key_offset
+            np.clip(keys, 0, self.buckets - 1, out=keys)
+            sign = (values > 0).astype(np.int64)
+            np.add.at(self.counts, (column, sign, keys), 1)
+
+        if self.categorical:
+            codes = features[:, self._categorical_index]
+            slots = np.full(codes.shape, self.max_categories, dtype=np.int64)
+            valid = ~np.isnan(codes) & (codes >= 0) & (codes < self.max_categories) & (codes == np.floor(codes))
+            slots[valid] = codes[valid].astype(np.int64)
+            np.add.at(
+                self.category_counts,
+                (np.broadcast_to(np.arange(len(self.categorical)), slots.shape), slots),
+                1
+            )
+
+    def merge(self, other: "DriftSketch") -> "DriftSketch":
+        if self._config() != other._config():
+            raise ValueError("Cannot merge sketches with different configuration")
+        self.counts += other.counts
+        self.zeros += other.zeros
+        self.missing += other.missing
+        self.category_counts += other.category_counts
+        self.rows += other.rows
+        return self
+
+    def _config(self) -> Tuple[Any, ...]:
+        return (
+            tuple(self.columns), tuple(self.categorical), self.relative_accuracy,
+            self.min_value, self.buckets, self.max_categories
+        )
+
+    # ---- reads ----
+
+    def distribution(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted representative values and their counts for a numeric column"""
+        i = self.numeric.index(column)
+        keys = np.arange(self.buckets) + self._key_offset
+        # midpoint of (gamma^(k-1), gamma^k] in relative terms
+        magnitudes = 2.0 * np.power(self.gamma, keys) / (self.gamma + 1.0)
+        negative, positive = self.counts[i, 0], self.counts[i, 1]
+        values = np.concatenate([-magnitudes[::-1], [0.0], magnitudes])
+        counts = np.concatenate([negative[::-1], [self.zeros[i]], positive])
+        keep = counts > 0
+        return values[keep], counts[keep]
+
+    def quantile(self, column: str, q: float) -> Optional[float]:
+        values, counts = self.distribution(column)
+        if counts.sum() == 0:
+            return None
+        rank = q * (counts.sum() - 1)
+        return float(values[np.searchsorted(np.cumsum(counts), rank, side="right")])
+
+    def categories(self, column: str) -> Dict[str, int]:
+        """Count per code ('other' for codes out of range)"""
+        counts = self.category_counts[self.categorical.index(column)]
+        result = {str(code): int(count) for code, count in enumerate(counts[:-1]) if count}
+        if counts[-1]:
+            result["other"] = int(counts[-1])
+        return result
+
+    # ---- export ----
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable form; only non-empty buckets are listed"""
+        def sparse(row: np.ndarray) -> Dict[str, int]:
+            keys = np.nonzero(row)[0]
+            return {str(int(k)): int(row[k]) for k in keys}
+
+        return {
+            "columns": self.columns,
+            "categorical": self.categorical,
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "buckets": self.buckets,
+            "max_categories": self.max_categories,
+            "rows": self.rows,
+            "numeric": {
+                column: {
+                    "negative": sparse(self.counts[i, 0]),
+                    "positive": sparse(self.counts[i, 1]),
+                    "zero": int(self.zeros[i]),
+                    "missing": int(self.missing[i]),
+                }
+                for i, column in enumerate(self.numeric)
+            },
+            "categories": {
+                column: sparse(self.category_counts[i])
+                for i, column in enumerate(self.categorical)
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DriftSketch":
+        sketch = cls(
+            data["columns"], data["categorical"], data["relative_accuracy"],
+            data["min_value"], data["buckets"], data["max_categories"]
+        )
+        sketch.rows = data["rows"]
+        for i, column in enumerate(sketch.numeric):
+            entry = data["numeric"][column]
+            for sign, name in enumerate(("negative", "positive")):
+                for key, count in entry[name].items():
+                    sketch.counts[i, sign, int(key)] = count
+            sketch.zeros[i] = entry["zero"]
+            sketch.missing[i] = entry["missing"]
+        for i, column in enumerate(sketch.categorical):
+            for key, count in data["categories"][column].items():
+                sketch.category_counts[i, int(key)] = count
+        return sketch
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population stability index between two count vectors over the same bins"""
+    expected = np.maximum(expected / max(expected.sum(), 1), _PSI_FLOOR)
+    actual = np.maximum(actual / max(actual.sum(), 1), _PSI_FLOOR)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def _numeric_drift(baseline: DriftSketch, current: DriftSketch, column: str, bins: int) -> Optional[Dict[str, Any]]:
+    base_values, base_counts = baseline.distribution(column)
+    values, counts = current.distribution(column)
+    if base_counts.sum() == 0 or counts.sum() == 0:
+        return None
+
+    # both sketches share one bucket grid, so their CDFs can be compared
+    # exactly at every bucket boundary
+    grid = np.union1d(base_values, values)
+    base_cdf = np.cumsum(np.bincount(np.searchsorted(grid, base_values), base_counts, len(grid))) / base_counts.sum()
+    cdf = np.cumsum(np.bincount(np.searchsorted(grid, values), counts, len(grid))) / counts.sum()
+
+    # PSI over the baseline's quantile bins
+    positions = np.cumsum(base_counts)
+    edges = np.unique(base_values[np.searchsorted(positions, np.linspace(0, positions[-1], bins + 1)[1:-1], side="left")])
+    expected = np.bincount(np.searchsorted(edges, base_values, side="left"), base_counts, len(edges) + 1)
+    actual = np.bincount(np.searchsorted(edges, values, side="left"), counts, len(edges) + 1)
+    return {
+        "type": "numeric",
+        "psi": psi(expected.astype(np.float64), actual.astype(np.float64)),
+        "ks": float(np.max(np.abs(cdf - base_cdf))),
+        "baseline_median": baseline.quantile(column, 0.5),
+        "median": current.quantile(column, 0.5),
+    }
+
+
+def _categorical_drift(baseline: DriftSketch, current: DriftSketch, column: str) -> Optional[Dict[str, Any]]:
+    i = baseline.categorical.index(column)
+    expected, actual = baseline.category_counts[i], current.category_counts[i]
+    if expected.sum() == 0 or actual.sum() == 0:
+        return None
+    return {
+        "type": "categorical",
+        "psi": psi(expected.astype(np.float64), actual.astype(np.float64)),
+        "baseline": baseline.categories(column),
+        "current": current.categories(column),
+    }
+
+
+def drift_level(value: float) -> str:
+    if value >= PSI_THRESHOLDS[1]:
+        return "significant"
+    if value >= PSI_THRESHOLDS[0]:
+        return "moderate"
+    return "none"
+
+
+def compare(baseline: DriftSketch, current: DriftSketch, bins: int = 10) -> Dict[str, Any]:
+    """
+    Per-column drift of `current` against `baseline`: PSI (over `bins`
+    baseline quantile bins for numeric columns, per code for categorical
+    ones) and, for numeric columns and the probability, the KS statistic.
+    """
+    if baseline._config() != current._config():
+        raise ValueError("Baseline and current sketches have different configuration")
+    columns: Dict[str, Any] = {}
+    for column in baseline.numeric:
+        result = _numeric_drift(baseline, current, column, bins)
+        if result is not None:
+            columns[column] = result
+    for column in baseline.categorical:
+        result = _categorical_drift(baseline, current, column)
+        if result is not None:
+            columns[column] = result
+    for result in columns.values():
+        result["drift"] = drift_level(result["psi"])
+    drifted: List[str] = [column for column, result in columns.items() if result["drift"] == "significant"]
+    return {
+        "baseline_rows": baseline.rows,
+        "rows": current.rows,
+        "drifted_columns": drifted,
+        "columns": columns,
+    }
@@ -1,7 +1,19 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+import os
 import numpy as np
 import tensorflow as tf
+from .attribution import AttributionEngine, reference_from_sketch
 from .base_model import BaseModel
+from .dense_engine import DenseInferenceEngine
+
+LOGGER = logging.getLogger("no_show_model")
+
+# Largest tolerated gap between the NumPy engine and Keras on a probe batch
+ENGINE_PARITY_TOLERANCE = 1e-4
+
+# Largest holdout AUC loss a fine-tune may cause before it is rolled back
+FINE_TUNE_MAX_AUC_DROP = float(os.getenv("INCREMENTAL_MAX_AUC_DROP", "0.01"))
 
 class NoShowPredictionModel(BaseModel):
     def __init__(self):
@@ -12,25 +24,40 @@ class NoShowPredictionModel(BaseModel):
             'appointment_type', 'insurance_type',
             'distance_to_clinic', 'weather_condition'
         ]
+        self.categorical_columns = [
+            'gender', 'day_of_week', 'appointment_type', 'insurance_type', 'weather_condition'
+        ]
+        # "numpy" serves from DenseInferenceEngine, "keras" from model.predict
+        self.inference_backend = os.getenv("INFERENCE_BACKEND", "numpy")
+        # float16 / int8 serve the quantized weights saved with the version
+        self.precision = os.getenv("MODEL_PRECISION", "float32")
+        self._engine: Optional[DenseInferenceEngine] = None
+        self._engine_model = None
+        # risk_factors: per-feature contributions relative to the training medians
+        self.attribution_method = os.getenv("ATTRIBUTION_METHOD", "integrated_gradients")
+        self.attribution_steps = int(os.getenv("ATTRIBUTION_STEPS", "8"))
+        self._attribution: Optional[AttributionEngine] = None
+        self._attribution_baseline = None
 
-    def build_model(self):
+    def build_model(self, layer_sizes: Sequence[int] = (64, 32, 16), dropout: float = 0.2):
         """Build the neural network model"""
-        model = tf.keras.Sequential([
-            tf.keras.layers.Dense(64, activation='relu', input_shape=(len(self.feature_columns),)),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(32, activation='relu'),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(16, activation='relu'),
-            tf.keras.layers.Dense(1, activation='sigmoid')
-        ])
+        model = tf.keras.Sequential()
+        model.add(tf.keras.Input(shape=(len(self.feature_columns),)))
+        for i, units in enumerate(layer_sizes):
+            model.add(tf.keras.layers.Dense(units, activation='relu'))
+            # no dropout in front of the last hidden layer
+            if dropout > 0 and i < len(layer_sizes) - 1:
+                model.add(tf.keras.layers.Dropout(dropout))
+        model.add(tf.keras.layers.Dense(1, activation='sigmoid'))
 
         model.compile(
             optimizer='adam',
             loss='binary_crossentropy',
-            metrics=['accuracy', tf.keras.metrics.AUC()]
+            metrics=['accuracy', tf.keras.metrics.AUC(name='auc')]
         )
 
         self.model = model
+        self._attribution = None
         return model
 
     def preprocess_data(self, data: Dict[str, Any]) -> np.ndarray:
@@ -43,7 +70,13 @@ class NoShowPredictionModel(BaseModel):
                 features.append(0)  # Default value for missing features
         return np.array(features).reshape(1, -1)
 
-    def train(self, training_data: Dict[str, Any], validation_data: Dict[str, Any]) -> Dict[str, float]:
+    def train(
+        self,
+        training_data: Dict[str, Any],
+        validation_data: Dict[str, Any],
+        epochs: int = 50,
+        batch_size: int = 32
+    ) -> Dict[str, float]:
         """Train the model"""
         if self.model is None:
             self.build_model()
@@ -57,8 +90,8 @@ class NoShowPredictionModel(BaseModel):
         history = self.model.fit(
             X_train, y_train,
             validation_data=(X_val, y_val),
-            epochs=50,
-            batch_size=32,
+            epochs=epochs,
+            batch_size=batch_size,
             callbacks=[
                 tf.keras.callbacks.EarlyStopping(
                     monitor='val_loss',
@@ -67,26 +100,194 @@ class NoShowPredictionModel(BaseModel):
                 )
             ]
         )
+        # weights changed in place; re-extract the NumPy engine on next use
+        self._engine_model = None
+        self._attribution = None
+        _, self.training_cutoff = self.rows_since(training_data, None)
 
-        return {
+        metrics = {
             'accuracy': history.history['accuracy'][-1],
             'val_accuracy': history.history['val_accuracy'][-1],
             'auc': history.history['auc'][-1],
             'val_auc': history.history['val_auc'][-1]
         }
+        metrics.update(self.build_quantized_variants(X_val, y_val))
+        self.build_drift_baseline(X_train)
+        return metrics
+
+    def fine_tune(
+        self,
+        training_data: Dict[str, Any],
+        validation_data: Dict[str, Any],
+        since: Optional[Any] = None,
+        epochs: int = 10,
+        batch_size: int = 32,
+        learning_rate: float = 1e-4
+    ) -> Dict[str, Any]:
+        """
+        Continue training the loaded model on the training rows newer than
+        `since` at a low learning rate. The new weights are kept only if
+        AUC on the validation holdout drops by at most
+        FINE_TUNE_MAX_AUC_DROP; otherwise the previous weights are restored.
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        recent, newest = self.rows_since(training_data, since)
+        if not recent['features']:
+            raise ValueError(f"No training rows after {since}")
+
+        X_train = np.vstack([self.preprocess_data(d) for d in recent['features']])
+        y_train = np.array(recent['labels'])
+        X_val = np.vstack([self.preprocess_data(d) for d in validation_data['features']])
+        y_val = np.array(validation_data['labels'])
+
+        # fresh optimizer state at a fine-tuning learning rate
+        self.model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+            loss='binary_crossentropy',
+            metrics=['accuracy', tf.keras.metrics.AUC(name='auc')]
+        )
+        baseline_loss, _, baseline_auc = self.model.evaluate(X_val, y_val, verbose=0)
+        previous_weights = self.model.get_weights()
+
+        self.model.fit(
+            X_train, y_train,
+            validation_data=(X_val, y_val),
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=[
+                tf.keras.callbacks.EarlyStopping(
+                    monitor='val_loss',
+                    patience=2,
+                    restore_best_weights=True
+                )
+            ]
+        )
+        val_loss, _, val_auc = self.model.evaluate(X_val, y_val, verbose=0)
+        accepted = baseline_auc - val_auc <= FINE_TUNE_MAX_AUC_DROP
+        if accepted:
+            self.training_cutoff = newest or self.training_cutoff
+        else:
+            LOGGER.warning(f"Fine-tune rejected: holdout AUC {val_auc:.4f} vs {baseline_auc:.4f} before")
+            self.model.set_weights(previous_weights)
+        self._engine_model = None
+        self._attribution = None
+
+        metrics = {
+            'accepted': accepted,
+            'rows': len(recent['features']),
+            'baseline_val_auc': float(baseline_auc),
+            'baseline_val_loss': float(baseline_loss),
+            'val_auc': float(val_auc),
+            'val_loss': float(val_loss),
+        }
+        if accepted:
+            metrics.update(self.build_quantized_variants(X_val, y_val))
+            # the baseline covers all rows the caller trains on, not just the new ones
+            self.build_drift_baseline(np.vstack([self.preprocess_data(d) for d in training_data['features']]))
+        return metrics
+
+    def load_model(self, version: str):
+        """Load the Keras model, its drift baseline and, if configured, its quantized variant"""
+        super().load_model(version)
+        self._engine_model = None
+        self._attribution = None
+        self.load_drift_baseline(version)
+        if self.precision == "float32" or self.inference_backend != "numpy":
+            return
+        engine = self.load_quantized_engine(version, self.precision)
+        if engine is None:
+            LOGGER.warning(f"Serving float32 {self.model_name} version {version}")
+            return
+        self._engine = engine
+        self._engine_model = self.model
 
     def predict(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Make prediction for no-show probability"""
+        return self.predict_batch([data])[0]
+
+    def predict_batch(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Score several appointments in a single forward pass"""
+        return self.predict_features(np.vstack([self.preprocess_data(d) for d in data]))
+
+    def predict_features(self, features: np.ndarray) -> List[Dict[str, Any]]:
+        """Score an already-encoded (N, F) feature batch"""
         if self.model is None:
             raise ValueError("Model not loaded. Call load_model() first.")
 
-        features = self.preprocess_data(data)
-        probability = self.model.predict(features)[0][0]
+        engine = self._inference_engine()
+        if engine is not None:
+            probabilities = engine.predict(features)[:, 0]
+        else:
+            probabilities = self.model.predict(features, verbose=0)[:, 0]
 
-        return {
-            'no_show_probability': float(probability),
-            'risk_level': self._get_risk_level(probability)
-        }
+        return [
+            {
+                'no_show_probability': float(probability),
+                'risk_level': self._get_risk_level(probability)
+            }
+            for probability in probabilities
+        ]
+
+    def score_batch(self, features: np.ndarray) -> np.ndarray:
+        """Positive-class probabilities, through the NumPy engine when available"""
+        engine = self._inference_engine()
+        if engine is not None:
+            # copy: the engine returns a view of its reused output buffer
+            return np.array(engine.predict(features)[:, 0])
+        return super().score_batch(features)
+
+    def explain_features(self, features: np.ndarray) -> List[Dict[str, float]]:
+        """
+        risk_factors for each row of an encoded (N, F) batch: each feature's
+        contribution to the score, computed for the whole batch at once
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        # reset whenever the weights change; rebuilt if the baseline does
+        if self._attribution is None or self._attribution_baseline is not self.drift_baseline:
+            engine = self._inference_engine() or DenseInferenceEngine.from_keras(self.model)
+            reference = reference_from_sketch(self.drift_baseline) if self.drift_baseline is not None else None
+            self._attribution = AttributionEngine(
+                engine, reference, self.attribution_method, self.attribution_steps
+            )
+            self._attribution_baseline = self.drift_baseline
+        return self._attribution.risk_factors(features, self.feature_columns)
+
+    def warm_up(self, explain: bool = True):
+        """
+        Score (and explain) one row so the first request does not pay for
+        building the inference engine and Keras' first predict
+        """
+        row = np.zeros((1, len(self.feature_columns)), dtype=np.float32)
+        self.predict_features(row)
+        if explain:
+            self.explain_features(row)
+
+    def _inference_engine(self) -> Optional[DenseInferenceEngine]:
+        """NumPy engine for the current model, rebuilt whenever the model changes"""
+        if self.inference_backend != "numpy":
+            return None
+        if self._engine_model is not self.model:
+            self._engine = self._build_engine(self.model)
+            self._engine_model = self.model
+        return self._engine
+
+    def _build_engine(self, model) -> Optional[DenseInferenceEngine]:
+        """Extract and parity-check the engine; None falls back to Keras"""
+        try:
+            engine = DenseInferenceEngine.from_keras(model)
+            probe = np.random.default_rng(0).normal(
+                size=(32, len(self.feature_columns))
+            ).astype(np.float32)
+            error = engine.max_abs_error(model, probe)
+        except ValueError as e:
+            LOGGER.warning(f"NumPy inference unavailable, using Keras: {e}")
+            return None
+        if error > ENGINE_PARITY_TOLERANCE:
+            LOGGER.warning(f"NumPy inference differs from Keras by {error:.2e}, using Keras")
+            return None
+        return engine
 
     def _get_risk_level(self, probability: float) -> str:
         """Convert probability to risk level"""
@@ -0,0 +1,431 @@
+"""
+Similar-patient index for treatment recommendations.
+
+Past patients are stored as standardized feature vectors together with the
+treatment they received and its outcome. Recommendations for a new patient
+come from the outcomes of its k nearest neighbours (squared L2 distance).
+
+Search is exact brute force while the base is small. Past `ivf_threshold`
+rows the index trains a k-means coarse quantizer and keeps an inverted list
+per centroid (IVF); a query then scans only the `nprobe` closest lists, so
+latency grows with the list size rather than with the whole base. Inserts
+are incremental in both modes, and queries are batched. Retraining runs on
+a snapshot outside the index lock and swaps the new quantizer in at the
+end, so queries keep using the old one meanwhile.
+
+The index is built from a CSV of past patients holding the
+PATIENT_PROFILE_ENCODER columns plus `treatment` and `outcome` (1 when the
+treatment went well):
+
+    python src/patient_similarity.py build outcomes.csv /data/patient-index.npz
+"""
+import csv
+import logging
+import os
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from feature_encoders import PATIENT_PROFILE_ENCODER
+
+LOGGER = logging.getLogger("patient_similarity")
+
+# Rows scored per block in exact search, bounding the (Q, block) distance matrix
+SEARCH_BLOCK_ROWS = 65536
+# Distances computed per block when assigning rows to centroids (64 MB of float32)
+ASSIGN_BLOCK_ELEMENTS = 1 << 24
+
+
+class _GrowableArray:
+    """Append-only array with amortized doubling; readers use view(length)"""
+
+    def __init__(self, shape_tail: Tuple[int, ...], dtype, capacity: int = 1024):
+        self._data = np.empty((capacity,) + shape_tail, dtype=dtype)
+        self.length = 0
+
+    def extend(self, values: np.ndarray):
+        needed = self.length + values.shape[0]
+        if needed > self._data.shape[0]:
+            capacity = max(needed, 2 * self._data.shape[0])
+            grown = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self.length] = self._data[:self.length]
+            # readers holding the old buffer keep a valid (shorter) view
+            self._data = grown
+        self._data[self.length:needed] = values
+        self.length = needed
+
+    def view(self, length: Optional[int] = None) -> np.ndarray:
+        return self._data[:self.length if length is None else length]
+
+
+def _squared_distances(queries: np.ndarray, vectors: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """(Q, N) squared L2 distances using |q|^2 - 2 q.x + |x|^2"""
+    distances = queries @ vectors.T
+    distances *= -2.0
+    distances += norms
+    distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+    np.maximum(distances, 0.0, out=distances)
+    return distances
+
+
+def _top_k(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted k smallest distances per row and the matching ids"""
+    if distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1) if ids.ndim == 2 else ids[part]
+    elif ids.ndim == 1:
+        ids = np.broadcast_to(ids, distances.shape)
+    order = np.argsort(distances, axis=1)
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+def _pad(distances: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pad results with inf / -1 up to k columns"""
+    missing = k - distances.shape[1]
+    if missing <= 0:
+        return distances, ids
+    return (
+        np.pad(distances, ((0, 0), (0, missing)), constant_values=np.inf),
+        np.pad(ids, ((0, 0), (0, missing)), constant_values=-1)
+    )
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """Index of each row's nearest centroid, in row blocks bounding the distance matrix"""
+    block = max(1, ASSIGN_BLOCK_ELEMENTS // max(1, len(centroids)))
+    nearest = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block):
+        stop = start + block
+        nearest[start:stop] = np.argmin(_squared_distances(vectors[start:stop], centroids, norms), axis=1)
+    return nearest
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; returns (clusters, F) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], size=clusters, replace=False)].copy()
+    for _ in range(iterations):
+        norms = np.einsum('ij,ij->i', centroids, centroids)
+        assignment = nearest_centroids(vectors, centroids, norms)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        occupied = counts > 0
+        centroids[occupied] = sums[occupied] / counts[occupied, None]
+        # re-seed empty clusters from random points
+        empty = np.nonzero(~occupied)[0]
+        if empty.size:
+            centroids[empty] = vectors[rng.choice(vectors.shape[0], size=empty.size, replace=False)]
+    return centroids
+
+
+def _assign(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    centroids: np.ndarray,
+    centroid_norms: np.ndarray,
+    lists: List[_GrowableArray]
+):
+    """Append each row id to the inverted list of its nearest centroid"""
+    nearest = nearest_centroids(vectors, centroids, centroid_norms)
+    order = np.argsort(nearest, kind='stable')
+    list_ids, starts = np.unique(nearest[order], return_index=True)
+    for list_id, members in zip(list_ids, np.split(ids[order], starts[1:])):
+        lists[list_id].extend(members)
+
+
+class VectorIndex:
+    def __init__(
+        self,
+        dim: int,
+        ivf_threshold: int = 100000,
+        nprobe: int = 8,
+        train_sample: int = 100000
+    ):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self._vectors = _GrowableArray((dim,), np.float32)
+        self._norms = _GrowableArray((), np.float32)
+        self._centroids: Optional[np.ndarray] = None
+        self._centroid_norms: Optional[np.ndarray] = None
+        self._lists: List[_GrowableArray] = []
+        self._trained_on = 0
+        # set while a retrain runs outside the lock
+        self._training = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._vectors.length
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Append vectors and return their row ids"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            start = len(self)
+            self._vectors.extend(vectors)
+            self._norms.extend(np.einsum('ij,ij->i', vectors, vectors))
+            ids = np.arange(start, start + vectors.shape[0])
+            if self._centroids is not None:
+                _assign(vectors, ids, self._centroids, self._centroid_norms, self._lists)
+            # (re)partition once the base outgrows exact search or the
+            # current quantizer was trained on a much smaller base
+            train = (
+                not self._training
+                and len(self) >= self.ivf_threshold
+                and len(self) >= 4 * self._trained_on
+            )
+            if train:
+                self._training = True
+                count = len(self)
+                snapshot = self._vectors.view(count)
+        if train:
+            try:
+                self._train(snapshot)
+            finally:
+                with self._lock:
+                    self._training = False
+        return ids
+
+    def _train(self, vectors: np.ndarray):
+        """
+        Partition a snapshot of the first len(vectors) rows without holding
+        the lock, then catch up on rows added meanwhile and swap it in.
+        """
+        clusters = max(1, int(4 * np.sqrt(len(vectors))))
+        sample = vectors
+        if len(vectors) > self.train_sample:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), self.train_sample, replace=False)]
+        centroids = kmeans(sample, min(clusters, len(sample)))
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        lists = [_GrowableArray((), np.int64, capacity=64) for _ in range(len(centroids))]
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = vectors[start:start + SEARCH_BLOCK_ROWS]
+            _assign(block, np.arange(start, start + len(block)), centroids, centroid_norms, lists)
+
+        with self._lock:
+            count = len(self)
+            if count > len(vectors):
+                _assign(
+                    self._vectors.view(count)[len(vectors):], np.arange(len(vectors), count),
+                    centroids, centroid_norms, lists
+                )
+            self._centroids, self._centroid_norms, self._lists = centroids, centroid_norms, lists
+            self._trained_on = len(vectors)
+        LOGGER.info(f"Partitioned {count} vectors into {len(centroids)} lists")
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest rows for each of Q queries: (Q, k) squared distances and
+        row ids, nearest first, padded with inf / -1 when fewer exist.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            count = len(self)
+            vectors = self._vectors.view(count)
+            norms = self._norms.view(count)
+            centroids, centroid_norms = self._centroids, self._centroid_norms
+            lists = [(posting, posting.length) for posting in self._lists]
+
+        if count == 0:
+            return _pad(np.empty((len(queries), 0)), np.empty((len(queries), 0), dtype=np.int64), k)
+        if centroids is None:
+            return self._search_exact(queries, vectors, norms, k)
+
+        probes = min(self.nprobe, len(centroids))
+        nearest_lists = np.argpartition(
+            _squared_distances(queries, centroids, centroid_norms), probes - 1, axis=1
+        )[:, :probes]
+        all_distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([lists[j][0].view(lists[j][1]) for j in nearest_lists[i]])
+            if candidates.size == 0:
+                continue
+            distances = _squared_distances(query[None, :], vectors[candidates], norms[candidates])
+            top_distances, top_ids = _top_k(distances, candidates, min(k, candidates.size))
+            all_distances[i, :top_ids.shape[1]] = top_distances[0]
+            all_ids[i, :top_ids.shape[1]] = top_ids[0]
+        return all_distances, all_ids
+
+    def _search_exact(self, queries, vectors, norms, k):
+        best_distances = best_ids = None
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, len(vectors))
+            distances = _squared_distances(queries, vectors[start:stop], norms[start:stop])
+            distances, ids = _top_k(distances, np.arange(start, stop), min(k, stop - start))
+            if best_distances is not None:
+                distances, ids = _top_k(
+                    np.hstack([best_distances, distances]), np.hstack([best_ids, ids]), k
+                )
+            best_distances, best_ids = distances, ids
+        return _pad(best_distances, best_ids, k)
+
+    def vectors(self) -> np.ndarray:
+        return self._vectors.view()
+
+
+class Recommendation(NamedTuple):
+    treatment: str
+    confidence: float
+    rationale: str
+
+
+class PatientSimilarityIndex:
+    """
+    Vector index plus the treatment and outcome of every indexed patient.
+    Features are standardized with a scale fixed when the index is created
+    so that stored vectors stay comparable as patients are added.
+    """
+
+    def __init__(
+        self,
+        mean: np.ndarray,
+        std: np.ndarray,
+        ivf_threshold: int = 100000,
+        nprobe: int = 8
+    ):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.where(np.asarray(std, dtype=np.float32) > 0, std, 1.0).astype(np.float32)
+        self.index = VectorIndex(len(self.mean), ivf_threshold=ivf_threshold, nprobe=nprobe)
+        self.treatments: List[str] = []
+        self._treatment_ids: Dict[str, int] = {}
+        self._treatment_of = _GrowableArray((), np.int32)
+        self._outcome_of = _GrowableArray((), np.float32)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fit(cls, features: np.ndarray, treatments: List[str], outcomes: np.ndarray, **options) -> "PatientSimilarityIndex":
+        """Create an index scaled to `features` and load it with them"""
+        index = cls(features.mean(axis=0), features.std(axis=0), **options)
+        index.add(features, treatments, outcomes)
+        return index
+
+    @classmethod
+    def from_csv(cls, path: str, **options) -> "PatientSimilarityIndex":
+        with open(path, newline='') as source:
+            rows = list(csv.DictReader(source))
+        return cls.fit(
+            PATIENT_PROFILE_ENCODER.encode_batch(rows),
+            [row['treatment'] for row in rows],
+            np.array([float(row['outcome']) for row in rows], dtype=np.float32),
+            **options
+        )
+
+    def _standardize(self, features: np.ndarray) -> np.ndarray:
+        return (np.asarray(features, dtype=np.float32) - self.mean) / self.std
+
+    def add(self, features: np.ndarray, treatments: List[str], outcomes: np.ndarray):
+        """Insert (N, F) encoded patients with their treatment and outcome (1 = positive)"""
+        with self._lock:
+            treatment_ids = np.array(
+                [self._treatment_ids.setdefault(t, len(self._treatment_ids)) for t in treatments],
+                dtype=np.int32
+            )
+            self.treatments = list(self._treatment_ids)
+            # metadata first: a row id is only searchable once its vector lands
+            self._treatment_of.extend(treatment_ids)
+            self._outcome_of.extend(np.asarray(outcomes, dtype=np.float32))
+            self.index.add(self._standardize(features))
+
+    def neighbours(self, features: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.search(self._standardize(features), k)
+
+    def recommend(self, features: np.ndarray, k: int = 50, top: int = 3) -> List[List[Recommendation]]:
+        """
+        Rank treatments for each of N encoded patients by the similarity-
+        weighted positive-outcome rate among their k nearest neighbours.
+        """
+        distances, ids = self.neighbours(features, k)
+        treatment_of = self._treatment_of.view()
+        outcome_of = self._outcome_of.view()
+        treatments = self.treatments
+
+        results = []
+        for row_distances, row_ids in zip(distances, ids):
+            found = row_ids >= 0
+            row_ids, row_distances = row_ids[found], row_distances[found]
+            if row_ids.size == 0:
+                results.append([])
+                continue
+            weights = 1.0 / (1.0 + row_distances)
+            given = treatment_of[row_ids]
+            weight_sum = np.bincount(given, weights=weights, minlength=len(treatments))
+            positive = np.bincount(given, weights=weights * outcome_of[row_ids], minlength=len(treatments))
+            counts = np.bincount(given, minlength=len(treatments))
+            successes = np.bincount(given, weights=outcome_of[row_ids], minlength=len(treatments))
+            # one pseudo-observation at 50% keeps single lucky matches from ranking first
+            rate = (positive + 0.5) / (weight_sum + 1.0)
+
+            ranked = [t for t in np.argsort(-rate) if counts[t] > 0][:top]
+            results.append([
+                Recommendation(
+                    treatment=treatments[t],
+                    confidence=float(rate[t]),
+                    rationale=(
+                        f"{int(counts[t])} of {row_ids.size} most similar patients received "
+                        f"{treatments[t]}; {int(successes[t])} had a positive outcome"
+                    )
+                )
+                for t in ranked
+            ])
+        return results
+
+    def save(self, path: str):
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            mean=self.mean,
+            std=self.std,
+            vectors=self.index.vectors() * self.std + self.mean,
+            treatments=np.array(self.treatments),
+            treatment_of=self._treatment_of.view(),
+            outcome_of=self._outcome_of.view()
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, **options) -> "PatientSimilarityIndex":
+        data = np.load(path)
+        index = cls(data['mean'], data['std'], **options)
+        treatments = [str(t) for t in data['treatments']]
+        index.add(data['vectors'], [treatments[t] for t in data['treatment_of']], data['outcome_of'])
+        return index
+
+
+def load_index_from_env() -> Optional[PatientSimilarityIndex]:
+    """
+    Load the index at PATIENT_INDEX_PATH, building it first from
+    PATIENT_OUTCOMES_SOURCE if it hasn't been built yet.
+    """
+    path = os.getenv("PATIENT_INDEX_PATH")
+    if not path:
+        return None
+    options = {
+        'ivf_threshold': int(os.getenv("PATIENT_INDEX_IVF_THRESHOLD", "100000")),
+        'nprobe': int(os.getenv("PATIENT_INDEX_NPROBE", "8")),
+    }
+    if not os.path.exists(path):
+        source = os.getenv("PATIENT_OUTCOMES_SOURCE")
+        if not source:
+            raise FileNotFoundError(f"No patient similarity index at {path}")
+        index = PatientSimilarityIndex.from_csv(source, **options)
+        index.save(path)
+        return index
+    return PatientSimilarityIndex.load(path, **options)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        sys.exit("usage: patient_similarity.py build <outcomes.csv> <index.npz>")
+    index = PatientSimilarityIndex.from_csv(sys.argv[2])
+    index.save(sys.argv[3])
+    print(f"Indexed {len(index.index)} patients, {len(index.treatments)} treatments")
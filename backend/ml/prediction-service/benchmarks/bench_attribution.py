@@ -0,0 +1,48 @@
+"""
+Cost of batched risk_factors explanations next to plain inference.
+
+    python benchmarks/bench_attribution.py [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from models.attribution import AttributionEngine  # noqa: E402
+from models.dense_engine import DenseInferenceEngine  # noqa: E402
+from models.no_show_model import NoShowPredictionModel  # noqa: E402
+from bench_dense_inference import time_per_call  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = DenseInferenceEngine.from_keras(NoShowPredictionModel().build_model())
+    rng = np.random.default_rng(0)
+    reference = np.zeros(engine.input_dim, dtype=np.float32)
+    explainers = [("gradient_x_input", AttributionEngine(engine, reference, "gradient_x_input"))] + [
+        (f"ig_{steps}", AttributionEngine(engine, reference, "integrated_gradients", steps))
+        for steps in (4, 8, 16)
+    ]
+
+    print(f"{'batch':>6} {'predict_us':>11} " + " ".join(f"{name + '_us':>20}" for name, _ in explainers)
+          + f" {'ig_8_sum_err':>13}")
+    for batch in (1, 8, 64, 512, 4096):
+        features = rng.normal(size=(batch, engine.input_dim)).astype(np.float32)
+        iterations = max(args.iterations // batch, 5)
+        predict_us = time_per_call(lambda: engine.predict(features), iterations)
+        explain_us = [time_per_call(lambda: explainer.explain(features), iterations) for _, explainer in explainers]
+        # integrated gradients should account for f(x) - f(reference)
+        contributions = explainers[2][1].explain(features).sum(axis=1)
+        expected = engine.predict(features)[:, 0] - engine.predict(reference[None, :])[0, 0]
+        error = float(np.max(np.abs(contributions - expected)))
+        print(f"{batch:>6} {predict_us:>11.1f} " + " ".join(f"{us:>20.1f}" for us in explain_us) + f" {error:>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
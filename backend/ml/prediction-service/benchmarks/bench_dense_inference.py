@@ -0,0 +1,52 @@
+"""
+Latency of the NumPy Dense engine versus Keras for the no-show network.
+
+    python benchmarks/bench_dense_inference.py [--iterations 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from models.dense_engine import DenseInferenceEngine  # noqa: E402
+from models.no_show_model import NoShowPredictionModel  # noqa: E402
+
+
+def time_per_call(fn, iterations: int) -> float:
+    """Median-of-three mean latency in microseconds"""
+    for _ in range(min(iterations, 1000)):
+        fn()
+    runs = []
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        runs.append((time.perf_counter() - started) / iterations)
+    return 1e6 * sorted(runs)[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--keras-iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    model = NoShowPredictionModel().build_model()
+    engine = DenseInferenceEngine.from_keras(model)
+    rng = np.random.default_rng(0)
+
+    print(f"{'batch':>6} {'numpy_us':>10} {'keras_us':>10} {'max_abs_err':>12}")
+    for batch in (1, 8, 64, 512):
+        features = rng.normal(size=(batch, engine.input_dim)).astype(np.float32)
+        numpy_us = time_per_call(lambda: engine.predict(features), args.iterations // batch or 1)
+        keras_us = time_per_call(lambda: model.predict(features, verbose=0), args.keras_iterations)
+        error = engine.max_abs_error(model, features)
+        print(f"{batch:>6} {numpy_us:>10.1f} {keras_us:>10.1f} {error:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Deadline-aware admission control for the prediction endpoints.
+
+Every request carries a deadline: the caller's gRPC deadline, or for REST
+the X-Request-Timeout-Ms header (REQUEST_TIMEOUT_MS when absent). Requests
+take one of `max_concurrency` inference slots or wait in a queue of at most
+`max_queue`; anything beyond that is rejected at once (gRPC
+RESOURCE_EXHAUSTED / HTTP 429) instead of piling up in the server's thread
+pool. Queued requests give up when their deadline passes, and a request is
+dropped before inference if its remaining budget is shorter than the recent
+inference time, because the caller would have stopped waiting before it
+finished.
+
+That estimate only learns from admitted requests, so it must not be able to
+lock every caller out after one slow call: a single sample can raise it by
+at most `max_sample_growth` times, it decays with `service_time_half_life`
+while no request is admitted, and every `probe_interval` one request is
+let through regardless to measure the current inference time.
+
+With DEGRADE_ON_OVERLOAD=true, shed requests are answered with a fallback
+score instead: the last score served for the appointment if still in the
+prediction cache, otherwise a heuristic from the patient's no-show history.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from prediction_cache import PredictionCache
+
+# REST header carrying the caller's remaining budget in milliseconds
+TIMEOUT_HEADER = "X-Request-Timeout-Ms"
+
+# Confidence reported with fallback scores, by source
+DEGRADED_CONFIDENCE = {"cached": 0.6, "heuristic": 0.3}
+
+
+class Rejected(Exception):
+    """The request was not run"""
+    reason = "rejected"
+
+
+class Overloaded(Rejected):
+    reason = "overloaded"
+
+
+class DeadlineExceeded(Rejected):
+    reason = "deadline"
+
+
+def deadline_after(timeout: Optional[float], now: Optional[float] = None) -> Optional[float]:
+    """Monotonic deadline `timeout` seconds from now; None means no deadline"""
+    if timeout is None:
+        return None
+    return (time.monotonic() if now is None else now) + timeout
+
+
+def parse_timeout_ms(value: Optional[str], default_ms: float = 0.0) -> Optional[float]:
+    """Header value in milliseconds -> timeout in seconds (None if unset and no default)"""
+    if value not in (None, ""):
+        try:
+            milliseconds = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid {TIMEOUT_HEADER}: {value!r}")
+    else:
+        milliseconds = default_ms
+    return milliseconds / 1000.0 if milliseconds > 0 else None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        ewma_alpha: float = 0.2,
+        max_sample_growth: float = 2.0,
+        min_sample_cap: float = 0.05,
+        service_time_half_life: float = 10.0,
+        probe_interval: float = 1.0
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.ewma_alpha = ewma_alpha
+        # a sample counts as at most max(max_sample_growth * estimate, min_sample_cap)
+        self.max_sample_growth = max_sample_growth
+        self.min_sample_cap = min_sample_cap
+        self.service_time_half_life = service_time_half_life
+        self.probe_interval = probe_interval
+        # smoothed seconds per admitted request, as of _updated_at
+        self.service_time = 0.0
+        self._updated_at = time.monotonic()
+        self._last_admitted = time.monotonic()
+        self._running = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            "admitted": 0,
+            "rejected_overloaded": 0,
+            "expired_on_arrival": 0,
+            "expired_in_queue": 0,
+            "insufficient_budget": 0,
+            "probes": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0")) or (os.cpu_count() or 1),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            service_time_half_life=float(os.getenv("ADMISSION_SERVICE_TIME_HALF_LIFE", "10")),
+            probe_interval=float(os.getenv("ADMISSION_PROBE_INTERVAL", "1"))
+        )
+
+    def expected_service_time(self, now: Optional[float] = None) -> float:
+        """The smoothed inference time, decayed for the time since it was last updated"""
+        now = time.monotonic() if now is None else now
+        if self.service_time_half_life <= 0:
+            return self.service_time
+        return self.service_time * 0.5 ** ((now - self._updated_at) / self.service_time_half_life)
+
+    def check_capacity(self):
+        """
+        Raise Overloaded if a new request would be rejected right now. A
+        lock-free early check for callers that hand work to another thread
+        pool first; run() still enforces the limits.
+        """
+        if self._running >= self.max_concurrency and self._waiting >= self.max_queue:
+            with self._cond:
+                self._reject("rejected_overloaded", Overloaded("Prediction queue is full"))
+
+    def run(self, deadline: Optional[float], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) in an inference slot, waiting for one no
+        longer than `deadline` (a time.monotonic() value, or None).
+        Raises Overloaded or DeadlineExceeded without calling fn.
+        """
+        self._acquire(deadline)
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            now = time.monotonic()
+            with self._cond:
+                self._running -= 1
+                current = self.expected_service_time(now)
+                # one outlier (a cold start, a GC pause) moves the estimate only so far
+                sample = min(now - started, max(self.max_sample_growth * current, self.min_sample_cap))
+                self.service_time = current + self.ewma_alpha * (sample - current)
+                self._updated_at = now
+                self._cond.notify()
+
+    def _acquire(self, deadline: Optional[float]):
+        with self._cond:
+            if deadline is not None and deadline <= time.monotonic():
+                self._reject("expired_on_arrival", DeadlineExceeded("Deadline expired before admission"))
+            if self._running >= self.max_concurrency:
+                if self._waiting >= self.max_queue:
+                    self._reject("rejected_overloaded", Overloaded("Prediction queue is full"))
+                self._waiting += 1
+                try:
+                    while self._running >= self.max_concurrency:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._reject("expired_in_queue", DeadlineExceeded("Deadline expired while queued"))
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            now = time.monotonic()
+            expected = self.expected_service_time(now)
+            if deadline is not None and deadline - now < expected:
+                if now - self._last_admitted < self.probe_interval:
+                    # a slot may be free; pass the wakeup on to the next waiter
+                    self._cond.notify()
+                    self._reject(
+                        "insufficient_budget",
+                        DeadlineExceeded(f"Remaining budget below expected inference time ({expected * 1000:.1f} ms)")
+                    )
+                # nothing admitted for a while: let this one through to re-measure
+                self._counters["probes"] += 1
+            self._running += 1
+            self._last_admitted = now
+            self._counters["admitted"] += 1
+
+    def _reject(self, counter: str, error: Rejected):
+        self._counters[counter] += 1
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": self._waiting,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "service_time_ms": self.expected_service_time() * 1000.0,
+                **self._counters,
+            }
+
+
+class FallbackScorer:
+    """
+    Scores for shed requests: the fresh cached score for the same
+    (patient, appointment), with its explanation if one was computed,
+    otherwise the heuristic 1 - (1 - base_rate) * 0.75 ** previous_no_shows.
+    """
+
+    def __init__(self, cache: PredictionCache, base_rate: float = 0.15):
+        self.cache = cache
+        self.base_rate = base_rate
+        self._lock = threading.Lock()
+        self._counters = {"cached": 0, "heuristic": 0}
+
+    @classmethod
+    def from_env(cls, cache: PredictionCache) -> "FallbackScorer":
+        return cls(cache, base_rate=float(os.getenv("DEGRADED_BASE_RATE", "0.15")))
+
+    def score(
+        self,
+        patient_id: str,
+        appointment_id: str,
+        data: Mapping[str, Any]
+    ) -> Tuple[float, str, Optional[Dict[str, float]]]:
+        """(probability, source, risk_factors); source is 'cached' or 'heuristic'"""
+        entry = self.cache.get(patient_id, appointment_id)
+        source = "heuristic" if entry is None else "cached"
+        with self._lock:
+            self._counters[source] += 1
+        if entry is not None:
+            return entry.probability, source, entry.risk_factors
+        try:
+            previous_no_shows = max(0.0, float(data.get("previous_no_shows") or 0.0))
+        except (TypeError, ValueError):
+            previous_no_shows = 0.0
+        return 1.0 - (1.0 - self.base_rate) * 0.75 ** previous_no_shows, source, None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters)
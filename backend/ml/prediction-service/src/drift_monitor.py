@@ -0,0 +1,224 @@
+"""
+Windowed drift sketches of the no-show model's inputs and outputs.
+
+Every scored batch is added to a DriftSketch for the current time window
+(`window_seconds` long; the last `max_windows` are kept). Each thread
+buffers its rows in its own shard and folds them into that shard's sketch
+once `buffer_rows` have accumulated, the window changes, or `flush_seconds`
+have passed. The shard's lock is only ever contended by an export, and the
+shared windows lock is taken only when a thread first writes to a new
+window. Exports flush every shard before merging it, so rows buffered by a
+thread that has gone idle are reported too.
+
+DriftReporter periodically posts changed windows to the analytics service,
+which merges them across replicas and compares them with the training
+baseline.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import requests
+
+from models.drift import DriftSketch
+
+LOGGER = logging.getLogger("drift_monitor")
+
+
+class _Shard:
+    """
+    One thread's rows for one window; written by that thread, and flushed
+    and read by exports under `lock`
+    """
+
+    def __init__(self, sketch: DriftSketch, buffer_rows: int):
+        self.sketch = sketch
+        self.width = len(sketch.columns)
+        self.buffer = np.empty((buffer_rows, self.width + 1), dtype=np.float64)
+        self.fill = 0
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, features: np.ndarray, probabilities: np.ndarray):
+        n = features.shape[0]
+        with self.lock:
+            if n >= self.buffer.shape[0]:
+                self.sketch.update(features, probabilities)
+                return
+            if self.fill + n > self.buffer.shape[0]:
+                self._flush()
+            self.buffer[self.fill:self.fill + n, :self.width] = features
+            self.buffer[self.fill:self.fill + n, self.width] = probabilities
+            self.fill += n
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.fill:
+            self.sketch.update(self.buffer[:self.fill, :self.width], self.buffer[:self.fill, self.width])
+            self.fill = 0
+        self.flushed_at = time.monotonic()
+
+    def merge_into(self, sketch: DriftSketch):
+        """Flush the buffered rows and merge this shard into `sketch`"""
+        with self.lock:
+            self._flush()
+            sketch.merge(self.sketch)
+
+
+class _Window:
+    def __init__(self, start: float):
+        self.start = start
+        self.shards: List[_Shard] = []
+
+
+class DriftMonitor:
+    def __init__(
+        self,
+        columns: Sequence[str],
+        categorical: Sequence[str] = (),
+        window_seconds: float = 3600.0,
+        max_windows: int = 24,
+        buffer_rows: int = 256,
+        flush_seconds: float = 10.0
+    ):
+        self.template = DriftSketch(columns, categorical)
+        self.window_seconds = window_seconds
+        self.max_windows = max_windows
+        self.buffer_rows = buffer_rows
+        self.flush_seconds = flush_seconds
+        self._windows: "OrderedDict[float, _Window]" = OrderedDict()
+        self._windows_lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, columns: Sequence[str], categorical: Sequence[str]) -> "DriftMonitor":
+        return cls(
+            columns,
+            categorical,
+            window_seconds=float(os.getenv("DRIFT_WINDOW_SECONDS", "3600")),
+            max_windows=int(os.getenv("DRIFT_MAX_WINDOWS", "24")),
+            buffer_rows=int(os.getenv("DRIFT_BUFFER_ROWS", "256"))
+        )
+
+    def observe(self, features: np.ndarray, probabilities: Sequence[float]):
+        """Record an encoded (N, F) batch and its predicted probabilities"""
+        now = time.time()
+        start = now - now % self.window_seconds
+        shard = getattr(self._local, "shard", None)
+        if shard is None or self._local.window_start != start:
+            if shard is not None:
+                shard.flush()
+            shard = self._local.shard = self._new_shard(start)
+            self._local.window_start = start
+        shard.add(
+            np.asarray(features, dtype=np.float64).reshape(-1, shard.width),
+            np.asarray(probabilities, dtype=np.float64).reshape(-1)
+        )
+        if time.monotonic() - shard.flushed_at > self.flush_seconds:
+            shard.flush()
+
+    def _new_shard(self, start: float) -> _Shard:
+        shard = _Shard(self.template.empty_like(), self.buffer_rows)
+        with self._windows_lock:
+            window = self._windows.get(start)
+            if window is None:
+                window = self._windows[start] = _Window(start)
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            window.shards.append(shard)
+        return shard
+
+    def export(self, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Merged sketch of each retained window ending after `since` (epoch
+        seconds), oldest first: [{start, end, rows, sketch}]. Buffered rows
+        are flushed first, so every observed row is included.
+        """
+        with self._windows_lock:
+            windows = [(window.start, list(window.shards)) for window in self._windows.values()]
+        exported = []
+        for start, shards in windows:
+            end = start + self.window_seconds
+            if since is not None and end <= since:
+                continue
+            merged = self.template.empty_like()
+            for shard in shards:
+                shard.merge_into(merged)
+            exported.append({
+                "start": _isoformat(start),
+                "end": _isoformat(end),
+                "rows": merged.rows,
+                "sketch": merged.to_dict(),
+            })
+        return exported
+
+
+def _isoformat(epoch: float) -> str:
+    return datetime.datetime.utcfromtimestamp(epoch).isoformat()
+
+
+class DriftReporter:
+    """Posts windows whose sketches changed to the analytics service"""
+
+    def __init__(self, monitor: DriftMonitor, model_name: str, url: str, interval: float = 60.0, replica: Optional[str] = None):
+        self.monitor = monitor
+        self.model_name = model_name
+        self.url = url
+        self.interval = interval
+        self.replica = replica or f"{socket.gethostname()}-{os.getpid()}"
+        self._reported: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, monitor: DriftMonitor, model_name: str) -> "DriftReporter":
+        return cls(
+            monitor,
+            model_name,
+            url=os.getenv("ANALYTICS_URL", "http://analytics-service:6562"),
+            interval=float(os.getenv("DRIFT_EXPORT_INTERVAL", "60")),
+            replica=os.getenv("REPLICA_ID")
+        )
+
+    def report(self):
+        exported = self.monitor.export()
+        changed = [window for window in exported if self._reported.get(window["start"]) != window["rows"]]
+        if not changed:
+            return
+        requests.post(
+            f"{self.url}/analytics/drift/sketches",
+            json={"replica": self.replica, "model": self.model_name, "windows": changed},
+            timeout=10
+        ).raise_for_status()
+        # windows the monitor no longer keeps are forgotten here too
+        self._reported = {window["start"]: window["rows"] for window in exported}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception as e:
+                LOGGER.warning(f"Failed to report drift sketches: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="drift-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop reporting and send the final state, buffered rows included"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.report()
+        except Exception as e:
+            LOGGER.warning(f"Failed to report drift sketches: {e}")
@@ -0,0 +1,360 @@
+"""
+Per-patient history features for no-show prediction.
+
+`previous_no_shows` and `days_since_last_visit` are kept as running
+aggregates, updated as appointment status changes arrive, instead of being
+recomputed from the full appointment history on every prediction.
+
+Aggregates live in the `patient_features` table. The last status applied
+to each appointment is kept in `appointment_statuses`, so replayed events
+and corrections (NO_SHOW -> COMPLETED) adjust the counts rather than
+double-counting. Recently used patients are served from an in-memory LRU
+hot tier; misses are fetched for a whole batch with one query.
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+from models.database import Database
+
+NO_SHOW = "NO_SHOW"
+COMPLETED = "COMPLETED"
+
+# days_since_last_visit for patients with no completed visit on record
+NO_VISIT_DAYS = 365.0
+
+# Attempts at an apply_events transaction that lost an insert race
+APPLY_ATTEMPTS = 5
+
+
+def normalize_status(status: str) -> str:
+    """'APPOINTMENT_STATUS_NO_SHOW' / 'no_show' -> 'NO_SHOW'"""
+    status = status.strip().upper()
+    if status.startswith("APPOINTMENT_STATUS_"):
+        status = status[len("APPOINTMENT_STATUS_"):]
+    return status
+
+
+def _parse_time(value: Any) -> Optional[datetime.datetime]:
+    """ISO-8601 string or datetime -> naive UTC datetime"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        # fromisoformat() only accepts a trailing 'Z' from Python 3.11
+        value = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _status_row(event: Mapping[str, Any]) -> Dict[str, Any]:
+    return {
+        "b_appointment_id": event["appointment_id"],
+        "b_patient_id": event["patient_id"],
+        "b_status": event["status"],
+        "b_start_time": event["start_time"],
+    }
+
+
+class PatientFeatures(NamedTuple):
+    previous_no_shows: int
+    last_visit: Optional[datetime.datetime]
+
+    def days_since_last_visit(self, at: datetime.datetime) -> float:
+        if self.last_visit is None:
+            return NO_VISIT_DAYS
+        return max(0.0, (at - self.last_visit).total_seconds() / 86400.0)
+
+
+EMPTY = PatientFeatures(previous_no_shows=0, last_visit=None)
+
+# Encoder columns this store can fill in
+STORE_COLUMNS = ("previous_no_shows", "days_since_last_visit")
+
+
+class PatientFeatureStore:
+    def __init__(self, database: Database, hot_capacity: int = 100000, hot_ttl: float = 300.0):
+        self.database = database
+        self.hot_capacity = hot_capacity
+        # bounds staleness when another replica applied the event
+        self.hot_ttl = hot_ttl
+        self._hot: "OrderedDict[str, tuple]" = OrderedDict()
+        self._hot_lock = threading.Lock()
+        # serializes read-modify-write of the aggregates within this process;
+        # across processes the row locks taken in apply_events (and a rerun
+        # when two replicas insert the same new row) do the same
+        self._write_lock = threading.Lock()
+
+        self.metadata = MetaData()
+        self.features_table = Table(
+            "patient_features",
+            self.metadata,
+            Column("patient_id", String, primary_key=True),
+            Column("previous_no_shows", Integer, nullable=False),
+            Column("last_visit", DateTime, nullable=True),
+            Column("updated_at", DateTime, nullable=False),
+            extend_existing=True
+        )
+        self.statuses_table = Table(
+            "appointment_statuses",
+            self.metadata,
+            Column("appointment_id", String, primary_key=True),
+            Column("patient_id", String, nullable=False),
+            Column("status", String, nullable=False),
+            Column("start_time", DateTime, nullable=True),
+            extend_existing=True
+        )
+        self.metadata.create_all(self.database.engine)
+
+    # ---- hot tier ----
+
+    def _hot_get(self, patient_id: str, now: float) -> Optional[PatientFeatures]:
+        entry = self._hot.get(patient_id)
+        if entry is None or now - entry[1] > self.hot_ttl:
+            return None
+        self._hot.move_to_end(patient_id)
+        return entry[0]
+
+    def _hot_put(self, features: Mapping[str, PatientFeatures], now: float):
+        with self._hot_lock:
+            for patient_id, value in features.items():
+                entry = self._hot.get(patient_id)
+                # a read that raced with apply_events must not undo its update
+                if entry is not None and entry[1] > now:
+                    continue
+                self._hot[patient_id] = (value, now)
+                self._hot.move_to_end(patient_id)
+            while len(self._hot) > self.hot_capacity:
+                self._hot.popitem(last=False)
+
+    # ---- reads ----
+
+    def get_many(self, patient_ids: Iterable[str]) -> Dict[str, PatientFeatures]:
+        """Aggregates for each patient; unknown patients get EMPTY"""
+        now = time.monotonic()
+        found: Dict[str, PatientFeatures] = {}
+        missing = []
+        with self._hot_lock:
+            for patient_id in dict.fromkeys(patient_ids):
+                value = self._hot_get(patient_id, now)
+                if value is None:
+                    missing.append(patient_id)
+                else:
+                    found[patient_id] = value
+        if not missing:
+            return found
+
+        loaded = {patient_id: EMPTY for patient_id in missing}
+        table = self.features_table
+        with self.database.connect() as conn:
+            rows = conn.execute(
+                select(table.c.patient_id, table.c.previous_no_shows, table.c.last_visit)
+                .where(table.c.patient_id.in_(missing))
+            )
+            for patient_id, previous_no_shows, last_visit in rows:
+                loaded[patient_id] = PatientFeatures(previous_no_shows, last_visit)
+        # unknown patients are cached too, so new patients don't hit the table each time
+        self._hot_put(loaded, now)
+        found.update(loaded)
+        return found
+
+    def lookup(
+        self,
+        patient_ids: Sequence[str],
+        at: Optional[Sequence[Optional[datetime.datetime]]] = None
+    ) -> np.ndarray:
+        """
+        (N, 2) float32 [previous_no_shows, days_since_last_visit] for each
+        patient as of the matching time in `at` (default: now).
+        """
+        features = self.get_many(patient_ids)
+        now = datetime.datetime.utcnow()
+        out = np.empty((len(patient_ids), len(STORE_COLUMNS)), dtype=np.float32)
+        for i, patient_id in enumerate(patient_ids):
+            value = features[patient_id]
+            when = (at[i] if at is not None else None) or now
+            out[i, 0] = value.previous_no_shows
+            out[i, 1] = value.days_since_last_visit(when)
+        return out
+
+    def fill(self, patient_id: str, data: Mapping[str, Any], at: Any = None) -> Dict[str, Any]:
+        """`data` with any missing store columns filled in for this patient"""
+        if all(data.get(column) not in (None, '') for column in STORE_COLUMNS):
+            return dict(data)
+        row = self.lookup([patient_id], [_parse_time(at)])[0]
+        filled = dict(data)
+        for column, value in zip(STORE_COLUMNS, row):
+            if filled.get(column) in (None, ''):
+                filled[column] = float(value)
+        return filled
+
+    def fill_batch(
+        self,
+        patient_ids: Sequence[str],
+        features: np.ndarray,
+        columns: Sequence[str],
+        at: Optional[Sequence[Any]] = None
+    ) -> np.ndarray:
+        """
+        Fill NaN store columns of an encoded (N, F) batch with one lookup,
+        as of the matching time in `at` (default: now).
+        Returns `features` untouched when nothing is missing.
+        """
+        positions = [columns.index(column) for column in STORE_COLUMNS]
+        missing = np.isnan(features[:, positions]).any(axis=1)
+        if not missing.any():
+            return features
+        rows = np.nonzero(missing)[0]
+        looked_up = self.lookup(
+            [patient_ids[i] for i in rows],
+            None if at is None else [_parse_time(at[i]) for i in rows]
+        )
+        filled = np.array(features, dtype=np.float32)
+        for j, position in enumerate(positions):
+            column = filled[rows, position]
+            filled[rows, position] = np.where(np.isnan(column), looked_up[:, j], column)
+        return filled
+
+    # ---- writes ----
+
+    def apply_events(self, events: Iterable[Mapping[str, Any]]) -> int:
+        """
+        Apply appointment status changes
+        ({patient_id, appointment_id, status, start_time}) in one transaction.
+        Returns the number of appointments whose status changed.
+
+        Row locks only cover rows that already exist. When another replica
+        inserts the same new appointment or patient first, this
+        transaction's insert fails; it is then rerun, and the rerun locks
+        and builds on the other replica's rows.
+        """
+        latest: Dict[str, Dict[str, Any]] = {}
+        for event in events:
+            latest[event["appointment_id"]] = {
+                "appointment_id": event["appointment_id"],
+                "patient_id": event["patient_id"],
+                "status": normalize_status(event["status"]),
+                "start_time": _parse_time(event.get("start_time")),
+            }
+        if not latest:
+            return 0
+
+        with self._write_lock:
+            for attempt in range(1, APPLY_ATTEMPTS + 1):
+                try:
+                    changed, updates = self._apply(latest)
+                    break
+                except IntegrityError:
+                    if attempt == APPLY_ATTEMPTS:
+                        raise
+        # refresh the hot tier only once the transaction has committed
+        if updates:
+            self._hot_put(updates, time.monotonic())
+        return changed
+
+    def _apply(self, latest: Dict[str, Dict[str, Any]]):
+        """One apply_events transaction: (changed count, new aggregates by patient)"""
+        statuses, aggregates = self.statuses_table, self.features_table
+        patient_ids = list({event["patient_id"] for event in latest.values()})
+        with self.database.begin() as conn:
+            previous = dict(conn.execute(
+                select(statuses.c.appointment_id, statuses.c.status)
+                .where(statuses.c.appointment_id.in_(list(latest)))
+                .with_for_update()
+            ).all())
+            current = {
+                patient_id: PatientFeatures(previous_no_shows, last_visit)
+                for patient_id, previous_no_shows, last_visit in conn.execute(
+                    select(aggregates.c.patient_id, aggregates.c.previous_no_shows, aggregates.c.last_visit)
+                    .where(aggregates.c.patient_id.in_(patient_ids))
+                    .with_for_update()
+                )
+            }
+            known_patients = set(current)
+
+            changed = [event for event in latest.values() if previous.get(event["appointment_id"]) != event["status"]]
+            for event in changed:
+                value = current.get(event["patient_id"], EMPTY)
+                was_no_show = previous.get(event["appointment_id"]) == NO_SHOW
+                no_shows = value.previous_no_shows + (event["status"] == NO_SHOW) - was_no_show
+                last_visit = value.last_visit
+                # a completed visit moving to another status keeps last_visit;
+                # recovering the one before it would need the full history
+                if event["status"] == COMPLETED and event["start_time"] is not None:
+                    last_visit = max(last_visit, event["start_time"]) if last_visit else event["start_time"]
+                current[event["patient_id"]] = PatientFeatures(max(0, no_shows), last_visit)
+            if not changed:
+                return 0, {}
+
+            updated_statuses = [e for e in changed if e["appointment_id"] in previous]
+            new_statuses = [e for e in changed if e["appointment_id"] not in previous]
+            if updated_statuses:
+                conn.execute(
+                    statuses.update()
+                    .where(statuses.c.appointment_id == bindparam("b_appointment_id"))
+                    .values(
+                        patient_id=bindparam("b_patient_id"),
+                        status=bindparam("b_status"),
+                        start_time=bindparam("b_start_time")
+                    ),
+                    [_status_row(e) for e in updated_statuses]
+                )
+            if new_statuses:
+                conn.execute(
+                    statuses.insert().values(
+                        appointment_id=bindparam("b_appointment_id"),
+                        patient_id=bindparam("b_patient_id"),
+                        status=bindparam("b_status"),
+                        start_time=bindparam("b_start_time")
+                    ),
+                    [_status_row(e) for e in new_statuses]
+                )
+
+            touched = {event["patient_id"] for event in changed}
+            updated_at = datetime.datetime.utcnow()
+            feature_rows = [{
+                "b_patient_id": patient_id,
+                "b_previous_no_shows": current[patient_id].previous_no_shows,
+                "b_last_visit": current[patient_id].last_visit,
+                "b_updated_at": updated_at,
+            } for patient_id in touched]
+            existing_rows = [row for row in feature_rows if row["b_patient_id"] in known_patients]
+            new_rows = [row for row in feature_rows if row["b_patient_id"] not in known_patients]
+            values = dict(
+                previous_no_shows=bindparam("b_previous_no_shows"),
+                last_visit=bindparam("b_last_visit"),
+                updated_at=bindparam("b_updated_at")
+            )
+            if existing_rows:
+                conn.execute(
+                    aggregates.update().where(aggregates.c.patient_id == bindparam("b_patient_id")).values(**values),
+                    existing_rows
+                )
+            if new_rows:
+                conn.execute(
+                    aggregates.insert().values(patient_id=bindparam("b_patient_id"), **values),
+                    new_rows
+                )
+        return len(changed), {patient_id: current[patient_id] for patient_id in touched}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._hot_lock:
+            return {"hot_entries": len(self._hot), "hot_capacity": self.hot_capacity}
+
+    def close(self):
+        self.database.dispose()
+
+    @classmethod
+    def from_env(cls) -> "PatientFeatureStore":
+        return cls(
+            Database.from_env(),
+            hot_capacity=int(os.getenv("FEATURE_STORE_HOT_CAPACITY", "100000")),
+            hot_ttl=float(os.getenv("FEATURE_STORE_HOT_TTL", "300"))
+        )
@@ -4,15 +4,25 @@ from concurrent import futures
 import datetime
 
 import grpc
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import uvicorn
 import requests
 
 import ml_service_pb2
 import ml_service_pb2_grpc
 from models.no_show_model import NoShowPredictionModel
+from event_log import EventLog
+from feature_encoders import NO_SHOW_ENCODER
+from feature_store import PatientFeatureStore
+from drift_monitor import DriftMonitor, DriftReporter
+from prediction_cache import PredictionCache
+from admission import (
+    DEGRADED_CONFIDENCE, AdmissionController, FallbackScorer, Overloaded, Rejected,
+    deadline_after, parse_timeout_ms
+)
 
 import logging
 LOGGER = logging.getLogger("prediction_service")
@@ -20,64 +30,237 @@ LOGGER = logging.getLogger("prediction_service")
 app = FastAPI(title="Healthcare ML Prediction Service")
 
 # ---- Load the ML model once at startup ----
-MODEL_NAME = os.getenv("MODEL_NAME", "no-show")
 MODEL_VERSION = os.getenv("MODEL_VERSION", "latest")
 no_show_model = NoShowPredictionModel()
-no_show_model.load_model(MODEL_NAME, MODEL_VERSION)
+no_show_model.load_model(MODEL_VERSION)
+# pay for engine extraction and the first Keras predict before taking traffic,
+# not in a request (where it would also skew the admission time estimate)
+no_show_model.warm_up()
+
+# ---- Prediction events go to the shared event log when one is configured ----
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR")
+prediction_event_log = None
+if EVENT_LOG_DIR:
+    prediction_event_log = EventLog(
+        EVENT_LOG_DIR,
+        fsync=os.getenv("EVENT_LOG_FSYNC", "false").lower() == "true"
+    )
+
+# ---- Per-patient history features, kept up to date from appointment events ----
+feature_store = PatientFeatureStore.from_env() if os.getenv("FEATURE_DB_URL") else None
+
+# ---- Admission control: bounded inference slots and queue, per-request deadlines ----
+admission = AdmissionController.from_env()
+# budget for requests that carry no deadline of their own (0 = unbounded)
+REQUEST_TIMEOUT_MS = float(os.getenv("REQUEST_TIMEOUT_MS", "0"))
+# recently served scores and explanations, per (patient, appointment)
+prediction_cache = PredictionCache.from_env()
+# answer shed requests with a cached or heuristic score instead of an error
+fallback_scorer = None
+if os.getenv("DEGRADE_ON_OVERLOAD", "false").lower() == "true":
+    fallback_scorer = FallbackScorer.from_env(prediction_cache)
+
+# ---- gRPC predictions are reported to analytics off the handler threads ----
+report_executor = futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="analytics-report")
+
+# ---- Windowed sketches of model inputs and scores, merged by analytics for drift checks ----
+drift_monitor = None
+drift_reporter = None
+if os.getenv("DRIFT_MONITORING", "true").lower() == "true":
+    drift_monitor = DriftMonitor.from_env(no_show_model.feature_columns, no_show_model.categorical_columns)
+    drift_reporter = DriftReporter.from_env(drift_monitor, no_show_model.model_name)
 
 
 # ---- REST request/response schema ----
 class PredictionRequest(BaseModel):
     patient_id: str
     features: Dict[str, Any]
+    # the appointment being scored; predictions without one are not reported
+    # to analytics, which matches them to appointment outcomes by this id
+    appointment_id: Optional[str] = None
+    # appointment start, used for days_since_last_visit (default: now)
+    start_time: Optional[str] = None
+    # also return risk_factors: each feature's contribution to the score
+    explain: bool = False
+
+
+class AppointmentEvent(BaseModel):
+    patient_id: str
+    appointment_id: str
+    status: str
+    start_time: Optional[str] = None
 
 # ---- Background task to report predictions to analytics ----
-async def report_to_analytics(patient_id: str, probability: float, risk_level: str):
+def report_to_analytics(appointment_ids: List[str], predictions: List[Dict[str, Any]]):
     """
-    Send prediction results to an analytics service.
-    This is a placeholder function; implement actual reporting logic.
+    Send prediction results to the analytics service, one event per
+    appointment; predictions without an appointment id are skipped.
+    With EVENT_LOG_DIR set the events are appended to the shared event log,
+    which the analytics service drains in batches; they are kept even while
+    analytics is down. Otherwise they are POSTed directly.
+    Both block (flock/fsync or HTTP), so this is a plain function, which
+    BackgroundTasks runs in the threadpool rather than on the event loop.
     """
+    prediction_time = datetime.datetime.utcnow().isoformat()
+    payloads = [
+        {
+            "appointment_id": appointment_id,
+            "prediction_time": prediction_time,
+            "no_show_probability": float(pred["no_show_probability"]),
+            "risk_level": pred["risk_level"],
+        }
+        for appointment_id, pred in zip(appointment_ids, predictions)
+        if appointment_id
+    ]
+    if not payloads:
+        return
+    if prediction_event_log is not None:
+        try:
+            prediction_event_log.append_many(payloads)
+        except Exception as e:
+            LOGGER.error(f"Failed to append prediction events: {e}")
+        return
+
     url = os.getenv("ANALYTICS_URL", "http://analytics-service:6562")
-    payload = {
-        "appointment_id": patient_id,
-        "prediction_time": datetime.utcnow().isoformat(),
-        "no_show_probability": probability,
-        "risk_level": risk_level,
-    }
-    try:
-        # fire-and-forget; you could add retries here
-        requests.post(f"{url}/analytics/predictions", json=payload, timeout=2)
-    except Exception as e:
-        # log and swallow so it doesn’t block your response
-        LOGGER.warning(f"Failed to report to analytics: {e}")
+    for payload in payloads:
+        try:
+            # fire-and-forget; you could add retries here
+            requests.post(f"{url}/analytics/predictions", json=payload, timeout=2)
+        except Exception as e:
+            # log and swallow so it doesn’t block your response
+            LOGGER.warning(f"Failed to report to analytics: {e}")
+
+def _risk_level(probability: float) -> str:
+    return no_show_model._get_risk_level(probability)
+
+def _observe(features, predictions: List[Dict[str, Any]]):
+    if drift_monitor is not None:
+        drift_monitor.observe(features, [pred["no_show_probability"] for pred in predictions])
+
+def _predict_encoded(
+    patient_ids: List[str],
+    appointment_ids: List[str],
+    encoded,
+    explain: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Score an encoded batch, record it for drift and cache the scores. With
+    `explain`, rows without a cached explanation of identical inputs are
+    explained together in one pass.
+    """
+    preds = no_show_model.predict_features(encoded)
+    _observe(encoded, preds)
+    if explain:
+        factors = [
+            prediction_cache.risk_factors(patient_id, appointment_id, row)
+            for patient_id, appointment_id, row in zip(patient_ids, appointment_ids, encoded)
+        ]
+        missing = [i for i, value in enumerate(factors) if value is None]
+        if missing:
+            for i, value in zip(missing, no_show_model.explain_features(encoded[missing])):
+                factors[i] = value
+        for pred, value in zip(preds, factors):
+            pred["risk_factors"] = value
+    for patient_id, appointment_id, row, pred in zip(patient_ids, appointment_ids, encoded, preds):
+        prediction_cache.put(patient_id, appointment_id, pred["no_show_probability"], row, pred.get("risk_factors"))
+    return preds
+
+def _score_rest(request: PredictionRequest) -> Dict[str, Any]:
+    features = request.features
+    if feature_store is not None:
+        features = feature_store.fill(request.patient_id, features, request.start_time)
+    encoded = no_show_model.preprocess_data(features)
+    return _predict_encoded([request.patient_id], [request.appointment_id or ""], encoded, request.explain)[0]
 
 # ---- REST API endpoints ----
 @app.post("/predict/no-show")
 async def predict_no_show(
     request: PredictionRequest,
-    bg_tasks: BackgroundTasks
+    bg_tasks: BackgroundTasks,
+    x_request_timeout_ms: Optional[str] = Header(None)
 ):
     """
-    Receive JSON { patient_id, features } and return
-    { patient_id, probability, risk_level, confidence }.
+    Receive JSON { patient_id, appointment_id, features, explain } and return
+    { patient_id, probability, risk_level, confidence, degraded }, plus
+    risk_factors when explain is set.
+    X-Request-Timeout-Ms bounds how long the caller will wait.
     """
     try:
-        result = no_show_model.predict(request.features)
-        # enqueue the analytics report
-        bg_tasks.add_task(
-            report_to_analytics,
-            request.patient_id,
-            result["no_show_probability"],
-            result["risk_level"],
+        deadline = deadline_after(parse_timeout_ms(x_request_timeout_ms, REQUEST_TIMEOUT_MS))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # shed on the event loop before taking a worker thread
+        admission.check_capacity()
+        result = await run_in_threadpool(admission.run, deadline, _score_rest, request)
+    except Rejected as e:
+        if fallback_scorer is None:
+            if isinstance(e, Overloaded):
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+            raise HTTPException(status_code=504, detail=str(e))
+        probability, source, risk_factors = fallback_scorer.score(
+            request.patient_id, request.appointment_id or "", request.features
         )
-        return {
+        response = {
             "patient_id": request.patient_id,
-            "probability": result["no_show_probability"],
-            "risk_level": result["risk_level"],
-            "confidence": 0.85,  # or pull from result if available
+            "probability": probability,
+            "risk_level": _risk_level(probability),
+            "confidence": DEGRADED_CONFIDENCE[source],
+            "degraded": True,
         }
+        if request.explain:
+            response["risk_factors"] = risk_factors or {}
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
+
+    # enqueue the analytics report (fallback scores are not reported)
+    bg_tasks.add_task(report_to_analytics, [request.appointment_id], [result])
+    response = {
+        "patient_id": request.patient_id,
+        "probability": result["no_show_probability"],
+        "risk_level": result["risk_level"],
+        "confidence": 0.85,  # or pull from result if available
+        "degraded": False,
+    }
+    if request.explain:
+        response["risk_factors"] = result["risk_factors"]
+    return response
+
+@app.post("/features/appointment-events")
+def record_appointment_events(events: List[AppointmentEvent]):
+    """Apply appointment status changes to the feature store"""
+    if feature_store is None:
+        raise HTTPException(status_code=503, detail="Feature store is not configured")
+    return {"applied": feature_store.apply_events([event.dict() for event in events])}
+
+@app.get("/admission")
+def admission_stats():
+    """Inference slots, queue depth, smoothed inference time and shed counts"""
+    stats = {"admission": admission.stats(), "prediction_cache": prediction_cache.stats()}
+    if fallback_scorer is not None:
+        stats["fallback"] = fallback_scorer.stats()
+    return stats
+
+@app.on_event("startup")
+def start_drift_reporter():
+    # here rather than under __main__, so it also runs under `uvicorn src.main:app`
+    if drift_reporter is not None:
+        drift_reporter.start()
+
+@app.on_event("shutdown")
+def flush_drift_sketches():
+    if drift_reporter is not None:
+        drift_reporter.stop()
+
+@app.get("/drift/sketches")
+def drift_sketches():
+    """This replica's windowed input/score sketches (also pushed to analytics)"""
+    if drift_monitor is None:
+        raise HTTPException(status_code=503, detail="Drift monitoring is disabled")
+    return {"model": no_show_model.model_name, "windows": drift_monitor.export()}
+
 @app.get("/health")
 def health():
     # Check if the model is loaded
@@ -89,33 +272,188 @@ def health():
     }
 
 # ---- gRPC Servicer (optional) ----
+def _grpc_deadline(context) -> Optional[float]:
+    """The caller's deadline, or REQUEST_TIMEOUT_MS from now if it set none"""
+    remaining = context.time_remaining()
+    if remaining is None:
+        remaining = parse_timeout_ms(None, REQUEST_TIMEOUT_MS)
+    return deadline_after(remaining)
+
+def _reject_grpc(context, error: Rejected):
+    if isinstance(error, Overloaded):
+        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+    else:
+        context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+    context.set_details(str(error))
+
+def _fallback_prediction(patient_id: str, appointment_id: str, data, explain: bool) -> ml_service_pb2.NoShowPrediction:
+    probability, source, risk_factors = fallback_scorer.score(patient_id, appointment_id, data)
+    return ml_service_pb2.NoShowPrediction(
+        patient_id=patient_id,
+        appointment_id=appointment_id,
+        probability=probability,
+        risk_level=_risk_enum(_risk_level(probability)),
+        confidence=DEGRADED_CONFIDENCE[source],
+        risk_factors=(risk_factors or {}) if explain else {},
+        degraded=True,
+    )
+
+def _packed_rows(features) -> List[Dict[str, float]]:
+    """Encoded rows back to {column: value}, for the fallback heuristic"""
+    return [dict(zip(NO_SHOW_ENCODER.columns, row.tolist())) for row in features]
+
+
 class MLServiceServicer(ml_service_pb2_grpc.MLServiceServicer):
     def PredictNoShow(self, request, context):
         try:
-            # Use the same in-memory model for gRPC clients
-            pred = no_show_model.predict(request.features)
-            # Map your risk_level string to the protobuf enum
-            risk_enum = ml_service_pb2.RiskLevel.RISK_LEVEL_LOW
-            if pred["risk_level"] == "Medium":
-                risk_enum = ml_service_pb2.RiskLevel.RISK_LEVEL_MEDIUM
-            elif pred["risk_level"] == "High":
-                risk_enum = ml_service_pb2.RiskLevel.RISK_LEVEL_HIGH
+            # Packed features are viewed in place; the map form is the fallback
+            if request.HasField("packed_features"):
+                features = NO_SHOW_ENCODER.decode_packed(request.packed_features)
+                if features.shape[0] != 1:
+                    raise ValueError(f"PredictNoShow takes one row, got {features.shape[0]}")
+                data = None
+            else:
+                data = request.additional_data
+                features = None
+
+            def score():
+                encoded = features
+                if encoded is None:
+                    filled = data
+                    if feature_store is not None:
+                        filled = feature_store.fill(request.patient_id, data, request.start_time or None)
+                    encoded = NO_SHOW_ENCODER.encode(filled)
+                elif feature_store is not None:
+                    # packed rows mark history features left to the store as NaN
+                    encoded = feature_store.fill_batch(
+                        [request.patient_id], encoded, NO_SHOW_ENCODER.columns, [request.start_time or None]
+                    )
+                # Use the same in-memory model for gRPC clients
+                return _predict_encoded([request.patient_id], [request.appointment_id], encoded, request.explain)[0]
+
+            try:
+                pred = admission.run(_grpc_deadline(context), score)
+            except Rejected as e:
+                if fallback_scorer is None:
+                    _reject_grpc(context, e)
+                    return ml_service_pb2.NoShowPrediction()
+                fallback_data = data if data is not None else _packed_rows(features)[0]
+                return _fallback_prediction(request.patient_id, request.appointment_id, fallback_data, request.explain)
+            report_executor.submit(report_to_analytics, [request.appointment_id], [pred])
 
             return ml_service_pb2.NoShowPrediction(
                 patient_id=request.patient_id,
+                appointment_id=request.appointment_id,
                 probability=float(pred["no_show_probability"]),
-                risk_level=risk_enum,
+                risk_level=_risk_enum(pred["risk_level"]),
                 confidence=0.85,
+                risk_factors=pred.get("risk_factors") or {},
             )
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return ml_service_pb2.NoShowPrediction()
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
             return ml_service_pb2.NoShowPrediction()
 
+    def PredictNoShowBatch(self, request, context):
+        try:
+            features = NO_SHOW_ENCODER.decode_packed(request.features)
+            if len(request.patient_ids) != features.shape[0]:
+                raise ValueError(
+                    f"Got {len(request.patient_ids)} patient ids for {features.shape[0]} feature rows"
+                )
+            appointment_ids = list(request.appointment_ids) or [""] * features.shape[0]
+
+            def score():
+                encoded = features
+                if feature_store is not None:
+                    encoded = feature_store.fill_batch(request.patient_ids, encoded, NO_SHOW_ENCODER.columns)
+                return _predict_encoded(list(request.patient_ids), appointment_ids, encoded, request.explain)
+
+            try:
+                preds = admission.run(_grpc_deadline(context), score)
+            except Rejected as e:
+                if fallback_scorer is None:
+                    _reject_grpc(context, e)
+                    return ml_service_pb2.PredictNoShowBatchResponse()
+                return ml_service_pb2.PredictNoShowBatchResponse(predictions=[
+                    _fallback_prediction(patient_id, appointment_id, row, request.explain)
+                    for patient_id, appointment_id, row in zip(
+                        request.patient_ids, appointment_ids, _packed_rows(features)
+                    )
+                ])
+            report_executor.submit(report_to_analytics, appointment_ids, preds)
+
+            return ml_service_pb2.PredictNoShowBatchResponse(predictions=[
+                ml_service_pb2.NoShowPrediction(
+                    patient_id=patient_id,
+                    appointment_id=appointment_id,
+                    probability=float(pred["no_show_probability"]),
+                    risk_level=_risk_enum(pred["risk_level"]),
+                    confidence=0.85,
+                    risk_factors=pred.get("risk_factors") or {},
+                )
+                for patient_id, appointment_id, pred in zip(request.patient_ids, appointment_ids, preds)
+            ])
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return ml_service_pb2.PredictNoShowBatchResponse()
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return ml_service_pb2.PredictNoShowBatchResponse()
+
+    def RecordAppointmentEvents(self, request, context):
+        try:
+            if feature_store is None:
+                context.set_code(grpc.StatusCode.FAILED_PRECONDITION)
+                context.set_details("Feature store is not configured")
+                return ml_service_pb2.RecordAppointmentEventsResponse()
+
+            status_names = ml_service_pb2.AppointmentStatusEvent.DESCRIPTOR.fields_by_name["status"].enum_type
+            applied = feature_store.apply_events([
+                {
+                    "patient_id": event.patient_id,
+                    "appointment_id": event.appointment_id,
+                    "status": status_names.values_by_number[event.status].name,
+                    "start_time": event.start_time,
+                }
+                for event in request.events
+            ])
+            return ml_service_pb2.RecordAppointmentEventsResponse(applied=applied)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return ml_service_pb2.RecordAppointmentEventsResponse()
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return ml_service_pb2.RecordAppointmentEventsResponse()
+
+
+def _risk_enum(risk_level: str) -> int:
+    """Map the model's risk_level string to the protobuf enum"""
+    if risk_level == "Medium":
+        return ml_service_pb2.RiskLevel.RISK_LEVEL_MEDIUM
+    elif risk_level == "High":
+        return ml_service_pb2.RiskLevel.RISK_LEVEL_HIGH
+    return ml_service_pb2.RiskLevel.RISK_LEVEL_LOW
+
 
 def serve_grpc():
     grpc_port = int(os.getenv("GRPC_PORT", "50051"))
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # enough handler threads for every admitted and queued request, so that
+    # waiting happens in the admission queue, where deadlines are honoured;
+    # calls beyond that fail fast with RESOURCE_EXHAUSTED
+    workers = max(10, admission.max_concurrency + admission.max_queue)
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers),
+        maximum_concurrent_rpcs=workers + int(os.getenv("GRPC_EXTRA_CONCURRENT_RPCS", "8"))
+    )
     ml_service_pb2_grpc.add_MLServiceServicer_to_server(MLServiceServicer(), server)
     server.add_insecure_port(f"[::]:{grpc_port}")
     server.start()
@@ -1,4 +1,5 @@
 from .base_model import BaseModel
 from .no_show_model import NoShowPredictionModel
+from .dense_engine import DenseInferenceEngine
 
-__all__ = ['BaseModel', 'NoShowPredictionModel']
+__all__ = ['BaseModel', 'NoShowPredictionModel', 'DenseInferenceEngine']
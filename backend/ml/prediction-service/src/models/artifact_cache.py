@@ -0,0 +1,316 @@
+"""
+Local cache of registered model artifacts, shared by every process on a host.
+
+Artifacts are stored under a digest of their registry URI. A registered
+version's artifacts live under its run and never change, so an entry stays
+valid for as long as it is kept:
+
+    <root>/objects/<digest>/manifest.json   uri, size and the artifact's path
+    <root>/objects/<digest>/data/...        the downloaded artifact
+    <root>/refs/<model>/<version>/<name>    last registry answer for a version
+    <root>/locks/<digest>.lock              flock()ed while an entry is in use
+
+Readers hold a shared lock on the entry while loading from it. A miss takes
+the exclusive lock and checks again, so concurrent workers download an
+artifact once. The download goes to a scratch directory that is renamed
+into place, so a crashed download never leaves a partial entry. Once the
+cache exceeds `max_bytes`, the least recently used entries that no process
+holds are deleted.
+
+The refs record what each model/version (including 'latest') last
+resolved to. When the registry cannot be reached, or with `offline` set,
+versions are resolved from the refs and served from the cache.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional
+
+import mlflow
+
+LOGGER = logging.getLogger("artifact_cache")
+
+# Scratch directories older than this are left over from crashed downloads
+_STALE_DOWNLOAD_SECONDS = 3600
+
+
+class RegisteredArtifact(NamedTuple):
+    version: str
+    run_id: str
+    uri: str
+
+
+class ArtifactCache:
+    def __init__(self, root: str, max_bytes: int = 2 << 30, offline: bool = False):
+        self.root = root
+        self.max_bytes = max_bytes
+        # never contact the registry; serve only what is cached
+        self.offline = offline
+        for directory in ("objects", "refs", "locks", "tmp"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+        self._counters_lock = threading.Lock()
+        self._counters = {"hits": 0, "downloads": 0, "evictions": 0, "offline_resolutions": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["ArtifactCache"]:
+        """None when MODEL_CACHE_DIR is set to an empty string"""
+        root = os.getenv("MODEL_CACHE_DIR", "~/.cache/healthcare/models")
+        if not root:
+            return None
+        return cls(
+            os.path.expanduser(root),
+            max_bytes=int(float(os.getenv("MODEL_CACHE_MAX_MB", "2048")) * (1 << 20)),
+            offline=os.getenv("MODEL_CACHE_OFFLINE", "false").lower() == "true"
+        )
+
+    # ---- entries ----
+
+    @staticmethod
+    def digest(uri: str) -> str:
+        return hashlib.sha256(uri.encode("utf-8")).hexdigest()
+
+    def _object_dir(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest)
+
+    def _manifest(self, digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._object_dir(digest), "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def _lock(self, name: str, mode: int) -> Iterator[bool]:
+        """flock() locks/<name>.lock; yields False if LOCK_NB was given and it is held"""
+        with open(os.path.join(self.root, "locks", f"{name}.lock"), "a") as f:
+            try:
+                fcntl.flock(f, mode)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def checkout(self, uri: str, download: Optional[Callable[[str], str]] = None) -> Iterator[str]:
+        """
+        Local path of the artifact at `uri`, valid until the block exits.
+        On a miss, download(directory) must fetch it into `directory` and
+        return its path; without `download` a miss raises LookupError.
+        """
+        digest = self.digest(uri)
+        while True:
+            with self._lock(digest, fcntl.LOCK_SH):
+                manifest = self._manifest(digest)
+                if manifest is not None:
+                    # the manifest's mtime orders entries for eviction
+                    os.utime(os.path.join(self._object_dir(digest), "manifest.json"))
+                    self._count("hits")
+                    yield os.path.join(self._object_dir(digest), manifest["entry"])
+                    return
+            if download is None:
+                raise LookupError(f"{uri} is not in the artifact cache")
+            with self._lock(digest, fcntl.LOCK_EX):
+                if self._manifest(digest) is None:
+                    self._download(digest, uri, download)
+            self.evict(keep=digest)
+            # loop to read it back under the shared lock
+
+    def _download(self, digest: str, uri: str, download: Callable[[str], str]):
+        scratch = tempfile.mkdtemp(prefix=f"{digest}.", dir=os.path.join(self.root, "tmp"))
+        try:
+            data = os.path.join(scratch, "data")
+            os.makedirs(data)
+            path = download(data)
+            manifest = {
+                "uri": uri,
+                "entry": os.path.relpath(path, scratch),
+                "size": _tree_size(data),
+                "downloaded_at": time.time(),
+            }
+            with open(os.path.join(scratch, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            os.rename(scratch, self._object_dir(digest))
+        except BaseException:
+            shutil.rmtree(scratch, ignore_errors=True)
+            raise
+        self._count("downloads")
+        LOGGER.info(f"Cached {uri} ({manifest['size']} bytes)")
+
+    def evict(self, keep: Optional[str] = None):
+        """Delete least recently used entries not in use until within max_bytes"""
+        with self._lock("evict", fcntl.LOCK_EX):
+            entries = []
+            for digest in os.listdir(os.path.join(self.root, "objects")):
+                manifest = self._manifest(digest)
+                if manifest is None:
+                    continue
+                try:
+                    used = os.path.getmtime(os.path.join(self._object_dir(digest), "manifest.json"))
+                except FileNotFoundError:
+                    continue
+                entries.append((used, digest, manifest["size"]))
+            total = sum(size for _, _, size in entries)
+            for _, digest, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if digest == keep:
+                    continue
+                with self._lock(digest, fcntl.LOCK_EX | fcntl.LOCK_NB) as acquired:
+                    if not acquired:
+                        continue
+                    # renamed first, so a half-deleted entry is never visible
+                    doomed = tempfile.mkdtemp(prefix=f"{digest}.evicted.", dir=os.path.join(self.root, "tmp"))
+                    os.rename(self._object_dir(digest), os.path.join(doomed, "entry"))
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+                self._count("evictions")
+            self._remove_stale_downloads()
+
+    def _remove_stale_downloads(self):
+        tmp = os.path.join(self.root, "tmp")
+        for name in os.listdir(tmp):
+            path = os.path.join(tmp, name)
+            try:
+                if time.time() - os.path.getmtime(path) > _STALE_DOWNLOAD_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+    # ---- refs ----
+
+    def _ref_path(self, model_name: str, version: str, name: str) -> str:
+        parts = [urllib.parse.quote(part, safe="") for part in (model_name, version, name)]
+        return os.path.join(self.root, "refs", *parts) + ".json"
+
+    def record(self, model_name: str, version: str, name: str, artifact: RegisteredArtifact):
+        """Remember what `version` resolved to, for offline use"""
+        path = self._ref_path(model_name, version, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, scratch = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            json.dump(artifact._asdict(), f)
+        os.replace(scratch, path)
+
+    def lookup(self, model_name: str, version: str, name: str) -> Optional[RegisteredArtifact]:
+        try:
+            with open(self._ref_path(model_name, version, name)) as f:
+                return RegisteredArtifact(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    # ---- stats ----
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock("evict", fcntl.LOCK_SH):
+            sizes = [
+                manifest["size"]
+                for manifest in map(self._manifest, os.listdir(os.path.join(self.root, "objects")))
+                if manifest is not None
+            ]
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            "root": self.root,
+            "entries": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+            "offline": self.offline,
+            **counters,
+        }
+
+
+def _tree_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def locate(client: Any, model_name: str, version: str, artifact_path: Optional[str] = None) -> RegisteredArtifact:
+    """
+    Ask the registry where a version's model (artifact_path None) or one of
+    its run's artifacts is stored ('latest' allowed).
+    """
+    if version == "latest":
+        versions = client.get_latest_versions(model_name)
+        if not versions:
+            raise LookupError(f"No registered versions of '{model_name}'")
+        model_version = max(versions, key=lambda v: int(v.version))
+    else:
+        model_version = client.get_model_version(model_name, version)
+    uri = model_version.source if artifact_path is None else f"runs:/{model_version.run_id}/{artifact_path}"
+    return RegisteredArtifact(str(model_version.version), model_version.run_id, uri)
+
+
+def resolve(
+    client: Any,
+    cache: Optional[ArtifactCache],
+    model_name: str,
+    version: str,
+    artifact_path: Optional[str] = None
+) -> RegisteredArtifact:
+    """locate(), falling back to the cache's refs when offline or the registry fails"""
+    name = artifact_path or "model"
+    if cache is None:
+        return locate(client, model_name, version, artifact_path)
+    if not cache.offline:
+        try:
+            artifact = locate(client, model_name, version, artifact_path)
+        except Exception as e:
+            artifact = cache.lookup(model_name, version, name)
+            if artifact is None:
+                raise
+            LOGGER.warning(
+                f"Registry unavailable ({e}); serving cached {model_name} version {artifact.version}"
+            )
+            cache._count("offline_resolutions")
+            return artifact
+        cache.record(model_name, version, name, artifact)
+        if artifact.version != version:
+            cache.record(model_name, artifact.version, name, artifact)
+        return artifact
+    artifact = cache.lookup(model_name, version, name)
+    if artifact is None:
+        raise LookupError(f"{model_name} version {version} ({name}) is not in the artifact cache")
+    cache._count("offline_resolutions")
+    return artifact
+
+
+@contextlib.contextmanager
+def registered_artifact(
+    client: Any,
+    cache: Optional[ArtifactCache],
+    model_name: str,
+    version: str,
+    artifact_path: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Local path of a registered version's model (artifact_path None) or run
+    artifact, through the cache when there is one.
+    """
+    artifact = resolve(client, cache, model_name, version, artifact_path)
+    if cache is None:
+        yield mlflow.artifacts.download_artifacts(artifact_uri=artifact.uri)
+        return
+
+    def download(directory: str) -> str:
+        return mlflow.artifacts.download_artifacts(artifact_uri=artifact.uri, dst_path=directory)
+
+    with cache.checkout(artifact.uri, None if cache.offline else download) as path:
+        yield path
@@ -0,0 +1,82 @@
+"""
+Recently served no-show scores, with their explanations when computed.
+
+Entries are keyed by (patient_id, appointment_id) and keep the encoded
+feature row they were computed from: a cached explanation is reused only
+for an identical row, while the overload fallback serves any fresh score
+for the appointment.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class CachedPrediction(NamedTuple):
+    probability: float
+    row: bytes
+    risk_factors: Optional[Dict[str, float]]
+    stored_at: float
+
+
+class PredictionCache:
+    def __init__(self, capacity: int = 100000, ttl: float = 3600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], CachedPrediction]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"explanation_hits": 0, "explanation_misses": 0}
+
+    @classmethod
+    def from_env(cls) -> "PredictionCache":
+        return cls(
+            capacity=int(os.getenv("PREDICTION_CACHE_CAPACITY", "100000")),
+            ttl=float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+        )
+
+    def get(self, patient_id: str, appointment_id: str) -> Optional[CachedPrediction]:
+        """The fresh entry for this appointment, if any"""
+        with self._lock:
+            entry = self._entries.get((patient_id, appointment_id))
+            if entry is None or time.monotonic() - entry.stored_at > self.ttl:
+                return None
+            self._entries.move_to_end((patient_id, appointment_id))
+            return entry
+
+    def put(
+        self,
+        patient_id: str,
+        appointment_id: str,
+        probability: float,
+        row: np.ndarray,
+        risk_factors: Optional[Dict[str, float]] = None
+    ):
+        key = (patient_id, appointment_id)
+        row_bytes = np.ascontiguousarray(row, dtype=np.float32).tobytes()
+        with self._lock:
+            previous = self._entries.get(key)
+            if risk_factors is None and previous is not None and previous.row == row_bytes:
+                # same inputs: keep the explanation computed earlier
+                risk_factors = previous.risk_factors
+            self._entries[key] = CachedPrediction(float(probability), row_bytes, risk_factors, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def risk_factors(self, patient_id: str, appointment_id: str, row: np.ndarray) -> Optional[Dict[str, float]]:
+        """Cached explanation of exactly this encoded row, if still fresh"""
+        entry = self.get(patient_id, appointment_id)
+        found = (
+            entry is not None and entry.risk_factors is not None
+            and entry.row == np.ascontiguousarray(row, dtype=np.float32).tobytes()
+        )
+        with self._lock:
+            self._counters["explanation_hits" if found else "explanation_misses"] += 1
+        return entry.risk_factors if found else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "capacity": self.capacity, **self._counters}